@@ -0,0 +1,69 @@
+"""Cold-start budget check for the dashboard landing page.
+
+Runs the app script in fresh interpreters without a Streamlit server (bare mode,
+so the uploaders return nothing and the landing page is rendered) and measures
+the time spent on top of `import streamlit` itself. Exits non-zero when the
+best of several runs exceeds the budget, or when modules that should only load
+once a file arrives (openpyxl) were imported at startup:
+
+    python benchmarks/check_startup.py --budget 0.25
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Seconds the landing page may take beyond importing Streamlit
+DEFAULT_BUDGET = 0.25
+
+# Modules the landing page must not import
+DEFERRED_MODULES = ['openpyxl']
+
+CHILD_SCRIPT = """
+import json, runpy, sys, time
+start = time.perf_counter()
+import streamlit
+imported = time.perf_counter()
+runpy.run_path({app!r})
+done = time.perf_counter()
+print(json.dumps({{'streamlit_import': imported - start, 'landing': done - imported,
+                  'deferred_loaded': [m for m in {deferred!r} if m in sys.modules]}}))
+"""
+
+
+def measure_once():
+    """Time one cold start of the landing page in a fresh interpreter"""
+    code = CHILD_SCRIPT.format(app=os.path.join(REPO_ROOT, 'streamlit_dashboard.py'), deferred=DEFERRED_MODULES)
+    result = subprocess.run([sys.executable, '-c', code], cwd=REPO_ROOT, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    """Run the check and return a process exit code"""
+    parser = argparse.ArgumentParser(description="Fail if the landing page cold start exceeds its budget")
+    parser.add_argument('--budget', type=float, default=DEFAULT_BUDGET,
+                        help=f"Seconds allowed beyond `import streamlit` (default: {DEFAULT_BUDGET})")
+    parser.add_argument('--runs', type=int, default=3, help="Fresh interpreters to time; the best run is used (default: 3)")
+    args = parser.parse_args(argv)
+
+    runs = [measure_once() for _ in range(args.runs)]
+    best = min(runs, key=lambda run: run['landing'])
+    deferred_loaded = sorted({module for run in runs for module in run['deferred_loaded']})
+    print(f"import streamlit: {best['streamlit_import']:.3f}s  landing page: {best['landing']:.3f}s  "
+          f"(budget {args.budget:.3f}s, best of {args.runs})")
+
+    failed = False
+    if best['landing'] > args.budget:
+        print(f"FAIL: landing page took {best['landing']:.3f}s, over the {args.budget:.3f}s budget")
+        failed = True
+    if deferred_loaded:
+        print(f"FAIL: imported at startup although only needed once a file arrives: {', '.join(deferred_loaded)}")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
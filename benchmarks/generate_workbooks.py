@@ -0,0 +1,146 @@
+"""Deterministic synthetic Master and Life Settlement workbooks.
+
+The Master workbook mixes every layout the loader has to handle: Format 1
+(header values in column B), Format 2 (label in B3, values in column C),
+interest-only loans (with their start dates stored as text), loans that have not
+started yet, recorded payments with occasional shortfalls, and notes. The LS
+workbook has a "Valuation Summary" sheet and a "Premium Stream" sheet with
+month headers such as "Jul-25". The same arguments always produce the same
+cell values.
+
+    python benchmarks/generate_workbooks.py --loans 100 --months 60 --policies 150 --out /tmp/bench
+"""
+import argparse
+import os
+import random
+from datetime import datetime
+
+from dateutil.relativedelta import relativedelta
+from openpyxl import Workbook
+from openpyxl.utils import get_column_letter
+
+DEFAULT_AS_OF = datetime(2025, 6, 30)
+
+# The loan parser reads amortization rows 11-99 and the LS parser valuation rows 3-199
+MAX_SCHEDULE_MONTHS = 88
+MAX_PARSED_POLICIES = 197
+
+
+def make_master_workbook(path, n_loans=20, months=36, seed=0, as_of_date=DEFAULT_AS_OF):
+    """Write a Master workbook with `n_loans` `#` sheets of `months` schedule rows each"""
+    if months > MAX_SCHEDULE_MONTHS:
+        raise ValueError(f"months must be at most {MAX_SCHEDULE_MONTHS} (the parser stops at row 99)")
+    rng = random.Random(seed)
+    wb = Workbook()
+    dashboard = wb.active
+    dashboard.title = 'Dashboard'
+    dashboard['E3'] = as_of_date
+
+    for i in range(n_loans):
+        sheet = wb.create_sheet(f'#{i + 1}')
+        format_2 = i % 2 == 1
+        interest_only = i % 5 == 0
+        amount = rng.randint(50, 2000) * 1000.0
+        rate = rng.choice([0.06, 0.08, 0.10, 0.12])
+        if i % 10 == 9:
+            # Starts after the as-of date (and after today), so the loan shows as Not Started
+            start = as_of_date + relativedelta(years=5, months=i % 12)
+        else:
+            start = as_of_date - relativedelta(months=rng.randint(1, months + 12))
+        monthly_rate = rate / 12
+        payment = amount * monthly_rate if interest_only else amount * monthly_rate / (1 - (1 + monthly_rate) ** -months)
+
+        sheet['A2'] = f'Borrower {i}'
+        column = 'C' if format_2 else 'B'
+        if format_2:
+            sheet['B3'] = 'Loan Principle Amount'
+        sheet[f'{column}3'] = amount
+        sheet[f'{column}4'] = rate
+        sheet[f'{column}5'] = months
+        sheet[f'{column}6'] = 'Interest Only' if interest_only else payment
+        # Interest-only loans keep their start date as text
+        sheet[f'{column}7'] = start.strftime('%Y-%m-%d') if interest_only else start
+
+        sheet['A10'] = 'Month'
+        sheet['C10'] = 'Opening Balance'
+        balance = amount
+        for m in range(months):
+            row = 11 + m
+            month = start + relativedelta(months=m + 1)
+            interest = balance * monthly_rate
+            capital = (balance if m == months - 1 else 0.0) if interest_only else payment - interest
+            closing = balance - capital
+            sheet[f'A{row}'] = month
+            sheet[f'B{row}'] = m + 1
+            sheet[f'C{row}'] = balance
+            sheet[f'D{row}'] = interest + capital
+            sheet[f'E{row}'] = interest
+            sheet[f'F{row}'] = capital
+            sheet[f'G{row}'] = closing
+            if month <= as_of_date:
+                sheet[f'J{row}'] = month + relativedelta(days=rng.randint(0, 10))
+                sheet[f'K{row}'] = (interest + capital) * (0.5 if rng.random() < 0.05 else 1.0)
+                if rng.random() < 0.02:
+                    sheet[f'L{row}'] = 'Paid late'
+            balance = closing
+
+    wb.save(path)
+    return path
+
+
+def make_ls_workbook(path, n_policies=50, premium_months=12, seed=0, first_month=datetime(2025, 7, 1)):
+    """Write an LS workbook with `n_policies` policies and `premium_months` Premium Stream columns
+
+    The LS parser reads at most MAX_PARSED_POLICIES policies and 12 premium months (columns M-X).
+    """
+    rng = random.Random(seed)
+    wb = Workbook()
+    valuation = wb.active
+    valuation.title = 'Valuation Summary'
+    premiums = wb.create_sheet('Premium Stream')
+
+    month_columns = [get_column_letter(13 + j) for j in range(premium_months)]
+    for j, column in enumerate(month_columns):
+        premiums[f'{column}2'] = (first_month + relativedelta(months=j)).strftime('%b-%y')
+
+    for k in range(n_policies):
+        row = 3 + k
+        policy_id = f'P{k:05d}'
+        ndb = rng.randint(5, 100) * 10000.0
+        valuation[f'B{row}'] = policy_id
+        valuation[f'C{row}'] = f'I{k:05d}'
+        valuation[f'D{row}'] = f'Insured {k}'
+        valuation[f'F{row}'] = rng.randint(70, 92)
+        valuation[f'G{row}'] = rng.choice(['Male', 'Female'])
+        valuation[f'V{row}'] = ndb
+        valuation[f'Z{row}'] = ndb * rng.uniform(0.2, 0.5)
+        valuation[f'AB{row}'] = ndb * rng.uniform(0.15, 0.45)
+        valuation[f'AC{row}'] = rng.randint(24, 160)
+
+        premiums[f'B{row}'] = policy_id
+        monthly_premium = ndb * rng.uniform(0.002, 0.006)
+        for column in month_columns:
+            premiums[f'{column}{row}'] = monthly_premium
+
+    wb.save(path)
+    return path
+
+
+def main(argv=None):
+    """Generate one Master and one LS workbook into a folder"""
+    parser = argparse.ArgumentParser(description="Generate synthetic Master and LS workbooks")
+    parser.add_argument('--loans', type=int, default=20, help="Number of # loan sheets (default: 20)")
+    parser.add_argument('--months', type=int, default=36, help="Schedule months per loan (default: 36)")
+    parser.add_argument('--policies', type=int, default=50, help="Number of LS policies (default: 50)")
+    parser.add_argument('--premium-months', type=int, default=12, help="Premium Stream months (default: 12)")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed (default: 0)")
+    parser.add_argument('--out', default='.', help="Output folder (default: current folder)")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.out, exist_ok=True)
+    print(make_master_workbook(os.path.join(args.out, 'master.xlsx'), args.loans, args.months, args.seed))
+    print(make_ls_workbook(os.path.join(args.out, 'ls.xlsx'), args.policies, args.premium_months, args.seed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,248 @@
+"""Rerun latency load test with simulated concurrent dashboard sessions.
+
+Starts N AppTest sessions of streamlit_dashboard.py at the same moment, each
+with both synthetic workbooks uploaded (see generate_workbooks.py). Every
+session then plays the same script of common interactions: sort clicks, policy
+filter changes and cashflow view toggles. The test reports p50/p95/max rerun
+latency overall and per interaction, plus peak memory. Everything runs
+offline, with no server or browser:
+
+    python benchmarks/load_test.py --sessions 4 --rounds 2 --tier small
+
+AppTest installs a process-wide mock runtime for every run, so two sessions
+cannot rerun at the same moment in one process. By default each session
+therefore gets its own process. They compete for the same CPUs as server
+sessions would, but they do not share st.cache_resource, the DatasetCache or
+the st.cache_data sections, so the numbers are an upper bound for a warm server.
+
+With --in-process all sessions live in this process and take turns, one rerun
+each per interaction. They share those caches as server sessions do, so later
+sessions show the warm-cache latencies. Reruns never overlap, though, so
+neither mode covers lock contention on the DatasetCache or st.cache_resource
+between sessions rerunning at once.
+
+The sort buttons call st.rerun(), which AppTest 1.28 cannot follow after a
+click. A sort click is therefore simulated by setting the sort state the button
+would store and rerunning. The policy filters live in session state without
+widgets on the page, so filter changes are applied the same way. The cashflow
+view and row toggles use the real widgets.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from generate_workbooks import make_master_workbook, make_ls_workbook  # noqa: E402
+from run_benchmarks import TIERS, RENDER_SCRIPT  # noqa: E402
+
+
+def sort_by(column, ascending):
+    """Simulated click on a Policy Details sort button"""
+    def action(at):
+        at.session_state['policy_sort'] = {'column': column, 'ascending': ascending}
+        return at.run()
+    return action
+
+
+def set_filter(name, value):
+    """Change one Policy Details filter"""
+    def action(at):
+        at.session_state['policy_filters'] = dict(at.session_state['policy_filters'], **{name: value})
+        return at.run()
+    return action
+
+
+def choose(key, value):
+    """Pick a radio option"""
+    def action(at):
+        return at.radio(key=key).set_value(value).run()
+    return action
+
+
+def toggle(key, value):
+    """Tick or untick a checkbox"""
+    def action(at):
+        return at.checkbox(key=key).check().run() if value else at.checkbox(key=key).uncheck().run()
+    return action
+
+
+# One round of interactions per session, in order
+SCENARIO = [
+    ('sort Valuation ⬇️', sort_by('Valuation', False)),
+    ('filter gender', set_filter('gender', 'Male')),
+    ('filter gains only', set_filter('gain_loss', 'Gains Only')),
+    ('cashflow Both Views', choose('cashflow_view', 'Both Views')),
+    ('sort Age ⬆️', sort_by('Age', True)),
+    ('show all rows', toggle('show_all_rows', True)),
+    ('cashflow Historical', choose('cashflow_view', 'Historical (Past 3 Months)')),
+    ('search policies', set_filter('search_term', 'insured 1')),
+    ('clear filters', set_filter('gender', 'All')),
+    ('cashflow Forward', choose('cashflow_view', 'Forward-Looking (Next 12 Months)')),
+    ('show first rows', toggle('show_all_rows', False)),
+]
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process so far, in MB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def session_steps(rounds):
+    """The initial load, then the scenario `rounds` times, as (interaction, action) pairs"""
+    return [('initial load', lambda at: at.run())] + SCENARIO * rounds
+
+
+def timed_step(at, name, action, timings):
+    """Run one interaction, append its (interaction, seconds) to `timings` and return the AppTest"""
+    start = time.perf_counter()
+    at = action(at)
+    timings.append((name, time.perf_counter() - start))
+    if at.exception:
+        raise RuntimeError(f"{name}: dashboard raised {at.exception[0].message}")
+    return at
+
+
+def run_session(script, rounds, timeout, start_barrier):
+    """Open one session, play the scenario `rounds` times and return (interaction, seconds) pairs"""
+    from streamlit.testing.v1 import AppTest
+    at = AppTest.from_string(script, default_timeout=timeout)
+    timings = []
+    start_barrier.wait()
+    for name, action in session_steps(rounds):
+        at = timed_step(at, name, action, timings)
+    return timings
+
+
+def run_in_process(script, sessions, rounds, timeout):
+    """Open `sessions` sessions in this process and play the scenario with each taking a turn per interaction
+
+    Returns one result per session, as session_process puts them; the peak memory is this process's.
+    """
+    from streamlit.testing.v1 import AppTest
+    apps = [AppTest.from_string(script, default_timeout=timeout) for _ in range(sessions)]
+    timings = [[] for _ in apps]
+    try:
+        for name, action in session_steps(rounds):
+            for index, at in enumerate(apps):
+                apps[index] = timed_step(at, name, action, timings[index])
+    except Exception as e:
+        return [{'error': f'{type(e).__name__}: {str(e)}'}]
+    return [{'timings': session_timings, 'peak_rss_mb': peak_rss_mb()} for session_timings in timings]
+
+
+def session_process(script, rounds, timeout, start_barrier, results):
+    """Process entry point: run one session and put its timings (or error) and peak memory on `results`"""
+    try:
+        results.put({'timings': run_session(script, rounds, timeout, start_barrier), 'peak_rss_mb': peak_rss_mb()})
+    except Exception as e:
+        results.put({'error': f'{type(e).__name__}: {str(e)}'})
+    results.close()
+    results.join_thread()
+    # A failed rerun can leave AppTest's script thread behind, which would keep the process alive
+    os._exit(0)
+
+
+def percentiles(seconds):
+    """p50/p95/max in milliseconds"""
+    ms = np.asarray(seconds) * 1000
+    return {'count': len(ms), 'p50_ms': round(float(np.percentile(ms, 50)), 1),
+            'p95_ms': round(float(np.percentile(ms, 95)), 1), 'max_ms': round(float(ms.max()), 1)}
+
+
+def main(argv=None):
+    """Run the load test and return a process exit code"""
+    parser = argparse.ArgumentParser(description="Concurrent-session rerun latency test (offline, AppTest)")
+    parser.add_argument('--sessions', type=int, default=4, help="Concurrent simulated sessions (default: 4)")
+    parser.add_argument('--rounds', type=int, default=1, help="Times each session plays the scenario (default: 1)")
+    parser.add_argument('--tier', choices=list(TIERS), default='small', help="Workbook size tier (default: small)")
+    parser.add_argument('--timeout', type=float, default=600, help="Seconds allowed per rerun (default: 600)")
+    parser.add_argument('--in-process', action='store_true',
+                        help="Run every session in this process, taking turns, so they share the caches")
+    parser.add_argument('--output', help="Write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        # Snapshots and the rerun metrics log stay inside the scratch folder
+        os.environ['SIROCCO_SNAPSHOT_DIR'] = os.path.join(work_dir, 'snapshots')
+        os.environ['SIROCCO_METRICS_LOG'] = os.path.join(work_dir, 'rerun_metrics.jsonl')
+        params = TIERS[args.tier]
+        master_path = make_master_workbook(os.path.join(work_dir, 'master.xlsx'), params['loans'], params['months'])
+        ls_path = make_ls_workbook(os.path.join(work_dir, 'ls.xlsx'), params['policies'], params['premium_months'])
+        script = RENDER_SCRIPT.format(master=master_path, ls=ls_path,
+                                      app=os.path.join(REPO_ROOT, 'streamlit_dashboard.py'))
+
+        if args.in_process:
+            started = time.perf_counter()
+            sessions = run_in_process(script, args.sessions, args.rounds, args.timeout)
+            wall = time.perf_counter() - started
+        else:
+            context = multiprocessing.get_context('spawn')
+            start_barrier = context.Barrier(args.sessions + 1)
+            results = context.Queue()
+            processes = [context.Process(target=session_process,
+                                         args=(script, args.rounds, args.timeout, start_barrier, results))
+                         for _ in range(args.sessions)]
+            for process in processes:
+                process.start()
+            start_barrier.wait()
+            started = time.perf_counter()
+            sessions = [results.get() for _ in processes]
+            wall = time.perf_counter() - started
+            for process in processes:
+                process.join()
+
+    errors = [session['error'] for session in sessions if 'error' in session]
+    if errors:
+        for error in errors:
+            print(f"error: {error}", file=sys.stderr)
+        return 1
+
+    timings = [timing for session in sessions for timing in session['timings']]
+    by_interaction = {}
+    for name, seconds in timings:
+        by_interaction.setdefault(name, []).append(seconds)
+    peak_rss = [session['peak_rss_mb'] for session in sessions]
+    results = {
+        'sessions': args.sessions,
+        'rounds': args.rounds,
+        'tier': args.tier,
+        'mode': 'in-process' if args.in_process else 'process per session',
+        'wall_s': round(wall, 2),
+        'session_peak_rss_mb': round(max(peak_rss), 1),
+        # In-process sessions share one process, whose peak is already the total
+        'total_peak_rss_mb': round(max(peak_rss) if args.in_process else sum(peak_rss), 1),
+        'reruns': percentiles([seconds for _, seconds in timings]),
+        'interactions': {name: percentiles(seconds) for name, seconds in by_interaction.items()},
+    }
+
+    print(f"{args.sessions} sessions x {args.rounds} round(s), tier {args.tier}, {results['mode']}: "
+          f"{results['reruns']['count']} reruns in {wall:.1f}s")
+    for name, stats in [('all reruns', results['reruns'])] + list(results['interactions'].items()):
+        print(f"  {name:<22} p50 {stats['p50_ms']:>8.1f} ms   p95 {stats['p95_ms']:>8.1f} ms   "
+              f"max {stats['max_ms']:>8.1f} ms")
+    if args.in_process:
+        print(f"  peak RSS {results['total_peak_rss_mb']:.0f} MB for all sessions in one process")
+    else:
+        print(f"  peak RSS {results['session_peak_rss_mb']:.0f} MB per session, "
+              f"{results['total_peak_rss_mb']:.0f} MB across all sessions")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,219 @@
+"""Benchmark suite for the loaders and analytics.
+
+Generates synthetic workbooks for each size tier (see generate_workbooks.py),
+times every stage of a dashboard load and writes the results to JSON so runs can
+be compared across commits:
+
+    python benchmarks/run_benchmarks.py --tiers small medium --output before.json
+    python benchmarks/run_benchmarks.py --tiers small medium --compare before.json
+
+Stages, each reported as the best of --repeat runs:
+  load          openpyxl read-only load_workbook of the Master file
+  header_scan   read every `#` sheet once and parse its header block (the summary preview)
+  extract       parse_loan_sheet over the blocks the header scan read
+  master_total  process_master_workbook end to end (load + extract + frames)
+  cashflow      loan_cashflows over all loans
+  ls_parse      parse_life_settlement_workbook
+  policy_filter the Policy Details filters and sort on every policy
+  render        a full dashboard script run with both files uploaded (AppTest)
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from generate_workbooks import make_master_workbook, make_ls_workbook  # noqa: E402
+
+TIERS = {
+    'small': {'loans': 20, 'months': 36, 'policies': 50, 'premium_months': 12},
+    'medium': {'loans': 100, 'months': 60, 'policies': 150, 'premium_months': 12},
+    'large': {'loans': 400, 'months': 84, 'policies': 197, 'premium_months': 12},
+}
+
+# Ratio against the baseline above which --compare reports a regression
+DEFAULT_THRESHOLD = 1.25
+
+RENDER_SCRIPT = """
+import io, os, runpy
+import streamlit as st
+
+_files = {{'Master': {master!r}, 'LS Portfolio': {ls!r}}}
+
+def _uploader(label, *args, **kwargs):
+    for key, path in _files.items():
+        if key in label:
+            with open(path, 'rb') as f:
+                upload = io.BytesIO(f.read())
+            upload.name = os.path.basename(path)
+            return upload
+    return None
+
+st.file_uploader = _uploader
+runpy.run_path({app!r}, run_name='__main__')
+"""
+
+
+def best_of(repeat, func):
+    """Run `func` `repeat` times and return (best seconds, last result)"""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def filter_policies(policies_df):
+    """The Policy Details filters (every one active) and sort, as the dashboard applies them"""
+    df = policies_df.copy()
+    df['Unrealized_Gain_Loss'] = df['Valuation'] - df['Cost_Basis']
+    df = df[df['Name'].str.contains('insured', case=False, na=False) |
+            df['Policy_ID'].str.contains('insured', case=False, na=False)]
+    df = df[(df['Age'] >= 0) & (df['Age'] <= 120)]
+    df = df[df['Gender'] == 'Male']
+    df = df[(df['NDB'] >= 0) & (df['NDB'] <= df['NDB'].max())]
+    df = df[df['Unrealized_Gain_Loss'] > 0]
+    df = df[(df['Annual_Premium'] >= 0) & (df['Annual_Premium'] <= df['Annual_Premium'].max())]
+    return df.sort_values('Valuation', ascending=False)
+
+
+def render_dashboard(master_path, ls_path):
+    """Run the whole dashboard script once with both files uploaded, from cold caches"""
+    import streamlit as st
+    from streamlit.testing.v1 import AppTest
+    st.cache_data.clear()
+    st.cache_resource.clear()
+    script = RENDER_SCRIPT.format(master=master_path, ls=ls_path,
+                                  app=os.path.join(REPO_ROOT, 'streamlit_dashboard.py'))
+    at = AppTest.from_string(script, default_timeout=600)
+    at.run()
+    if at.exception:
+        raise RuntimeError(f"dashboard raised: {at.exception[0].message}")
+    return at
+
+
+def run_tier(name, params, work_dir, repeat, render):
+    """Generate the tier's workbooks and time each stage"""
+    from openpyxl import load_workbook
+    import pandas as pd
+    from portfolio_core import (process_master_workbook, parse_loan_header, parse_loan_sheet,
+                                parse_life_settlement_workbook, split_loans_by_status, loan_cashflows,
+                                SheetBlock, LOAN_SHEET_ROWS)
+
+    master_path = make_master_workbook(os.path.join(work_dir, f'{name}_master.xlsx'),
+                                       params['loans'], params['months'])
+    ls_path = make_ls_workbook(os.path.join(work_dir, f'{name}_ls.xlsx'),
+                               params['policies'], params['premium_months'])
+
+    stages = {}
+    stages['load'], wb = best_of(repeat, lambda: load_workbook(master_path, read_only=True, data_only=True))
+    as_of_date = SheetBlock.read(wb['Dashboard'], 3, 5)['E3'].value if 'Dashboard' in wb.sheetnames else None
+    loan_sheets = [sheet_name for sheet_name in wb.sheetnames if sheet_name.startswith('#')]
+
+    def header_scan():
+        # As in the loader, each sheet is read once here and extract parses the schedules from the same blocks
+        blocks = {sheet_name: SheetBlock.read(wb[sheet_name], LOAN_SHEET_ROWS) for sheet_name in loan_sheets}
+        for sheet_name in loan_sheets:
+            parse_loan_header(blocks[sheet_name], sheet_name)
+        return blocks
+
+    stages['header_scan'], blocks = best_of(repeat, header_scan)
+    stages['extract'], _ = best_of(
+        repeat, lambda: [parse_loan_sheet(blocks[sheet_name], sheet_name, as_of_date) for sheet_name in loan_sheets])
+    wb.close()
+    stages['master_total'], master_data = best_of(repeat, lambda: process_master_workbook(master_path))
+
+    today = pd.Timestamp.now()
+    not_started = set(split_loans_by_status(master_data['loans_df'])[2]['Borrower'])
+    stages['cashflow'], _ = best_of(repeat, lambda: loan_cashflows(master_data['loan_details'], not_started, today))
+
+    stages['ls_parse'], ls_data = best_of(repeat, lambda: parse_life_settlement_workbook(ls_path))
+    policies_df = pd.DataFrame(ls_data['policies'])
+    stages['policy_filter'], _ = best_of(repeat, lambda: filter_policies(policies_df))
+
+    if render:
+        stages['render'], _ = best_of(repeat, lambda: render_dashboard(master_path, ls_path))
+
+    return {'params': params, 'stages': stages}
+
+
+def git_commit():
+    """Short hash of the checked-out commit, or None outside a git checkout"""
+    try:
+        result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT,
+                                capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.strip()
+
+
+def compare(results, baseline, threshold):
+    """Print each stage's ratio against a baseline run and return the regressed stages"""
+    regressions = []
+    for tier, tier_result in results['tiers'].items():
+        base_stages = baseline.get('tiers', {}).get(tier, {}).get('stages', {})
+        for stage, seconds in tier_result['stages'].items():
+            if not base_stages.get(stage):
+                continue
+            ratio = seconds / base_stages[stage]
+            flag = '  REGRESSION' if ratio > threshold else ''
+            print(f"{tier:<8} {stage:<14} {base_stages[stage]:>9.4f}s -> {seconds:>9.4f}s  x{ratio:.2f}{flag}")
+            if flag:
+                regressions.append(f'{tier}/{stage}')
+    return regressions
+
+
+def main(argv=None):
+    """Run the suite and return a process exit code"""
+    parser = argparse.ArgumentParser(description="Time the loaders and analytics on synthetic workbooks")
+    parser.add_argument('--tiers', nargs='+', choices=list(TIERS), default=['small', 'medium'],
+                        help="Size tiers to run (default: small medium)")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per stage; the best is kept (default: 3)")
+    parser.add_argument('--skip-render', action='store_true', help="Skip the full dashboard render stage")
+    parser.add_argument('--output', help="Write the results to this JSON file")
+    parser.add_argument('--compare', help="Baseline JSON from an earlier run to compare against")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help=f"Slowdown ratio reported as a regression (default: {DEFAULT_THRESHOLD})")
+    args = parser.parse_args(argv)
+
+    results = {
+        'commit': git_commit(),
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'repeat': args.repeat,
+        'tiers': {},
+    }
+    with tempfile.TemporaryDirectory() as work_dir:
+        # Keep the render stage's snapshots out of the real snapshot folder
+        os.environ['SIROCCO_SNAPSHOT_DIR'] = os.path.join(work_dir, 'snapshots')
+        for tier in args.tiers:
+            results['tiers'][tier] = run_tier(tier, TIERS[tier], work_dir, args.repeat, not args.skip_render)
+            timings = '  '.join(f"{stage} {seconds:.4f}s" for stage, seconds in results['tiers'][tier]['stages'].items())
+            print(f"{tier:<8} {timings}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"Regressed beyond x{args.threshold:.2f}: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
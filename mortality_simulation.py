@@ -0,0 +1,204 @@
+"""Monte Carlo mortality simulation for the life settlement portfolio.
+
+Each policy's time to death follows a Gompertz law whose base hazard is
+calibrated so the expected remaining lifetime equals the policy's
+`Remaining_LE` (months). Deaths are simulated for policies x paths at once
+and aggregated into monthly death-benefit inflows and premiums avoided.
+"""
+import numpy as np
+import pandas as pd
+
+# Gompertz mortality slope: hazard grows roughly 8.5% per year of age
+GOMPERTZ_SLOPE = 0.085 / 12
+
+# Paths simulated per chunk (bounds memory at chunk x policies floats)
+CHUNK_PATHS = 5000
+
+# Bins per month (and for the horizon totals) in the histograms the percentile bands are read from
+HISTOGRAM_BINS = 4096
+
+
+def calibrate_gompertz(remaining_le, slope=GOMPERTZ_SLOPE, max_months=1200, iterations=60):
+    """Solve each policy's Gompertz base hazard so the mean remaining lifetime equals its LE in months"""
+    remaining_le = np.asarray(remaining_le, dtype=float)
+    growth = np.expm1(slope * np.arange(max_months + 1, dtype=float))[None, :]
+
+    # Bisection on log hazard: a higher base hazard always means a shorter expected lifetime
+    lo = np.full(len(remaining_le), np.log(1e-8))
+    hi = np.full(len(remaining_le), np.log(10.0))
+    for _ in range(iterations):
+        mid = (lo + hi) / 2
+        survival = np.exp(-(np.exp(mid)[:, None] / slope) * growth)
+        # Trapezoid rule on the monthly grid
+        mean_life = survival.sum(axis=1) - (survival[:, 0] + survival[:, -1]) / 2
+        too_long = mean_life > remaining_le
+        lo = np.where(too_long, mid, lo)
+        hi = np.where(too_long, hi, mid)
+    return np.exp((lo + hi) / 2)
+
+
+def _histogram(values, widths):
+    """Counts of `values` (paths x columns) per column: exact zeros in bin 0, then HISTOGRAM_BINS bins of that
+    column's width (values past the last bin are counted in it)"""
+    # Values are never negative, so truncating the quotient floors it
+    bins = np.where(values > 0, np.minimum((values / widths[None, :]).astype(np.int64), HISTOGRAM_BINS - 1) + 1, 0)
+    bins += (np.arange(values.shape[1]) * (HISTOGRAM_BINS + 1))[None, :]
+    return np.bincount(bins.ravel(), minlength=values.shape[1] * (HISTOGRAM_BINS + 1)).reshape(values.shape[1], -1)
+
+
+def _histogram_percentiles(counts, widths, percentiles):
+    """Percentiles (linear interpolation, as np.percentile) per row of histogram counts built by _histogram"""
+    cumulative = counts.cumsum(axis=1)
+    n = cumulative[:, -1]
+    values = []
+    for p in percentiles:
+        rank = p / 100 * (n - 1)
+        # First bin whose cumulative count passes the rank, then the rank's position inside that bin
+        k = (cumulative <= rank[:, None]).sum(axis=1)
+        before = np.where(k > 0, np.take_along_axis(cumulative, np.maximum(k - 1, 0)[:, None], axis=1)[:, 0], 0)
+        count = np.take_along_axis(counts, k[:, None], axis=1)[:, 0]
+        values.append(np.where(k > 0, (k - 1 + (rank - before + 0.5) / count) * widths, 0.0))
+    return np.array(values)
+
+
+def _simulate_paths(base_hazard, slope, ndb, monthly_premium, n_paths, horizon, claim_lag, seed):
+    """Simulate one chunk of paths: (paths x months death benefits, premiums avoided, deaths)"""
+    rng = np.random.default_rng(seed)
+    n_policies = len(base_hazard)
+
+    # Inverse-transform sampling of Gompertz death times (months from the start month)
+    exponentials = rng.standard_exponential((n_paths, n_policies))
+    death_time = np.log1p((slope / base_hazard)[None, :] * exponentials) / slope
+    death_month = np.floor(death_time).astype(np.int64)
+
+    path_offset = (np.arange(n_paths) * horizon)[:, None]
+    size = n_paths * horizon
+
+    claim_month = death_month + claim_lag
+    paid = claim_month < horizon
+    death_benefits = np.bincount((path_offset + claim_month)[paid], weights=np.broadcast_to(ndb, paid.shape)[paid],
+                                 minlength=size).reshape(n_paths, horizon)
+
+    # Premiums stop from the month after death onwards
+    stop_month = death_month + 1
+    stopped = stop_month < horizon
+    premium_drop = np.bincount((path_offset + stop_month)[stopped],
+                               weights=np.broadcast_to(monthly_premium, stopped.shape)[stopped],
+                               minlength=size).reshape(n_paths, horizon)
+    deaths = np.bincount((path_offset + death_month)[death_month < horizon],
+                         minlength=size).reshape(n_paths, horizon)
+    return death_benefits, np.cumsum(premium_drop, axis=1), deaths
+
+
+def _measures(death_benefits, premiums_avoided):
+    """The paths x columns values kept as histograms: monthly measures and each path's horizon totals"""
+    return {
+        'death_benefits': death_benefits,
+        'premiums_avoided': premiums_avoided,
+        'net_inflow': death_benefits + premiums_avoided,
+        'death_benefits_total': death_benefits.sum(axis=1)[:, None],
+        'premiums_avoided_total': premiums_avoided.sum(axis=1)[:, None],
+    }
+
+
+def _reduce_paths(paths, widths):
+    """Histograms and sums of one chunk's paths; every value is additive across chunks"""
+    death_benefits, premiums_avoided, deaths = paths
+    reduced = {key: _histogram(values, widths[key]) for key, values in _measures(death_benefits, premiums_avoided).items()}
+    reduced.update({
+        'death_benefits_sum': death_benefits.sum(axis=0),
+        'premiums_avoided_sum': premiums_avoided.sum(axis=0),
+        'deaths_sum': deaths.sum(axis=0),
+    })
+    return reduced
+
+
+def _simulate_chunk(args):
+    """Simulate one chunk of paths and reduce it to histograms and sums (top level so it can run in a worker process)"""
+    *path_args, widths = args
+    return _reduce_paths(_simulate_paths(*path_args), widths)
+
+
+def simulate_ls_cashflows(policies_df, start_month, n_paths=10000, horizon=36, seed=None,
+                          claim_lag=0, workers=1, slope=GOMPERTZ_SLOPE):
+    """Simulate monthly death benefits and premiums avoided for every path, reduced to histograms and sums
+
+    `policies_df` needs `NDB`, `Remaining_LE` (months) and `Annual_Premium`. Each chunk's paths are
+    binned per month (and per path total over the horizon) as soon as it is simulated, so memory does
+    not grow with `n_paths`. The bins of each month span twice the largest value in the first chunk;
+    simulation_bands and simulation_totals read percentiles off them to within one bin. Results are
+    deterministic for a given seed regardless of how many worker processes are used.
+
+    By default every chunk runs in this process. `workers` > 1 spawns a process pool, which re-imports
+    the caller's main module, so it is only for scripts whose main module is import-safe. Under
+    `streamlit run` the main module is the app script itself, so the dashboard keeps the default.
+    """
+    book = policies_df[policies_df['Remaining_LE'] > 0]
+    ndb = book['NDB'].to_numpy(dtype=float)
+    monthly_premium = book['Annual_Premium'].to_numpy(dtype=float) / 12
+    base_hazard = calibrate_gompertz(book['Remaining_LE'].to_numpy(dtype=float), slope=slope)
+
+    chunk_sizes = [min(CHUNK_PATHS, n_paths - lo) for lo in range(0, n_paths, CHUNK_PATHS)]
+    seeds = np.random.SeedSequence(seed).spawn(len(chunk_sizes))
+    path_args = [(base_hazard, slope, ndb, monthly_premium, size, horizon, claim_lag, chunk_seed)
+                 for size, chunk_seed in zip(chunk_sizes, seeds)]
+
+    # The first chunk runs here and sets the bin widths every chunk shares
+    first_paths = _simulate_paths(*path_args[0])
+    widths = {key: np.maximum(2 * values.max(axis=0), 1.0) / HISTOGRAM_BINS
+              for key, values in _measures(*first_paths[:2]).items()}
+    simulation = _reduce_paths(first_paths, widths)
+    first_paths = None
+    tasks = [args + (widths,) for args in path_args[1:]]
+
+    def accumulate(chunks):
+        # Each chunk is added in as it arrives rather than held until all are done
+        for chunk in chunks:
+            for key, value in chunk.items():
+                simulation[key] += value
+
+    if workers > 1 and len(tasks) > 1:
+        # Imported here: the process pool machinery is only needed when asked for. Workers are spawned
+        # rather than forked, since a fork of a multithreaded process can inherit a held lock
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks)),
+                                 mp_context=multiprocessing.get_context('spawn')) as pool:
+            accumulate(pool.map(_simulate_chunk, tasks))
+    else:
+        accumulate(_simulate_chunk(task) for task in tasks)
+
+    simulation.update({
+        'months': pd.period_range(pd.Period(start_month, freq='M'), periods=horizon, freq='M'),
+        'paths': n_paths,
+        'widths': widths,
+        'scheduled_premiums': np.full(horizon, monthly_premium.sum()),
+        'policy_count': len(book),
+    })
+    return simulation
+
+
+def simulation_bands(simulation, percentiles=(5, 50, 95)):
+    """Summarize simulated death benefits, premiums avoided and net LS inflow as monthly percentile bands"""
+    means = {'death_benefits': simulation['death_benefits_sum'] / simulation['paths'],
+             'premiums_avoided': simulation['premiums_avoided_sum'] / simulation['paths']}
+    means['net_inflow'] = means['death_benefits'] + means['premiums_avoided']
+    bands = {}
+    for label, key in [('Death Benefits', 'death_benefits'), ('Premiums Avoided', 'premiums_avoided'),
+                       ('Net LS Inflow', 'net_inflow')]:
+        values = _histogram_percentiles(simulation[key], simulation['widths'][key], percentiles)
+        for p, band in zip(percentiles, values):
+            bands[f'{label} P{p}'] = band
+        bands[f'{label} Mean'] = means[key]
+    bands['Expected Deaths'] = simulation['deaths_sum'] / simulation['paths']
+    return pd.DataFrame(bands, index=simulation['months'].astype(str)).rename_axis('Month')
+
+
+def simulation_totals(simulation, percentiles=(5, 50, 95)):
+    """Percentiles of each path's death benefits and premiums avoided over the whole horizon, plus expected deaths"""
+    totals = {label: _histogram_percentiles(simulation[key], simulation['widths'][key], percentiles)[:, 0]
+              for label, key in [('Death Benefits', 'death_benefits_total'),
+                                 ('Premiums Avoided', 'premiums_avoided_total')]}
+    totals['Expected Deaths'] = simulation['deaths_sum'].sum() / simulation['paths']
+    totals['Policies'] = simulation['policy_count']
+    return totals
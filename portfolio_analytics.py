@@ -0,0 +1,895 @@
+"""Vectorized analytics over the parsed loan book.
+
+Everything in here works on plain pandas/NumPy objects so it can run without
+a Streamlit session. Schedules are handled as one concatenated frame (one row
+per amortization row of every loan) rather than loan by loan.
+"""
+import numpy as np
+import pandas as pd
+
+SCHEDULE_VALUE_COLUMNS = ['Opening Balance', 'Loan Repayment', 'Interest Charged',
+                          'Capital Repaid', 'Closing Balance', 'Amount Paid']
+
+# Dollar tolerance used when comparing schedule amounts that should tie out
+DEFAULT_TOLERANCE = 1.0
+
+# Relative tolerance for the interest check (day-count conventions differ between sheets)
+INTEREST_RELATIVE_TOLERANCE = 0.02
+
+
+def build_schedule_frame(loan_schedules):
+    """Concatenate every loan's amortization schedule into one frame keyed by Sheet and Row"""
+    schedules = [(sheet, df) for sheet, df in loan_schedules.items() if len(df) > 0]
+    if not schedules:
+        return pd.DataFrame(columns=['Sheet', 'Row', 'Month', 'Payment Date'] + SCHEDULE_VALUE_COLUMNS)
+
+    lengths = [len(df) for _, df in schedules]
+    schedule_df = pd.concat([df for _, df in schedules])
+    schedule_df.insert(0, 'Row', schedule_df.index.to_numpy())
+    schedule_df.insert(0, 'Sheet', np.repeat(np.array([sheet for sheet, _ in schedules], dtype=object), lengths))
+    schedule_df = schedule_df.reset_index(drop=True)
+    schedule_df['Month'] = pd.to_datetime(schedule_df['Month'])
+    schedule_df['Payment Date'] = pd.to_datetime(schedule_df['Payment Date'])
+    return schedule_df
+
+
+def _issue_frame(schedule_df, mask, check, expected, actual):
+    """Build the issues rows for one failed check"""
+    return pd.DataFrame({
+        'Sheet': schedule_df['Sheet'].to_numpy()[mask],
+        'Row': schedule_df['Row'].to_numpy()[mask],
+        'Check': check,
+        'Expected': np.asarray(expected, dtype=float)[mask],
+        'Actual': np.asarray(actual, dtype=float)[mask],
+    })
+
+
+def validate_schedules(schedule_df, loans_df=None, tolerance=DEFAULT_TOLERANCE):
+    """Run the integrity checks over every schedule row and return a compact issues table"""
+    issue_columns = ['Sheet', 'Row', 'Check', 'Expected', 'Actual', 'Difference']
+    issues = []
+
+    if len(schedule_df) > 0:
+        sheets = schedule_df['Sheet'].to_numpy()
+        opening = schedule_df['Opening Balance'].to_numpy(dtype=float)
+        capital = schedule_df['Capital Repaid'].to_numpy(dtype=float)
+        closing = schedule_df['Closing Balance'].to_numpy(dtype=float)
+        interest = schedule_df['Interest Charged'].to_numpy(dtype=float)
+        repayment = schedule_df['Loan Repayment'].to_numpy(dtype=float)
+        paid = schedule_df['Amount Paid'].to_numpy(dtype=float)
+        months = schedule_df['Month'].to_numpy(dtype='datetime64[ns]')
+
+        # Opening balance less capital repaid should equal the closing balance
+        expected_closing = opening - capital
+        mask = np.abs(expected_closing - closing) > tolerance
+        issues.append(_issue_frame(schedule_df, mask, 'Opening - Capital Repaid = Closing',
+                                   expected_closing, closing))
+
+        # Each row's closing balance should carry forward as the next row's opening balance
+        same_loan = np.zeros(len(sheets), dtype=bool)
+        same_loan[1:] = sheets[1:] == sheets[:-1]
+        previous_closing = np.full(len(closing), np.nan)
+        previous_closing[1:] = closing[:-1]
+        mask = same_loan & (np.abs(previous_closing - opening) > tolerance)
+        issues.append(_issue_frame(schedule_df, mask, 'Closing carries to next Opening',
+                                   previous_closing, opening))
+
+        # Interest should be roughly one month of the annual rate on the opening balance
+        if loans_df is not None and len(loans_df) > 0:
+            rate_by_sheet = loans_df.drop_duplicates('Sheet').set_index('Sheet')['Annual Interest Rate']
+            rates = schedule_df['Sheet'].map(rate_by_sheet).to_numpy(dtype=float)
+            expected_interest = opening * rates / 12
+            allowed = np.maximum(tolerance, np.abs(expected_interest) * INTEREST_RELATIVE_TOLERANCE)
+            mask = (rates > 0) & (opening > 0) & (np.abs(expected_interest - interest) > allowed)
+            issues.append(_issue_frame(schedule_df, mask, 'Interest = Opening x Rate / 12',
+                                       expected_interest, interest))
+
+        # Recorded payments should match the scheduled repayment
+        mask = (paid > 0) & (np.abs(paid - repayment) > tolerance)
+        issues.append(_issue_frame(schedule_df, mask, 'Amount Paid = Loan Repayment', repayment, paid))
+
+        # Month dates must be present and strictly increasing within a loan
+        previous_month = np.full(len(months), np.datetime64('NaT'), dtype='datetime64[ns]')
+        previous_month[1:] = months[:-1]
+        mask = np.isnat(months) | (same_loan & ~np.isnat(previous_month) & ~(months > previous_month))
+        no_amount = np.full(len(months), np.nan)
+        issues.append(_issue_frame(schedule_df, mask, 'Month dates increasing', no_amount, no_amount))
+
+    # Loan-level status checks (previously only shown under "Show debug info")
+    if loans_df is not None and len(loans_df) > 0:
+        status = loans_df['Status']
+        balance = loans_df['Current Loan Balance']
+        for check, mask in [('Active loan with zero balance', (status == 'Active') & (balance == 0)),
+                            ('Closed loan with non-zero balance', (status == 'Closed') & (balance > 0))]:
+            if mask.any():
+                issues.append(pd.DataFrame({
+                    'Sheet': loans_df.loc[mask, 'Sheet'].to_numpy(),
+                    'Row': np.nan,
+                    'Check': check,
+                    'Expected': 0.0,
+                    'Actual': balance[mask].to_numpy(dtype=float),
+                }))
+
+    issues = [frame for frame in issues if len(frame) > 0]
+    if not issues:
+        return pd.DataFrame(columns=issue_columns)
+
+    issues_df = pd.concat(issues, ignore_index=True)
+    issues_df['Row'] = issues_df['Row'].astype('Int64')
+    issues_df['Difference'] = issues_df['Actual'] - issues_df['Expected']
+    return issues_df.sort_values(['Sheet', 'Row', 'Check'], kind='stable').reset_index(drop=True)[issue_columns]
+
+
+AGING_BUCKETS = ['Current', '1-29 Days', '30-59 Days', '60-89 Days', '90+ Days']
+NO_PAYMENT_DATA = 'No Payment Data'
+
+
+def _aging_bucket(days_past_due):
+    """Map days past due onto the aging bucket labels"""
+    days = np.nan_to_num(np.asarray(days_past_due, dtype=float), nan=0.0)
+    return np.select([days <= 0, days < 30, days < 60, days < 90], AGING_BUCKETS[:4], AGING_BUCKETS[4])
+
+
+def compute_delinquency(schedule_df, as_of_date, loans_df=None, tolerance=DEFAULT_TOLERANCE):
+    """Compute days past due, cumulative shortfall and aging bucket for every loan as of a date
+
+    Payments are applied to scheduled installments oldest first, so the oldest installment
+    not covered by the total paid to date sets the days past due. Returns a per-loan frame
+    and the row-level frame (due rows only) used for drill-downs.
+    """
+    as_of = pd.Timestamp(as_of_date)
+    rows = schedule_df[['Sheet', 'Row', 'Month', 'Loan Repayment', 'Payment Date', 'Amount Paid']].copy()
+
+    months = rows['Month']
+    payment_dates = rows['Payment Date']
+    rows['Is Due'] = (months <= as_of).to_numpy()
+    rows['Scheduled Due'] = np.where(rows['Is Due'], rows['Loan Repayment'], 0.0)
+    counted_paid = (payment_dates <= as_of) | (payment_dates.isna() & rows['Is Due'])
+    rows['Paid To Date'] = np.where(counted_paid, rows['Amount Paid'], 0.0)
+    rows['Has Payment Data'] = (rows['Amount Paid'] > 0) | payment_dates.notna()
+
+    grouped = rows.groupby('Sheet', sort=False)
+    rows['Cumulative Scheduled'] = grouped['Scheduled Due'].cumsum()
+    rows['Cumulative Paid'] = grouped['Paid To Date'].cumsum()
+    total_paid = grouped['Paid To Date'].transform('sum')
+
+    # An installment is unpaid once cumulative scheduled amounts exceed everything paid so far
+    rows['Unpaid'] = rows['Is Due'] & (rows['Cumulative Scheduled'] - total_paid > tolerance)
+    rows['Days Late'] = (payment_dates - months).dt.days
+
+    loan_df = grouped.agg(**{
+        'Scheduled To Date': ('Scheduled Due', 'sum'),
+        'Paid To Date': ('Paid To Date', 'sum'),
+        'Installments Due': ('Is Due', 'sum'),
+        'Missed Installments': ('Unpaid', 'sum'),
+        'Has Payment Data': ('Has Payment Data', 'any'),
+    })
+    oldest_unpaid = rows.loc[rows['Unpaid']].groupby('Sheet', sort=False)['Month'].min()
+    loan_df['Oldest Unpaid Month'] = oldest_unpaid.reindex(loan_df.index)
+    loan_df['Shortfall'] = (loan_df['Scheduled To Date'] - loan_df['Paid To Date']).clip(lower=0)
+    loan_df['Days Past Due'] = (as_of - loan_df['Oldest Unpaid Month']).dt.days.fillna(0).astype(int)
+    loan_df['Aging Bucket'] = _aging_bucket(loan_df['Days Past Due'])
+
+    # Loans that never record payments can't be aged
+    untracked = ~loan_df['Has Payment Data']
+    loan_df.loc[untracked, ['Shortfall', 'Days Past Due']] = [0.0, 0]
+    loan_df.loc[untracked, 'Aging Bucket'] = NO_PAYMENT_DATA
+    loan_df = loan_df.reset_index()
+
+    if loans_df is not None and len(loans_df) > 0:
+        loan_columns = loans_df.drop_duplicates('Sheet')[['Sheet', 'Borrower', 'Status', 'Current Loan Balance']]
+        loan_df = loan_columns.merge(loan_df, on='Sheet', how='inner')
+
+    rows = rows.loc[rows['Is Due']].drop(columns=['Is Due', 'Has Payment Data'])
+    return loan_df, rows.reset_index(drop=True)
+
+
+def summarize_delinquency(loan_delinquency):
+    """Roll the per-loan delinquency frame up to portfolio level by aging bucket"""
+    summary = loan_delinquency.groupby('Aging Bucket').agg(
+        Loans=('Sheet', 'size'),
+        Shortfall=('Shortfall', 'sum'),
+        Balance=('Current Loan Balance', 'sum'),
+    )
+    summary = summary.reindex(AGING_BUCKETS + [NO_PAYMENT_DATA]).fillna(0)
+    summary['Loans'] = summary['Loans'].astype(int)
+    total_balance = summary['Balance'].sum()
+    summary['% of Balance'] = summary['Balance'] / total_balance * 100 if total_balance > 0 else 0.0
+    return summary.rename_axis('Aging Bucket').reset_index()
+
+
+# Band edges and labels for the exposure tables. Loan rates use the same bands as the Active Loans
+# Breakdown; a value on an edge falls in the lower band. Values that are missing go to UNKNOWN_BUCKET.
+RATE_BANDS = [0.05, 0.075, 0.10, 0.125]
+RATE_BAND_LABELS = ['< 5%', '5%-7.5%', '7.5%-10%', '10%-12.5%', '> 12.5%']
+# Whole months from the as-of date to the maturity date
+MATURITY_BANDS = [0, 12, 24, 36, 60]
+MATURITY_BAND_LABELS = ['Matured', '1-12 months', '13-24 months', '25-36 months', '37-60 months', '> 60 months']
+# Ages are banded on lower bounds (an insured aged 74.5 is in 70-74)
+AGE_BANDS = [70, 75, 80, 85, 90]
+AGE_BAND_LABELS = ['< 70', '70-74', '75-79', '80-84', '85-89', '90+']
+# Remaining life expectancy in months
+LE_BANDS = [24, 48, 72, 96, 120]
+LE_BAND_LABELS = ['≤ 24 months', '25-48 months', '49-72 months', '73-96 months', '97-120 months', '> 120 months']
+UNKNOWN_BUCKET = 'Unknown'
+
+# Concentration limits as shares of the book (None: shown without a limit). Bucket limits cap the
+# largest band of that dimension; the Herfindahl index is the sum of squared borrower shares.
+CONCENTRATION_LIMITS = {
+    'Largest borrower': 0.15,
+    'Top 5 borrowers': 0.50,
+    'Top 10 borrowers': 0.75,
+    'Herfindahl index': 0.10,
+    'Rate band': 0.50,
+    'Maturity band': 0.50,
+    'Age band': 0.40,
+    'Gender': None,
+    'Remaining LE band': 0.40,
+}
+TOP_BORROWER_COUNTS = (5, 10)
+
+
+def _band_codes(values, edges, known, side='left'):
+    """Band index of every value (edges are inclusive upper bounds, or lower bounds with side='right'); rows not `known` get the Unknown index"""
+    codes = np.searchsorted(edges, values, side=side)
+    return np.where(known, codes, len(edges) + 1)
+
+
+def _bucket_exposure(dimensions, measures):
+    """Count and sum each measure by bucket of every dimension, with one bincount per measure
+
+    `dimensions` is a list of (name, labels, codes) where codes index labels + [UNKNOWN_BUCKET], and
+    `measures` a list of (column, values, share column).
+    The dimensions' codes are offset into one shared index so all of them group in the same pass.
+    Each bucket's share is taken of its own dimension's total.
+    """
+    sizes = np.array([len(labels) + 1 for _, labels, _ in dimensions])
+    offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    codes = np.concatenate([np.asarray(dimension_codes) + offset
+                            for (_, _, dimension_codes), offset in zip(dimensions, offsets)])
+
+    exposure = pd.DataFrame({
+        'Dimension': np.repeat([name for name, _, _ in dimensions], sizes),
+        'Bucket': [label for _, labels, _ in dimensions for label in list(labels) + [UNKNOWN_BUCKET]],
+        'Count': np.bincount(codes, minlength=sizes.sum()),
+    })
+    for column, values, share_column in measures:
+        values = np.nan_to_num(np.asarray(values, dtype=float))
+        sums = np.bincount(codes, weights=np.tile(values, len(dimensions)), minlength=sizes.sum())
+        totals = np.repeat(np.add.reduceat(sums, offsets), sizes)
+        exposure[column] = sums
+        with np.errstate(divide='ignore', invalid='ignore'):
+            exposure[share_column] = np.where(totals > 0, sums / totals, 0.0)
+
+    # Keep the Unknown buckets only where something landed in them
+    unknown = exposure['Bucket'] == UNKNOWN_BUCKET
+    return exposure[~unknown | (exposure['Count'] > 0)].reset_index(drop=True)
+
+
+def exposure_loans(loans_df, tolerance=DEFAULT_TOLERANCE):
+    """Active loans (one row per sheet) with an outstanding balance above the tolerance"""
+    loans = loans_df.drop_duplicates('Sheet')
+    return loans[(loans['Status'] == 'Active') & (loans['Current Loan Balance'] > tolerance)]
+
+
+def borrower_exposure(loans_df):
+    """Outstanding balance per borrower, largest first, with each borrower's share and the running share"""
+    loans = exposure_loans(loans_df)
+    codes, borrowers = pd.factorize(loans['Borrower'].astype(str))
+    balances = np.bincount(codes, weights=loans['Current Loan Balance'].to_numpy(dtype=float),
+                           minlength=len(borrowers))
+    order = np.argsort(-balances, kind='stable')
+    total = balances.sum()
+    shares = balances[order] / total if total > 0 else np.zeros(len(order))
+    return pd.DataFrame({
+        'Borrower': np.asarray(borrowers)[order],
+        'Loans': np.bincount(codes, minlength=len(borrowers))[order],
+        'Current Loan Balance': balances[order],
+        'Share': shares,
+        'Cumulative Share': np.cumsum(shares),
+    })
+
+
+def loan_bucket_exposure(loans_df, as_of_date):
+    """Outstanding balance by interest rate band and by months to maturity from the as-of date"""
+    loans = exposure_loans(loans_df)
+    as_of = pd.Timestamp(as_of_date)
+    rates = loans['Annual Interest Rate'].to_numpy(dtype=float)
+    maturity = loans['Maturity Date']
+    months_left = ((maturity.dt.year - as_of.year) * 12 + (maturity.dt.month - as_of.month)).to_numpy(dtype=float)
+    dimensions = [
+        ('Rate band', RATE_BAND_LABELS, _band_codes(rates, RATE_BANDS, rates > 0)),
+        ('Maturity band', MATURITY_BAND_LABELS, _band_codes(months_left, MATURITY_BANDS, ~np.isnan(months_left))),
+    ]
+    return _bucket_exposure(dimensions, [('Current Loan Balance', loans['Current Loan Balance'], 'Balance Share')])
+
+
+def policy_bucket_exposure(policies_df):
+    """NDB and valuation by insured age band, gender and remaining life expectancy band"""
+    ages = policies_df['Age'].to_numpy(dtype=float)
+    les = policies_df['Remaining_LE'].to_numpy(dtype=float)
+    gender = pd.Categorical(policies_df['Gender'])
+    dimensions = [
+        ('Age band', AGE_BAND_LABELS, _band_codes(ages, AGE_BANDS, ages > 0, side='right')),
+        ('Gender', list(gender.categories.astype(str)),
+         np.where(gender.codes >= 0, gender.codes, len(gender.categories))),
+        ('Remaining LE band', LE_BAND_LABELS, _band_codes(les, LE_BANDS, les > 0)),
+    ]
+    return _bucket_exposure(dimensions, [('NDB', policies_df['NDB'], 'NDB Share'),
+                                         ('Valuation', policies_df['Valuation'], 'Valuation Share')])
+
+
+def concentration_limits(borrowers, loan_buckets, policy_buckets=None, limits=CONCENTRATION_LIMITS):
+    """One row per concentration measure with its value, the limit and whether the limit is breached"""
+    checks = []
+    if len(borrowers) > 0:
+        checks.append(('Loans', 'Largest borrower', borrowers['Borrower'].iloc[0], borrowers['Share'].iloc[0]))
+        for count in TOP_BORROWER_COUNTS:
+            top = min(count, len(borrowers))
+            checks.append(('Loans', f'Top {count} borrowers', f'{top} borrowers',
+                           borrowers['Cumulative Share'].iloc[top - 1]))
+        checks.append(('Loans', 'Herfindahl index', f'{len(borrowers)} borrowers', float((borrowers['Share'] ** 2).sum())))
+
+    bucket_tables = [('Loans', loan_buckets, 'Balance Share')]
+    if policy_buckets is not None:
+        bucket_tables += [('LS Policies (NDB)', policy_buckets, 'NDB Share'),
+                          ('LS Policies (Valuation)', policy_buckets, 'Valuation Share')]
+    for book, buckets, share_column in bucket_tables:
+        known = buckets[(buckets['Bucket'] != UNKNOWN_BUCKET) & (buckets['Count'] > 0)]
+        largest = known.loc[known.groupby('Dimension', sort=False)[share_column].idxmax()]
+        checks += [(book, dimension, bucket, share)
+                   for dimension, bucket, share in zip(largest['Dimension'], largest['Bucket'], largest[share_column])]
+
+    limit_checks = pd.DataFrame(checks, columns=['Book', 'Measure', 'Largest', 'Value'])
+    limit_checks['Limit'] = limit_checks['Measure'].map(limits).astype(float)
+    limit_checks['Breach'] = (limit_checks['Value'] > limit_checks['Limit']).to_numpy()
+    return limit_checks
+
+
+def compute_concentration(loans_df, as_of_date, policies_df=None, limits=CONCENTRATION_LIMITS):
+    """Borrower exposure, loan and policy bucket exposure and the concentration limit checks"""
+    borrowers = borrower_exposure(loans_df)
+    loan_buckets = loan_bucket_exposure(loans_df, as_of_date)
+    policy_buckets = policy_bucket_exposure(policies_df) if policies_df is not None and len(policies_df) > 0 else None
+    return borrowers, loan_buckets, policy_buckets, concentration_limits(borrowers, loan_buckets, policy_buckets, limits)
+
+
+# Vintage periods offered for the cohort view (pandas period codes)
+VINTAGE_PERIODS = {'Quarterly': 'Q', 'Monthly': 'M'}
+
+
+def compute_vintages(schedule_df, loans_df, as_of_date, period='Q', tolerance=DEFAULT_TOLERANCE):
+    """Cohort curves by origination period and months on book from one grouped pass over the schedule rows
+
+    Loans are grouped into vintages by `Loan Start Date` (`period` 'M' or 'Q'), and a row's months on
+    book counts calendar months from the loan's start month to its `Month`. Only rows due by the as-of
+    date are used. Each vintage's curve stops at the months on book its youngest loan has reached, so
+    every point covers the whole vintage. The shortfall at a row is the loan's cumulative scheduled
+    repayments less its cumulative payments up to that row; loans that never record payments are left
+    out of the delinquency figures. Returns (curves, summary), where the summary is each vintage's
+    latest point.
+    """
+    as_of = pd.Timestamp(as_of_date)
+    loans = loans_df.drop_duplicates('Sheet')
+    loans = loans[loans['Loan Start Date'].notna() & (loans['Loan Start Date'] <= as_of)]
+    start = loans['Loan Start Date']
+    vintage = pd.Categorical(start.dt.to_period(period).astype(str))
+    start_month = (start.dt.year * 12 + start.dt.month).to_numpy()
+    as_of_month = as_of.year * 12 + as_of.month
+
+    # Map every schedule row to its loan (-1 for sheets without a dated loan)
+    loan_index = pd.Index(loans['Sheet'].astype(str)).get_indexer(schedule_df['Sheet'].astype(str))
+    months = schedule_df['Month']
+    payment_dates = schedule_df['Payment Date']
+    paid = schedule_df['Amount Paid'].to_numpy(dtype=float)
+    has_payment_data = np.bincount(loan_index[loan_index >= 0],
+                                   weights=((paid > 0) | payment_dates.notna().to_numpy())[loan_index >= 0],
+                                   minlength=len(loans)) > 0
+
+    months_on_book = (months.dt.year * 12 + months.dt.month).to_numpy() - start_month[loan_index]
+    due = ((loan_index >= 0) & (months <= as_of) & (months_on_book >= 0)).to_numpy()
+    rows_loan = loan_index[due]
+    counted_paid = ((payment_dates <= as_of) | payment_dates.isna()).to_numpy()[due]
+    rows = pd.DataFrame({
+        'Vintage': vintage[rows_loan],
+        'Months On Book': months_on_book[due],
+        'Outstanding Balance': np.maximum(schedule_df['Closing Balance'].to_numpy(dtype=float)[due], 0),
+        'Principal Repaid': schedule_df['Capital Repaid'].to_numpy(dtype=float)[due],
+        'Interest Earned': schedule_df['Interest Charged'].to_numpy(dtype=float)[due],
+        'Collected': np.where(counted_paid, paid[due], 0.0),
+        'Scheduled': schedule_df['Loan Repayment'].to_numpy(dtype=float)[due],
+        'Tracked': has_payment_data[rows_loan],
+    })
+    by_loan = rows.groupby(rows_loan, sort=False)
+    shortfall = np.maximum(by_loan['Scheduled'].cumsum() - by_loan['Collected'].cumsum(), 0).to_numpy()
+    rows['Shortfall'] = np.where(rows['Tracked'], shortfall, 0.0)
+    rows['Delinquent'] = rows['Shortfall'] > tolerance
+
+    curves = rows.groupby(['Vintage', 'Months On Book'], observed=True).agg(**{
+        'Outstanding Balance': ('Outstanding Balance', 'sum'),
+        'Principal Repaid': ('Principal Repaid', 'sum'),
+        'Interest Earned': ('Interest Earned', 'sum'),
+        'Collected': ('Collected', 'sum'),
+        'Shortfall': ('Shortfall', 'sum'),
+        'Delinquent Loans': ('Delinquent', 'sum'),
+    }).reset_index()
+    by_vintage = curves.groupby('Vintage', observed=True)
+    for col in ['Principal Repaid', 'Interest Earned', 'Collected']:
+        curves[f'Cumulative {col}'] = by_vintage[col].cumsum()
+    curves = curves.drop(columns=['Principal Repaid', 'Interest Earned', 'Collected'])
+
+    cohorts = pd.DataFrame({
+        'Vintage': vintage,
+        'Original Loan Balance': loans['Original Loan Balance'].to_numpy(dtype=float),
+        'Tracked': has_payment_data,
+        'Seasoning': as_of_month - start_month,
+    }).groupby('Vintage', observed=True).agg(
+        Loans=('Original Loan Balance', 'size'),
+        **{'Tracked Loans': ('Tracked', 'sum'),
+           'Original Loan Balance': ('Original Loan Balance', 'sum'),
+           'Seasoning': ('Seasoning', 'min')},
+    ).reset_index()
+    curves = curves.merge(cohorts, on='Vintage')
+    curves = curves[curves['Months On Book'] <= curves['Seasoning']].drop(columns='Seasoning').reset_index(drop=True)
+
+    original = curves['Original Loan Balance'].where(curves['Original Loan Balance'] > 0)
+    curves['Outstanding %'] = curves['Outstanding Balance'] / original
+    curves['Principal Repaid %'] = curves['Cumulative Principal Repaid'] / original
+    curves['Delinquency Rate'] = curves['Delinquent Loans'] / curves['Tracked Loans'].where(curves['Tracked Loans'] > 0)
+    curves['Vintage'] = curves['Vintage'].astype(str)
+
+    summary = cohorts.drop(columns='Seasoning').assign(Vintage=lambda df: df['Vintage'].astype(str)).merge(
+        curves.groupby('Vintage', sort=False).tail(1).drop(columns=['Loans', 'Tracked Loans', 'Original Loan Balance']),
+        on='Vintage', how='left')
+    return curves, summary
+
+
+# Book totals per calendar month; balances and cumulative figures carry past the last month
+BALANCE_SERIES_COLUMNS = ['Outstanding Principal', 'Originations', 'Scheduled Repayment', 'Scheduled Interest',
+                          'Collections', 'Cumulative Collections']
+BALANCE_CARRIED_COLUMNS = ['Outstanding Principal', 'Cumulative Collections']
+
+
+def _month_number(dates):
+    """Months since year 0 of each date (NaT gives NaN)"""
+    dates = pd.DatetimeIndex(dates)
+    return (dates.year * 12 + dates.month - 1).to_numpy(dtype=float)
+
+
+def build_balance_series(schedule_df, loans_df=None):
+    """Month-indexed totals across all loans from origination to final maturity, scattered with np.add.at
+
+    Each loan adds its first row's opening balance in its funding month (the `Loan Start Date` month,
+    or the first schedule month when the start date is missing or later). Each schedule row then adds
+    its change in closing balance in its `Month`, so the running sum of the month axis is the
+    outstanding principal. Collections are placed in the month of their `Payment Date`, or in the
+    row's `Month` when no date was recorded. Look months up with balance_at.
+    """
+    rows = schedule_df[schedule_df['Month'].notna()]
+    if len(rows) == 0:
+        return pd.DataFrame(columns=BALANCE_SERIES_COLUMNS, index=pd.DatetimeIndex([], name='Month'), dtype=float)
+
+    sheets = rows['Sheet'].astype(str).to_numpy()
+    row_month = _month_number(rows['Month'])
+    first_row = np.ones(len(rows), dtype=bool)
+    first_row[1:] = sheets[1:] != sheets[:-1]
+
+    opening = rows['Opening Balance'].to_numpy(dtype=float)
+    closing = rows['Closing Balance'].to_numpy(dtype=float)
+    previous_closing = np.empty(len(rows))
+    previous_closing[1:] = closing[:-1]
+    previous_closing[first_row] = opening[first_row]
+
+    funded_month = row_month[first_row]
+    if loans_df is not None and len(loans_df) > 0:
+        loans = loans_df.drop_duplicates('Sheet')
+        start_dates = pd.Series(loans['Loan Start Date'].to_numpy(), index=loans['Sheet'].astype(str).to_numpy())
+        start_month = _month_number(start_dates.reindex(sheets[first_row]))
+        funded_month = np.where(start_month <= funded_month, start_month, funded_month)
+
+    paid = rows['Amount Paid'].to_numpy(dtype=float)
+    paid_month = _month_number(rows['Payment Date'])
+    paid_month = np.where(np.isnan(paid_month), row_month, paid_month)
+
+    first_month = int(min(funded_month.min(), paid_month.min()))
+    n_months = int(max(row_month.max(), paid_month.max())) - first_month + 1
+    funded_index = (funded_month - first_month).astype(int)
+    row_index = (row_month - first_month).astype(int)
+    paid_index = (paid_month - first_month).astype(int)
+
+    principal_change = np.zeros(n_months)
+    np.add.at(principal_change, funded_index, opening[first_row])
+    np.add.at(principal_change, row_index, closing - previous_closing)
+    originations = np.zeros(n_months)
+    np.add.at(originations, funded_index, opening[first_row])
+    repayment = np.zeros(n_months)
+    np.add.at(repayment, row_index, rows['Loan Repayment'].to_numpy(dtype=float))
+    interest = np.zeros(n_months)
+    np.add.at(interest, row_index, rows['Interest Charged'].to_numpy(dtype=float))
+    collections = np.zeros(n_months)
+    np.add.at(collections, paid_index, np.nan_to_num(paid))
+
+    months = pd.date_range(pd.Timestamp(year=first_month // 12, month=first_month % 12 + 1, day=1),
+                           periods=n_months, freq='MS', name='Month')
+    return pd.DataFrame({
+        'Outstanding Principal': np.cumsum(principal_change),
+        'Originations': originations,
+        'Scheduled Repayment': repayment,
+        'Scheduled Interest': interest,
+        'Collections': collections,
+        'Cumulative Collections': np.cumsum(collections),
+    }, index=months)
+
+
+def balance_at(balance_series, date):
+    """Book totals for the month containing `date`, read by position
+
+    Months before the series are empty; months after it keep the final balance and cumulative
+    collections with no flows.
+    """
+    month = pd.Timestamp(date).to_period('M').to_timestamp()
+    totals = pd.Series(0.0, index=BALANCE_SERIES_COLUMNS, name=month)
+    if len(balance_series) == 0:
+        return totals
+    first = balance_series.index[0]
+    position = (month.year - first.year) * 12 + month.month - first.month
+    if position < 0:
+        return totals
+    if position < len(balance_series):
+        return balance_series.iloc[position].rename(month)
+    totals[BALANCE_CARRIED_COLUMNS] = balance_series.iloc[-1][BALANCE_CARRIED_COLUMNS]
+    return totals
+
+
+# Upper bound on scenarios x loans x months elements evaluated at once by the stress engine
+STRESS_CHUNK_ELEMENTS = 4_000_000
+
+
+def build_stress_scenarios(n_scenarios, cpr_range=(0.0, 0.3), cdr_range=(0.0, 0.1),
+                           severity_range=(0.2, 0.6), lag_range=(3, 12), seed=None):
+    """Draw prepayment/default scenarios uniformly from the given annual ranges"""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'CPR': rng.uniform(*cpr_range, n_scenarios),
+        'CDR': rng.uniform(*cdr_range, n_scenarios),
+        'Severity': rng.uniform(*severity_range, n_scenarios),
+        'Recovery Lag': rng.integers(lag_range[0], lag_range[1] + 1, n_scenarios),
+    })
+
+
+def scheduled_balance_matrix(balances, rates, remaining_months, interest_only, horizon):
+    """Start-of-month scheduled balances (loans x horizon+1) with no prepayment or default"""
+    t = np.arange(horizon + 1, dtype=float)[None, :]
+    n = np.maximum(np.asarray(remaining_months, dtype=float), 1)[:, None]
+    balances = np.asarray(balances, dtype=float)[:, None]
+    monthly_rate = np.asarray(rates, dtype=float)[:, None] / 12
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        growth_n = (1 + monthly_rate) ** n
+        level = balances * (growth_n - (1 + monthly_rate) ** t) / (growth_n - 1)
+    straight_line = balances * (1 - t / n)
+    amortizing = np.where(monthly_rate > 0, level, straight_line)
+    schedule = np.where(np.asarray(interest_only, dtype=bool)[:, None], balances, amortizing)
+    return np.where(t < n, np.maximum(schedule, 0), 0.0)
+
+
+def stress_loan_cashflows(loans_df, scenarios, start_month, horizon=12):
+    """Project monthly collections for every scenario at once over a scenarios x loans x months grid
+
+    Each loan runs off its scheduled balance from `Current Loan Balance`, `Annual Interest Rate`
+    and `Maturity Date`. Defaults (CDR) hit the start-of-month balance, prepayments (CPR) apply to
+    the performing balance after scheduled principal, and defaulted principal comes back as
+    recoveries `Recovery Lag` months later at (1 - Severity).
+    """
+    start = pd.Period(start_month, freq='M')
+    months = pd.period_range(start, periods=horizon, freq='M')
+    book = loans_df[(loans_df['Status'] == 'Active') & (loans_df['Current Loan Balance'] > 0)]
+
+    maturity = pd.to_datetime(book['Maturity Date'])
+    maturity_period = maturity.dt.to_period('M')
+    remaining = np.array([(m - start).n + 1 if pd.notna(m) else horizon for m in maturity_period], dtype=float)
+    sched = scheduled_balance_matrix(book['Current Loan Balance'], book['Annual Interest Rate'],
+                                     remaining, book['Is Interest Only'], horizon)
+
+    # Fraction of the performing balance due as scheduled principal each month
+    with np.errstate(divide='ignore', invalid='ignore'):
+        principal_fraction = np.where(sched[:, :-1] > 0, 1 - sched[:, 1:] / sched[:, :-1], 0.0)
+    sched = sched[:, :-1]
+    monthly_rates = book['Annual Interest Rate'].to_numpy(dtype=float)[:, None] / 12
+
+    smm = 1 - (1 - scenarios['CPR'].to_numpy(dtype=float)) ** (1 / 12)
+    mdr = 1 - (1 - scenarios['CDR'].to_numpy(dtype=float)) ** (1 / 12)
+    severity = scenarios['Severity'].to_numpy(dtype=float)
+    lags = scenarios['Recovery Lag'].to_numpy(dtype=int)
+
+    n_scenarios = len(scenarios)
+    collections = np.zeros((n_scenarios, horizon))
+    defaults = np.zeros((n_scenarios, horizon))
+    chunk = max(1, STRESS_CHUNK_ELEMENTS // max(1, sched.size))
+    t = np.arange(horizon)
+
+    for lo in range(0, n_scenarios, chunk):
+        hi = min(lo + chunk, n_scenarios)
+        s_smm = smm[lo:hi, None, None]
+        s_mdr = mdr[lo:hi, None, None]
+        survival = ((1 - s_smm) * (1 - s_mdr)) ** t[None, None, :]
+
+        balance = sched[None, :, :] * survival
+        defaulted = balance * s_mdr
+        performing = balance - defaulted
+        scheduled_principal = performing * principal_fraction[None, :, :]
+        prepaid = (performing - scheduled_principal) * s_smm
+        interest = performing * monthly_rates[None, :, :]
+
+        collections[lo:hi] = (interest + scheduled_principal + prepaid).sum(axis=1)
+        defaults[lo:hi] = defaulted.sum(axis=1)
+
+    recoveries = np.zeros_like(defaults)
+    for lag in np.unique(lags):
+        if lag >= horizon:
+            continue
+        selected = lags == lag
+        recoveries[selected, lag:] = defaults[selected, :horizon - lag] * (1 - severity[selected, None])
+
+    return {
+        'months': months,
+        'scenarios': scenarios.reset_index(drop=True),
+        'collections': collections + recoveries,
+        'defaults': defaults,
+        'recoveries': recoveries,
+        'loan_count': len(book),
+    }
+
+
+def collection_bands(stress_result, percentiles=(5, 50, 95)):
+    """Summarize the scenario distribution of monthly collections as percentile bands"""
+    bands = np.percentile(stress_result['collections'], percentiles, axis=0)
+    band_df = pd.DataFrame({f'P{p}': band for p, band in zip(percentiles, bands)},
+                           index=stress_result['months'].astype(str))
+    band_df['Mean'] = stress_result['collections'].mean(axis=0)
+    return band_df.rename_axis('Month')
+
+
+# Bracket for the XIRR solver in log space: ln(1 + r) for r between -99% and +10,000%
+XIRR_LOG_BRACKET = (np.log(0.01), np.log(101.0))
+
+
+def flows_to_arrays(flows_df):
+    """Pad a long (Instrument, Date, Amount) flow frame into instrument x flow arrays of year fractions and amounts
+
+    Flows of one instrument on the same date are netted first, so a roll-up pooling every flow in the
+    book is only as wide as its distinct dates and the padded width stays near a single instrument's.
+    """
+    flows_df = flows_df.groupby(['Instrument', 'Date'], as_index=False, sort=True, dropna=False)['Amount'].sum()
+    instruments, codes = np.unique(flows_df['Instrument'].to_numpy(dtype=str), return_inverse=True)
+    position = flows_df.groupby('Instrument', sort=False).cumcount().to_numpy()
+
+    dates = flows_df['Date'].to_numpy(dtype='datetime64[D]').astype(np.int64)
+    first_date = np.full(len(instruments), np.iinfo(np.int64).max)
+    np.minimum.at(first_date, codes, dates)
+
+    times = np.zeros((len(instruments), position.max() + 1 if len(position) else 0))
+    amounts = np.zeros_like(times)
+    times[codes, position] = (dates - first_date[codes]) / 365.0
+    amounts[codes, position] = flows_df['Amount'].to_numpy(dtype=float)
+    return instruments, times, amounts
+
+
+def solve_xirr(times, amounts, tolerance=1e-9, max_iterations=100):
+    """Solve the annual IRR of every row of (times, amounts) at once with a Newton/bisection hybrid
+
+    Works on x = ln(1 + r), where NPV(x) = sum(amount * exp(-x * t)) is smooth and, for flows that
+    start negative and turn positive, monotone. Newton steps that leave the current bracket fall back
+    to bisection. Rows without a sign change in NPV over the bracket get NaN.
+    """
+    n = times.shape[0]
+    lo = np.full(n, XIRR_LOG_BRACKET[0])
+    hi = np.full(n, XIRR_LOG_BRACKET[1])
+
+    def npv(x):
+        discount = np.exp(-x[:, None] * times)
+        return (amounts * discount).sum(axis=1), -(amounts * times * discount).sum(axis=1)
+
+    f_lo, _ = npv(lo)
+    f_hi, _ = npv(hi)
+    solvable = np.sign(f_lo) * np.sign(f_hi) < 0
+
+    x = np.full(n, np.log(1.1))
+    scale = np.maximum(np.abs(amounts).sum(axis=1), 1.0)
+    for _ in range(max_iterations):
+        f, df = npv(x)
+        converged = np.abs(f) <= tolerance * scale
+        if np.all(converged | ~solvable):
+            break
+
+        # Keep the bracket on opposite sides of the root
+        same_as_lo = np.sign(f) == np.sign(f_lo)
+        lo = np.where(same_as_lo, x, lo)
+        f_lo = np.where(same_as_lo, f, f_lo)
+        hi = np.where(same_as_lo, hi, x)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            newton = x - f / df
+        use_bisection = ~np.isfinite(newton) | (newton <= lo) | (newton >= hi)
+        x = np.where(converged, x, np.where(use_bisection, (lo + hi) / 2, newton))
+
+    return np.where(solvable, np.expm1(x), np.nan)
+
+
+def build_loan_flows(schedule_df, loans_df, as_of_date):
+    """Dated flows per loan: realized (payments to date plus current balance at par) and projected (plus the remaining schedule)"""
+    as_of = pd.Timestamp(as_of_date)
+    loans = loans_df.drop_duplicates('Sheet')
+    loans = loans.set_index(loans['Sheet'].astype(object))
+    rows = schedule_df[schedule_df['Sheet'].isin(loans.index)]
+
+    # Loans that never record payments are assumed to have paid on schedule
+    has_payment = rows['Amount Paid'].gt(0) | rows['Payment Date'].notna()
+    tracked = has_payment.groupby(rows['Sheet']).transform('any').to_numpy()
+    paid_date = rows['Payment Date'].fillna(rows['Month'])
+    realized_amount = np.where(tracked, rows['Amount Paid'], np.where(rows['Month'] <= as_of, rows['Loan Repayment'], 0.0))
+    realized_date = np.where(tracked, paid_date, rows['Month'])
+    realized = pd.DataFrame({'Sheet': rows['Sheet'].to_numpy(), 'Date': realized_date, 'Amount': realized_amount})
+    realized = realized[(realized['Amount'] != 0) & (realized['Date'] <= as_of)]
+
+    # Funding outflow at the loan start (or a month before the first scheduled payment)
+    first_month = rows.groupby('Sheet')['Month'].min()
+    start_dates = pd.to_datetime(loans['Loan Start Date']).fillna(first_month - pd.DateOffset(months=1))
+    funding = pd.DataFrame({'Sheet': loans.index, 'Date': start_dates.to_numpy(),
+                            'Amount': -loans['Original Loan Balance'].to_numpy(dtype=float)})
+    funding = funding[funding['Date'].notna() & (funding['Date'] <= as_of)]
+
+    mark = pd.DataFrame({'Sheet': loans.index, 'Date': as_of,
+                         'Amount': loans['Current Loan Balance'].to_numpy(dtype=float)})
+
+    future = rows[rows['Month'] > as_of]
+    scheduled = pd.DataFrame({'Sheet': future['Sheet'].to_numpy(), 'Date': future['Month'].to_numpy(),
+                              'Amount': future['Loan Repayment'].to_numpy(dtype=float)})
+    last_rows = rows.groupby('Sheet').tail(1)
+    balloon = last_rows[(last_rows['Closing Balance'] > DEFAULT_TOLERANCE) & (last_rows['Month'] > as_of)]
+    balloon = pd.DataFrame({'Sheet': balloon['Sheet'].to_numpy(), 'Date': balloon['Month'].to_numpy(),
+                            'Amount': balloon['Closing Balance'].to_numpy(dtype=float)})
+
+    realized_flows = pd.concat([funding, realized, mark], ignore_index=True)
+    projected_flows = pd.concat([funding, realized, scheduled, balloon], ignore_index=True)
+    return realized_flows, projected_flows
+
+
+def build_policy_flows(policies_df, as_of_date, policy_premiums=None):
+    """Dated flows per policy: cost basis today, monthly premiums until expected maturity, NDB at expected maturity
+
+    `policy_premiums` is the parsed premium stream, a policies x months frame indexed by Policy_ID with
+    monthly periods as columns. Months it covers use the policy's projected premium; other months, and
+    policies it lacks, fall back to a flat twelfth of Annual_Premium.
+    """
+    as_of = pd.Timestamp(as_of_date)
+    book = policies_df[policies_df['Remaining_LE'] > 0]
+    maturity_month = np.ceil(book['Remaining_LE'].to_numpy(dtype=float)).astype(int)
+    monthly_premium = book['Annual_Premium'].to_numpy(dtype=float) / 12
+
+    # Premiums are paid at the start of each month before maturity
+    policy_index = np.repeat(np.arange(len(book)), maturity_month)
+    month_offset = np.arange(maturity_month.sum()) - np.repeat(np.cumsum(maturity_month) - maturity_month, maturity_month)
+    premiums = monthly_premium[policy_index]
+
+    if policy_premiums is not None and policy_premiums.size > 0 and len(month_offset) > 0:
+        # Stream column for each month offset from the as-of month (-1 where the stream has no such month)
+        as_of_month = as_of.to_period('M')
+        stream_column = np.full(month_offset.max() + 1, -1)
+        for column, month in enumerate(policy_premiums.columns):
+            offset = (month - as_of_month).n
+            if 0 <= offset < len(stream_column):
+                stream_column[offset] = column
+        stream = policy_premiums.reindex(book['Policy_ID']).to_numpy(dtype=float)
+        column = stream_column[month_offset]
+        streamed = np.full(len(premiums), np.nan)
+        covered = column >= 0
+        streamed[covered] = stream[policy_index[covered], column[covered]]
+        premiums = np.where(np.isnan(streamed), premiums, streamed)
+
+    month_index = np.concatenate([month_offset, maturity_month, np.zeros(len(book), dtype=int)])
+    policy_index = np.concatenate([policy_index, np.arange(len(book)), np.arange(len(book))])
+    amounts = np.concatenate([-premiums,
+                              book['NDB'].to_numpy(dtype=float),
+                              -book['Cost_Basis'].to_numpy(dtype=float)])
+
+    return pd.DataFrame({
+        'Policy_ID': book['Policy_ID'].to_numpy()[policy_index],
+        'Date': as_of + pd.to_timedelta(month_index * 365.25 / 12, unit='D'),
+        'Amount': amounts,
+    })
+
+
+def compute_irrs(schedule_df, loans_df, as_of_date, policies_df=None, policy_premiums=None):
+    """Realized/projected IRR per loan, projected IRR per policy and portfolio roll-ups from one batched solve
+
+    `policy_premiums` is the policies' premium stream with monthly period columns (see build_policy_flows).
+    """
+    realized, projected = build_loan_flows(schedule_df, loans_df, as_of_date)
+    batches = [
+        realized.assign(Instrument='loan-realized|' + realized['Sheet']),
+        projected.assign(Instrument='loan-projected|' + projected['Sheet']),
+        realized.assign(Instrument='portfolio|Loans (Realized)'),
+        projected.assign(Instrument='portfolio|Loans (Projected)'),
+        projected.assign(Instrument='portfolio|Total Book (Projected)'),
+    ]
+    if policies_df is not None and len(policies_df) > 0:
+        policy_flows = build_policy_flows(policies_df, as_of_date, policy_premiums)
+        batches += [
+            policy_flows.assign(Instrument='policy|' + policy_flows['Policy_ID'].astype(str)),
+            policy_flows.assign(Instrument='portfolio|LS Policies (Projected)'),
+            policy_flows.assign(Instrument='portfolio|Total Book (Projected)'),
+        ]
+
+    flows = pd.concat([batch[['Instrument', 'Date', 'Amount']] for batch in batches], ignore_index=True)
+    instruments, times, amounts = flows_to_arrays(flows)
+    labels = pd.Series(instruments).str.split('|', n=1, expand=True)
+    irr = pd.DataFrame({'Kind': labels[0], 'Key': labels[1], 'IRR': solve_xirr(times, amounts)})
+
+    def irr_for(kind):
+        selected = irr[irr['Kind'] == kind]
+        return pd.Series(selected['IRR'].to_numpy(), index=selected['Key'].to_numpy())
+
+    loan_irr = loans_df.drop_duplicates('Sheet')[['Sheet', 'Borrower', 'Status']].copy()
+    # Look up by label rather than Series.map, which would keep a categorical Sheet's dtype
+    loan_irr['Realized IRR'] = irr_for('loan-realized').reindex(loan_irr['Sheet']).to_numpy()
+    loan_irr['Projected IRR'] = irr_for('loan-projected').reindex(loan_irr['Sheet']).to_numpy()
+    policy_irr = irr_for('policy').rename_axis('Policy_ID').rename('Projected IRR').reset_index()
+    portfolio_irr = irr_for('portfolio').rename_axis('Portfolio').rename('IRR').reset_index()
+    return loan_irr, policy_irr, portfolio_irr
+
+
+# Columns kept per snapshot for the history views
+LOAN_HISTORY_COLUMNS = ['Sheet', 'Borrower', 'Status', 'Current Loan Balance',
+                        'Total Principal Repaid', 'Total Interest Repaid']
+POLICY_HISTORY_COLUMNS = ['Policy_ID', 'Name', 'NDB', 'Valuation', 'Cost_Basis']
+
+
+def period_deltas(history, key, value_columns):
+    """Join every (key, As Of) row to the same key in the preceding snapshot and add `Δ <column>` changes
+
+    Keys absent from the preceding snapshot (new loans/policies) get NaN deltas.
+    """
+    history = history.drop_duplicates([key, 'As Of'], keep='last')
+    current = history.set_index([key, 'As Of'])[value_columns]
+
+    as_of_dates = np.sort(history['As Of'].unique())
+    prior_as_of = pd.Series(as_of_dates[:-1], index=as_of_dates[1:])
+    current_as_of = current.index.get_level_values('As Of')
+    prior_index = pd.MultiIndex.from_arrays([current.index.get_level_values(key),
+                                             prior_as_of.reindex(current_as_of).to_numpy()])
+    prior = current.reindex(prior_index).set_axis(current.index)
+
+    deltas = (current - prior).add_prefix('Δ ')
+    return history.set_index([key, 'As Of']).join(deltas).reset_index().sort_values(['As Of', key], ignore_index=True)
+
+
+def loan_history_deltas(loan_history):
+    """Per-loan balance and collections by snapshot (collections are the change in principal + interest repaid)"""
+    loan_history = loan_history.assign(**{
+        'Total Collected': loan_history['Total Principal Repaid'] + loan_history['Total Interest Repaid']
+    })
+    return period_deltas(loan_history, 'Sheet', ['Current Loan Balance', 'Total Collected'])
+
+
+def policy_history_deltas(policy_history):
+    """Per-policy valuation and gain/(loss) over cost basis by snapshot"""
+    policy_history = policy_history.assign(**{'Gain/(Loss)': policy_history['Valuation'] - policy_history['Cost_Basis']})
+    return period_deltas(policy_history, 'Policy_ID', ['Valuation', 'Gain/(Loss)'])
+
+
+def portfolio_trends(loan_deltas, policy_deltas=None):
+    """Book totals per snapshot with their period-over-period changes"""
+    loans = loan_deltas.groupby('As Of')
+    trends = pd.DataFrame({
+        'Loan Balance': loans['Current Loan Balance'].sum(),
+        'Collections': loans['Δ Total Collected'].sum(min_count=1),
+    })
+    if policy_deltas is not None and len(policy_deltas) > 0:
+        policies = policy_deltas.groupby('As Of')
+        trends['LS Valuation'] = policies['Valuation'].sum()
+        trends['LS Gain/(Loss)'] = policies['Gain/(Loss)'].sum()
+    for col in ['Loan Balance', 'LS Valuation', 'LS Gain/(Loss)']:
+        if col in trends:
+            trends[f'Δ {col}'] = trends[col].diff()
+    return trends
@@ -0,0 +1,131 @@
+"""Command-line batch mode for the Sirocco portfolio calculations.
+
+Parses the Master (and optionally LS and remittance) files with the same code
+as the dashboard, without importing Streamlit, and writes the loans,
+amortization schedules, cashflows, policies, premiums and a JSON summary to a folder:
+
+    python portfolio_cli.py --master Master.xlsx --ls LS.xlsx --out reports/ --format csv
+"""
+import argparse
+import json
+import os
+import sys
+from datetime import datetime
+
+OUTPUT_FORMATS = ['csv', 'json', 'parquet']
+
+
+def _json_value(value):
+    """Make NumPy scalars and timestamps JSON serialisable"""
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    if hasattr(value, 'item'):
+        return value.item()
+    raise TypeError(f"Cannot serialise {type(value).__name__}")
+
+
+def write_table(df, out_dir, name, fmt):
+    """Write one output table in the requested format and return its path"""
+    path = os.path.join(out_dir, f'{name}.{fmt}')
+    if fmt == 'csv':
+        df.to_csv(path, index=False)
+    elif fmt == 'json':
+        df.to_json(path, orient='records', date_format='iso', indent=2)
+    else:
+        df.to_parquet(path, index=False)
+    return path
+
+
+def load_remittance(path):
+    """Read the monthly remittance file (CSV or XLSX) as-is"""
+    import pandas as pd
+    return pd.read_csv(path) if path.lower().endswith('.csv') else pd.read_excel(path)
+
+
+def premium_table(policy_premiums):
+    """The per-policy premium stream (policies x months) as long Policy_ID, Month, Premium rows"""
+    import pandas as pd
+    if policy_premiums.size == 0:
+        return pd.DataFrame({'Policy_ID': pd.Series(dtype=object), 'Month': pd.Series(dtype=object),
+                             'Premium': pd.Series(dtype=float)})
+    premiums = policy_premiums.rename_axis(index='Policy_ID', columns='Month').stack(dropna=False)
+    return premiums.rename('Premium').reset_index()
+
+
+def build_parser():
+    """Command-line arguments"""
+    parser = argparse.ArgumentParser(description="Sirocco I LP portfolio batch run (no Streamlit)")
+    parser.add_argument('--master', required=True, help="Master Excel workbook (.xlsx)")
+    parser.add_argument('--ls', help="Life Settlement portfolio workbook (.xlsx)")
+    parser.add_argument('--remittance', help="Monthly remittance file (.csv or .xlsx), copied through to the outputs")
+    parser.add_argument('--out', default='output', help="Output folder (default: output)")
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, default='csv', help="Table format (default: csv)")
+    return parser
+
+
+def main(argv=None):
+    """Run the batch and return a process exit code"""
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.format == 'parquet':
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            parser.error("parquet output needs pyarrow (pip install pyarrow)")
+
+    # The analytics stack is only imported once the arguments are valid, so --help stays instant
+    import pandas as pd
+    from portfolio_core import (process_master_workbook, parse_life_settlement_workbook,
+                                split_loans_by_status, portfolio_summary, loan_cashflows)
+
+    os.makedirs(args.out, exist_ok=True)
+    today = datetime.now()
+
+    master_data = process_master_workbook(args.master)
+    loans_df = master_data['loans_df']
+    not_started_loans = split_loans_by_status(loans_df)[2]
+    cashflows = loan_cashflows(master_data['loan_details'], set(not_started_loans['Borrower']), today)
+
+    summary = {
+        'generated': today,
+        'as_of_date': master_data['as_of_date'] if pd.notna(master_data['as_of_date']) else None,
+        'loan_sheets': len(master_data['loan_sheets']),
+        'loans': portfolio_summary(loans_df, today),
+    }
+    outputs = [
+        write_table(loans_df, args.out, 'loans', args.format),
+        write_table(master_data['schedule_df'], args.out, 'schedules', args.format),
+        write_table(cashflows, args.out, 'cashflows', args.format),
+    ]
+
+    if args.ls:
+        messages = []
+        ls_data = parse_life_settlement_workbook(args.ls, messages)
+        for level, text in messages:
+            if level in ('warning', 'error'):
+                print(f"{level}: {text}", file=sys.stderr)
+        if ls_data is None:
+            print(f"error: could not read Life Settlement data from {args.ls}", file=sys.stderr)
+            return 1
+        monthly_premiums = pd.DataFrame({'Month': list(ls_data['monthly_premiums']),
+                                         'Premium': list(ls_data['monthly_premiums'].values())})
+        outputs.append(write_table(ls_data['policies'], args.out, 'policies', args.format))
+        outputs.append(write_table(monthly_premiums, args.out, 'monthly_premiums', args.format))
+        outputs.append(write_table(premium_table(ls_data['policy_premiums']), args.out, 'premiums', args.format))
+        summary['life_settlements'] = ls_data['summary']
+
+    if args.remittance:
+        outputs.append(write_table(load_remittance(args.remittance), args.out, 'remittance', args.format))
+
+    summary_path = os.path.join(args.out, 'summary.json')
+    with open(summary_path, 'w') as f:
+        json.dump(summary, f, indent=2, default=_json_value)
+    outputs.append(summary_path)
+
+    for path in outputs:
+        print(path)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,1226 @@
+"""Headless parsing and portfolio calculations for the Sirocco dashboard.
+
+Reads the Master and Life Settlement workbooks into plain pandas objects and
+derives the cashflow and summary figures the dashboard shows. Nothing in here
+imports Streamlit, so the same code backs the web app and the batch CLI
+(`portfolio_cli.py`). openpyxl is imported only when a workbook is parsed.
+"""
+import hashlib
+import re
+import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict, namedtuple
+from datetime import datetime
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+from dateutil.relativedelta import relativedelta
+
+from portfolio_analytics import build_schedule_frame
+from rerun_metrics import NULL_METRICS
+
+
+def safe_float(value):
+    """Safely convert a value to float"""
+    try:
+        if isinstance(value, str):
+            if value.lower() in ['interest only', 'n/a', '']:
+                return 0.0
+            value = value.replace('$', '').replace(',', '')
+        return float(value)
+    except (ValueError, TypeError):
+        return 0.0
+
+
+def excel_date_to_datetime(serial_date):
+    """Convert Excel serial date to datetime"""
+    if pd.isna(serial_date):
+        return pd.NaT
+    if isinstance(serial_date, datetime):
+        return serial_date
+    
+    # Handle string dates
+    if isinstance(serial_date, str):
+        # Clean the string
+        serial_date = serial_date.strip()
+        if not serial_date:
+            return pd.NaT
+        
+        # Try parsing as datetime
+        try:
+            return pd.to_datetime(serial_date)
+        except:
+            # Try converting to float for Excel serial dates
+            try:
+                serial_date = float(serial_date)
+            except:
+                return pd.NaT
+    
+    # Handle numeric dates (Excel serial dates)
+    if isinstance(serial_date, (int, float)):
+        try:
+            # Excel dates are days since 1900-01-01 (with some quirks)
+            # For dates after 1900-03-01, subtract 2 days to account for Excel's leap year bug
+            if serial_date > 60:  # After 1900-02-28
+                serial_date = serial_date - 2
+            return pd.to_datetime('1900-01-01') + pd.to_timedelta(serial_date - 1, unit='D')
+        except:
+            return pd.NaT
+    
+    return pd.NaT
+
+
+BlockCell = namedtuple('BlockCell', 'value')
+
+_EMPTY_CELL = BlockCell(None)
+
+
+@lru_cache(maxsize=None)
+def cell_position(coordinate):
+    """(row, column) numbers, 1-based, of an A1-style coordinate"""
+    letters, row = re.fullmatch(r'([A-Z]+)(\d+)', coordinate).groups()
+    column = 0
+    for letter in letters:
+        column = column * 26 + ord(letter) - ord('A') + 1
+    return int(row), column
+
+
+class SheetBlock:
+    """Values of a worksheet's top-left block, read in one pass and looked up like a worksheet (`block['B3'].value`)
+
+    openpyxl read-only worksheets stream their rows but re-read the sheet on every single-cell
+    lookup, so the parsers read a block once and look cells up in it. Cells outside it read as None.
+    """
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    @classmethod
+    def read(cls, sheet, max_row, max_col=12):
+        """Rows 1..max_row, columns A..max_col of a worksheet (read-only or not)"""
+        return cls(list(sheet.iter_rows(min_row=1, max_row=max_row, max_col=max_col, values_only=True)))
+
+    def __getitem__(self, coordinate):
+        row, column = cell_position(coordinate)
+        if row <= len(self.rows) and column <= len(self.rows[row - 1]):
+            return BlockCell(self.rows[row - 1][column - 1])
+        return _EMPTY_CELL
+
+
+def parse_premium_month(month_str):
+    """Parse a Premium Stream month header (e.g. "Jul-25") into a monthly period"""
+    if '-' not in month_str:
+        return None
+    month_parts = month_str.split('-')
+    month_name = month_parts[0]
+    year = '20' + month_parts[1] if len(month_parts[1]) == 2 else month_parts[1]
+    try:
+        return pd.to_datetime(f"{month_name} {year}", format='%b %Y').to_period('M')
+    except (ValueError, TypeError):
+        return None
+
+
+def release_workbook(wb):
+    """Free an openpyxl workbook's cells now rather than at the next garbage collection
+
+    Every cell references its worksheet, so the cell graph is cyclic and reference counting alone
+    never frees it. Emptying each sheet's cell store breaks the cycles.
+    """
+    for ws in wb.worksheets:
+        ws._cells.clear()
+    wb.close()
+
+
+class RecordColumns:
+    """Struct-of-arrays record builder: one preallocated NumPy column per field, filled record by record
+
+    `fields` maps each column to its dtype. Float and bool columns are filled in place; 'category'
+    and 'datetime64[ns]' columns are collected as objects and converted once when the frame is built.
+    """
+
+    def __init__(self, fields, capacity):
+        self.fields = fields
+        self.columns = {name: np.empty(capacity, dtype=object if dtype in ('category', 'datetime64[ns]') else dtype)
+                        for name, dtype in fields.items()}
+        self.size = 0
+
+    def append(self, values):
+        """Add one record (values in field order)"""
+        for column, value in zip(self.columns.values(), values):
+            column[self.size] = value
+        self.size += 1
+
+    def frame(self, index=None):
+        """The records added so far as a DataFrame with the declared dtypes"""
+        data = {}
+        for name, dtype in self.fields.items():
+            values = self.columns[name][:self.size]
+            if dtype == 'category':
+                values = pd.Categorical(values)
+            elif dtype == 'datetime64[ns]':
+                values = pd.to_datetime(values).to_numpy()
+            data[name] = values
+        return pd.DataFrame(data, index=index)
+
+
+# Column layouts of the parsed records ('category' for labels repeated across rows)
+POLICY_FIELDS = {
+    'Policy_ID': object,
+    'Insured_ID': object,
+    'Name': object,
+    'Age': float,
+    'Gender': 'category',
+    'NDB': float,
+    'Valuation': float,
+    'Cost_Basis': float,
+    'Remaining_LE': float,
+}
+
+AMORTIZATION_FIELDS = {
+    'Month': 'datetime64[ns]',
+    'Repayment Number': float,
+    'Opening Balance': float,
+    'Loan Repayment': float,
+    'Interest Charged': float,
+    'Capital Repaid': float,
+    'Closing Balance': float,
+    'Payment Date': 'datetime64[ns]',
+    'Amount Paid': float,
+    'Notes': object,
+}
+
+LOAN_FIELDS = {
+    'Sheet': 'category',
+    'Borrower': 'category',
+    'Original Loan Balance': float,
+    'Annual Interest Rate': float,
+    'Loan Period (months)': float,
+    'Payment Amount': float,
+    'Loan Start Date': 'datetime64[ns]',
+    'Last Payment Amount': float,
+    'Notes': object,
+    'Is Interest Only': bool,
+    'Header Layout': 'category',
+    'Opening Loan Balance': float,
+    'Current Loan Balance': float,
+    'Total Principal Repaid': float,
+    'Total Interest Repaid': float,
+    'Maturity Date': 'datetime64[ns]',
+    'Status': 'category',
+}
+
+
+def parse_life_settlement_workbook(ls_file, messages=None, metrics=NULL_METRICS):
+    """Parse the LS workbook into policies, summary and premium stream (None if unusable)
+
+    `policies` is a DataFrame (Gender categorical) and `policy_premiums` a policies x months frame
+    indexed by Policy_ID; both are filled from preallocated columns rather than per-row dicts.
+    Status messages are appended to `messages` as (level, text) pairs, level being
+    'info', 'success', 'warning' or 'error'. Stage timings go to `metrics` (see rerun_metrics).
+    """
+    if messages is None:
+        messages = []
+    from openpyxl import load_workbook
+    with metrics.stage('LS workbook load'):
+        ls_wb = load_workbook(ls_file, data_only=True)
+    
+    # Debug: Show available sheet names
+    available_sheets = ls_wb.sheetnames
+    messages.append(('info', f'Available sheets in LS file: {available_sheets}'))
+    
+    # Validate that we have sheets
+    if not available_sheets:
+        messages.append(('error', 'No sheets found in the Excel file'))
+        return None
+    
+    # Check for both possible sheet names for the valuation data
+    valuation_sheet_name = None
+    if 'Valuation Summary' in ls_wb.sheetnames:
+        valuation_sheet_name = 'Valuation Summary'
+    elif 'PortfolioResult' in ls_wb.sheetnames:
+        valuation_sheet_name = 'PortfolioResult'
+    
+    if valuation_sheet_name is None:
+        messages.append(('error', 'Required valuation sheet not found. Expected: "Valuation Summary" or "PortfolioResult"'))
+        messages.append(('info', f'Available sheets: {available_sheets}'))
+        return None
+    
+    val_sheet = ls_wb[valuation_sheet_name]
+    
+    # Check for Premium Stream sheet (optional)
+    has_premium_stream = 'Premium Stream' in ls_wb.sheetnames
+    if has_premium_stream:
+        premium_sheet = ls_wb['Premium Stream']
+        messages.append(('success', f'✅ Using "{valuation_sheet_name}" sheet for valuation data'))
+        messages.append(('info', f'✅ Premium Stream sheet found - premium projections will be included'))
+    else:
+        premium_sheet = None
+        messages.append(('success', f'✅ Using "{valuation_sheet_name}" sheet for valuation data'))
+        messages.append(('warning', f'⚠️ Premium Stream sheet not found - only valuation data will be processed'))
+    
+    policies = RecordColumns(POLICY_FIELDS, capacity=200 - 3)
+    policies_start = time.perf_counter()
+    
+    for row in range(3, 200):
+        try:
+            policy_id_cell = val_sheet[f'B{row}']
+            if not policy_id_cell.value:
+                break
+        except Exception as e:
+            messages.append(('warning', f'Error reading row {row}: {str(e)}'))
+            continue
+            
+        try:
+            # Get NDB value first
+            ndb_cell_value = val_sheet[f'V{row}'].value
+            ndb_value = safe_float(str(ndb_cell_value or '0').replace('$', '').replace(',', ''))
+            
+            # If NDB is 0, check for Face Amount column (try common locations)
+            if ndb_value == 0:
+                # Try column W first (next to V)
+                face_cell_value = val_sheet[f'W{row}'].value
+                face_amount = safe_float(str(face_cell_value or '0').replace('$', '').replace(',', ''))
+                if face_amount == 0:
+                    # Try other possible columns for Face Amount
+                    for col in ['X', 'Y', 'U', 'T']:
+                        face_cell_value = val_sheet[f'{col}{row}'].value
+                        face_amount = safe_float(str(face_cell_value or '0').replace('$', '').replace(',', ''))
+                        if face_amount > 0:
+                            break
+                if face_amount > 0:
+                    ndb_value = face_amount
+            
+            policies.append((
+                str(policy_id_cell.value),
+                str(val_sheet[f'C{row}'].value or ''),
+                str(val_sheet[f'D{row}'].value or ''),
+                safe_float(val_sheet[f'F{row}'].value),
+                str(val_sheet[f'G{row}'].value or ''),
+                ndb_value,
+                safe_float(str(val_sheet[f'Z{row}'].value or '0').replace('$', '').replace(',', '')),
+                safe_float(str(val_sheet[f'AB{row}'].value or '0').replace('$', '').replace(',', '')),
+                safe_float(val_sheet[f'AC{row}'].value),
+            ))
+        except:
+            continue
+    
+    metrics.add_stage('LS policy parse', policies_start, rows=int(policies.size))
+    if policies.size == 0:
+        return None
+    policies = policies.frame()
+    
+    # Calculate summary statistics
+    total_policies = len(policies)
+    total_ndb = float(policies['NDB'].sum())
+    total_valuation = float(policies['Valuation'].sum())
+    total_cost_basis = float(policies['Cost_Basis'].sum())
+    
+    valid_ages = policies['Age'][policies['Age'] > 0]
+    avg_age = float(valid_ages.mean()) if len(valid_ages) else 0
+    
+    gender = policies['Gender'].astype(str).str.lower()
+    is_female = gender.str.contains('female', regex=False)
+    male_count = int((gender.str.contains('male', regex=False) & ~is_female).sum())
+    female_count = int(is_female.sum())
+    male_percentage = (male_count / (male_count + female_count)) * 100 if (male_count + female_count) > 0 else 0
+    
+    valid_les = policies['Remaining_LE'][policies['Remaining_LE'] > 0]
+    avg_remaining_le = float(valid_les.mean()) if len(valid_les) else 0
+    
+    # Process monthly premiums (only if Premium Stream sheet exists) into a policies x months frame
+    monthly_premiums = {}
+    policy_premiums = pd.DataFrame(dtype=float)
+    premiums_start = time.perf_counter()
+    
+    if has_premium_stream and premium_sheet:
+        month_columns = ['M', 'N', 'O', 'P', 'Q', 'R', 'S', 'T', 'U', 'V', 'W', 'X']
+        
+        month_headers = []
+        for col in month_columns:
+            header = premium_sheet[f'{col}2'].value
+            if header:
+                month_headers.append((col, str(header)))
+        
+        lyric_ids = []
+        premium_rows = []
+        for prem_row in range(3, len(policies) + 3):
+            lyric_id_cell = premium_sheet[f'B{prem_row}']
+            if lyric_id_cell.value:
+                lyric_ids.append(str(lyric_id_cell.value))
+                premium_rows.append(prem_row)
+        
+        premium_matrix = np.zeros((len(premium_rows), len(month_headers)))
+        for j, (col_letter, month_name) in enumerate(month_headers):
+            for i, prem_row in enumerate(premium_rows):
+                try:
+                    premium_cell = premium_sheet[f'{col_letter}{prem_row}']
+                    premium_matrix[i, j] = safe_float(premium_cell.value) if premium_cell.value else 0
+                except:
+                    continue
+            monthly_premiums[month_name] = float(premium_matrix[:, j].sum())
+        
+        policy_premiums = pd.DataFrame(premium_matrix, index=pd.Index(lyric_ids, name='Policy_ID'),
+                                       columns=[month_name for _, month_name in month_headers])
+        if policy_premiums.index.has_duplicates:
+            # A policy listed twice keeps its first position and its last row's premiums
+            policy_premiums = policy_premiums.groupby(level=0, sort=False).last()
+    metrics.add_stage('Premium stream parse', premiums_start, rows=int(policy_premiums.size))
+    
+    # Everything needed has been read; drop the cell graph before the summary is built
+    release_workbook(ls_wb)
+    ls_wb = val_sheet = premium_sheet = policy_id_cell = lyric_id_cell = premium_cell = None
+    
+    # Calculate policy-level metrics
+    annual_premium = policies['Policy_ID'].map(policy_premiums.sum(axis=1)).fillna(0.0).to_numpy(dtype=float)
+    ndb = policies['NDB'].to_numpy()
+    policies['Annual_Premium'] = annual_premium
+    policies['Premium_Pct_Face'] = np.divide(annual_premium * 100, ndb, out=np.zeros(len(ndb)), where=ndb > 0)
+    
+    total_annual_premiums = sum(monthly_premiums.values())
+    premiums_as_pct_face = (total_annual_premiums / total_ndb) * 100 if total_ndb > 0 else 0
+    
+    return {
+        'policies': policies,
+        'summary': {
+            'total_policies': total_policies,
+            'total_ndb': total_ndb,
+            'total_valuation': total_valuation,
+            'total_cost_basis': total_cost_basis,
+            'avg_age': avg_age,
+            'male_count': male_count,
+            'female_count': female_count,
+            'male_percentage': male_percentage,
+            'avg_remaining_le': avg_remaining_le,
+            'total_annual_premiums': total_annual_premiums,
+            'premiums_as_pct_face': premiums_as_pct_face,
+        },
+        'monthly_premiums': monthly_premiums,
+        'policy_premiums': policy_premiums
+    }
+
+
+# Last worksheet row parse_loan_sheet reads (the amortization table starts at row 11)
+LOAN_SHEET_ROWS = 99
+
+# Header block cells read from every loan sheet in one pass (A2:C7)
+HEADER_CELLS = [f'{column}{row}' for row in range(2, 8) for column in 'ABC']
+
+
+class HeaderLayout:
+    """One known arrangement of a loan sheet's header block: where each field lives and how to recognise it
+
+    `fields` maps 'amount', 'rate', 'period' and 'payment' to cells, and `date_cells` lists the start
+    date candidates in order of preference. A layout with a `label` (cell, word) only applies to
+    blocks whose label cell contains that word.
+    """
+
+    def __init__(self, name, fields, date_cells, label=None):
+        self.name = name
+        self.fields = fields
+        self.date_cells = date_cells
+        self.label = label
+
+    def score(self, cells):
+        """How well a header block fits: 2 for a matching label plus 1 for a positive amount (None if the label is missing)"""
+        score = 0
+        if self.label is not None:
+            label_cell, word = self.label
+            if not (isinstance(cells[label_cell], str) and word in cells[label_cell].lower()):
+                return None
+            score += 2
+        if safe_float(cells[self.fields['amount']]) > 0:
+            score += 1
+        return score
+
+    def start_date(self, cells):
+        """First candidate cell holding a real date, else the first holding a text date
+
+        A number in one of this layout's field cells is that field, not a date.
+        """
+        field_cells = set(self.fields.values())
+        for text_pass in (False, True):
+            for cell in self.date_cells:
+                value = cells[cell]
+                if not value or isinstance(value, str) != text_pass:
+                    continue
+                if cell in field_cells and isinstance(value, (int, float)):
+                    continue
+                loan_start = excel_date_to_datetime(value)
+                if pd.notna(loan_start):
+                    return loan_start
+        return pd.NaT
+
+
+HEADER_LAYOUTS = []
+
+
+def register_header_layout(layout):
+    """Add a layout for detect_header_layout to try; on equal scores the earlier registration wins"""
+    HEADER_LAYOUTS.append(layout)
+    return layout
+
+
+# Format 1: values in column B
+register_header_layout(HeaderLayout('Format 1', {'amount': 'B3', 'rate': 'B4', 'period': 'B5', 'payment': 'B6'},
+                                    date_cells=['B7', 'B6', 'C7', 'C6']))
+# Format 2: labels in column B (B3 reads like "Loan Principle Amount"), values in column C
+register_header_layout(HeaderLayout('Format 2', {'amount': 'C3', 'rate': 'C4', 'period': 'C5', 'payment': 'C6'},
+                                    date_cells=['C7', 'C6', 'B7', 'B6'], label=('B3', 'loan')))
+# Values in column C without the B3 label
+register_header_layout(HeaderLayout('Column C', {'amount': 'C3', 'rate': 'C4', 'period': 'C5', 'payment': 'C6'},
+                                    date_cells=['C7', 'C6', 'B7', 'B6']))
+
+
+def read_header_cells(sheet):
+    """Values of a loan sheet's header block (A2:C7), read once"""
+    return {cell: sheet[cell].value for cell in HEADER_CELLS}
+
+
+def detect_header_layout(cells):
+    """Best-scoring registered layout for a header block (the first registered if none scores)"""
+    best, best_score = HEADER_LAYOUTS[0], 0
+    for layout in HEADER_LAYOUTS:
+        score = layout.score(cells)
+        if score is not None and score > best_score:
+            best, best_score = layout, score
+    return best
+
+
+def parse_loan_header(sheet, sheet_name):
+    """Loan terms from one `#` sheet's header block (rows 2-7): borrower, amount, rate, period, payment, start date
+
+    The block is read once and matched against the registered header layouts; the layout used is
+    reported as 'Header Layout'.
+    """
+    cells = read_header_cells(sheet)
+    borrower = cells['B2'] if cells['B2'] is not None else cells['A2']
+    if borrower == "" or borrower is None:
+        borrower = f"Unknown ({sheet_name})"
+    
+    layout = detect_header_layout(cells)
+    loan_amount = safe_float(cells[layout.fields['amount']])
+    interest_rate = safe_float(cells[layout.fields['rate']])
+    loan_period = safe_float(cells[layout.fields['period']])
+    payment_amount_val = cells[layout.fields['payment']]
+    loan_start = layout.start_date(cells)
+    
+    # Handle payment amount
+    if isinstance(payment_amount_val, str) and payment_amount_val.lower() == 'interest only':
+        payment_amount = loan_amount * (interest_rate / 12)
+    else:
+        payment_amount = safe_float(payment_amount_val)
+    
+    # If still no payment amount, try from amortization table
+    if payment_amount == 0:
+        first_payment = safe_float(sheet['D11'].value)
+        if first_payment > 0:
+            payment_amount = first_payment
+    
+    # Check if loan is interest only
+    is_interest_only = False
+    if isinstance(payment_amount_val, str) and 'interest only' in payment_amount_val.lower():
+        is_interest_only = True
+    
+    # Basic loan information
+    loan_info = {
+        'Sheet': sheet_name,
+        'Borrower': borrower,
+        'Original Loan Balance': loan_amount,
+        'Annual Interest Rate': interest_rate,
+        'Loan Period (months)': loan_period,
+        'Payment Amount': payment_amount,
+        'Loan Start Date': loan_start,
+        'Last Payment Amount': 0,
+        'Notes': '',
+        'Is Interest Only': is_interest_only,
+        'Header Layout': layout.name,
+    }
+    return loan_info
+
+
+def parse_loan_sheet(sheet, sheet_name, as_of_date):
+    """Extract loan header fields and the amortization schedule from one `#` sheet (status is set by the caller)"""
+    loan_info = parse_loan_header(sheet, sheet_name)
+    
+    # Read amortization schedule
+    amort_data = RecordColumns(AMORTIZATION_FIELDS, capacity=LOAN_SHEET_ROWS - 10)
+    amort_rows = []
+    row = 11
+    
+    while row <= LOAN_SHEET_ROWS:
+        month_cell = sheet[f'A{row}']
+        if month_cell.value is None:
+            break
+            
+        # Skip header rows
+        opening_val = sheet[f'C{row}'].value
+        if isinstance(opening_val, str) and 'balance' in opening_val.lower():
+            row += 1
+            continue
+            
+        opening_balance = safe_float(sheet[f'C{row}'].value)
+        closing_balance = safe_float(sheet[f'G{row}'].value)
+        if opening_balance > 0 or closing_balance >= 0:
+            amort_data.append((
+                excel_date_to_datetime(month_cell.value),
+                safe_float(sheet[f'B{row}'].value),
+                opening_balance,
+                safe_float(sheet[f'D{row}'].value),
+                safe_float(sheet[f'E{row}'].value),
+                safe_float(sheet[f'F{row}'].value),
+                closing_balance,
+                excel_date_to_datetime(sheet[f'J{row}'].value),
+                safe_float(sheet[f'K{row}'].value),
+                str(sheet[f'L{row}'].value) if sheet[f'L{row}'].value and sheet[f'L{row}'].value != 'Notes' else '',
+            ))
+            amort_rows.append(row)
+        row += 1
+    
+    if amort_data.size:
+        # Index by worksheet row so integrity issues can point back at the sheet
+        amort_df = amort_data.frame(index=pd.Index(amort_rows, name='Row'))
+        
+        # Collect notes
+        all_notes = [note for note in amort_df['Notes'] if note and note.strip()]
+        if all_notes:
+            loan_info['Notes'] = '; '.join(all_notes)
+        
+        # Get the last payment amount
+        if pd.notna(as_of_date):
+            past_payments = amort_df[amort_df['Month'] <= as_of_date]
+            if not past_payments.empty:
+                last_payment = past_payments.iloc[-1]
+                loan_info['Last Payment Amount'] = last_payment['Loan Repayment'] if last_payment['Loan Repayment'] > 0 else last_payment['Amount Paid']
+        
+        # Find current position
+        if pd.notna(as_of_date) and 'Month' in amort_df.columns:
+            amort_df['Month'] = pd.to_datetime(amort_df['Month'])
+            current_rows = amort_df[amort_df['Month'] <= as_of_date]
+            if not current_rows.empty:
+                current_row = current_rows.iloc[-1]
+                first_row = amort_df.iloc[0]
+                
+                loan_info['Opening Loan Balance'] = first_row['Opening Balance']
+                loan_info['Current Loan Balance'] = current_row['Closing Balance']
+                loan_info['Total Principal Repaid'] = current_rows['Capital Repaid'].sum()
+                loan_info['Total Interest Repaid'] = current_rows['Interest Charged'].sum()
+                
+                # If capital repaid sum is 0, calculate from balance difference
+                if loan_info['Total Principal Repaid'] == 0:
+                    loan_info['Total Principal Repaid'] = loan_info['Opening Loan Balance'] - loan_info['Current Loan Balance']
+                    if loan_info['Total Principal Repaid'] < 0:
+                        loan_info['Total Principal Repaid'] = 0
+            else:
+                loan_info['Opening Loan Balance'] = loan_info['Original Loan Balance']
+                loan_info['Current Loan Balance'] = loan_info['Original Loan Balance']
+                loan_info['Total Principal Repaid'] = 0
+                loan_info['Total Interest Repaid'] = 0
+        else:
+            # Fallback to last available data
+            first_row = amort_df.iloc[0]
+            last_row = amort_df.iloc[-1]
+            
+            loan_info['Opening Loan Balance'] = first_row['Opening Balance']
+            loan_info['Current Loan Balance'] = last_row['Closing Balance']
+            loan_info['Total Principal Repaid'] = amort_df['Capital Repaid'].sum()
+            loan_info['Total Interest Repaid'] = amort_df['Interest Charged'].sum()
+            loan_info['Last Payment Amount'] = last_row['Loan Repayment'] if last_row['Loan Repayment'] > 0 else last_row['Amount Paid']
+            
+            if loan_info['Total Principal Repaid'] == 0:
+                loan_info['Total Principal Repaid'] = loan_info['Opening Loan Balance'] - loan_info['Current Loan Balance']
+                if loan_info['Total Principal Repaid'] < 0:
+                    loan_info['Total Principal Repaid'] = 0
+        
+        # Calculate maturity date
+        if pd.notna(loan_info['Loan Start Date']) and loan_info['Loan Period (months)'] > 0:
+            loan_info['Maturity Date'] = loan_info['Loan Start Date'] + relativedelta(months=int(loan_info['Loan Period (months)']))
+        else:
+            loan_info['Maturity Date'] = amort_df['Month'].iloc[-1] if not amort_df.empty else pd.NaT
+    else:
+        # No amortization data
+        amort_df = None
+        loan_info['Opening Loan Balance'] = loan_info['Original Loan Balance']
+        loan_info['Current Loan Balance'] = loan_info['Original Loan Balance']
+        loan_info['Total Principal Repaid'] = 0
+        loan_info['Total Interest Repaid'] = 0
+        
+        if pd.notna(loan_info['Loan Start Date']) and loan_info['Loan Period (months)'] > 0:
+            loan_info['Maturity Date'] = loan_info['Loan Start Date'] + relativedelta(months=int(loan_info['Loan Period (months)']))
+        else:
+            loan_info['Maturity Date'] = pd.NaT
+    
+    return loan_info, amort_df
+
+
+class LoanSheetCache:
+    """Thread-safe LRU of parse_loan_sheet results keyed by sheet name, raw-cell fingerprint and as-of date"""
+
+    def __init__(self, max_entries=5000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Cached (loan_info, amort_df) for a key, or None"""
+        with self._lock:
+            parsed = self._entries.get(key)
+            if parsed is not None:
+                self._entries.move_to_end(key)
+            return parsed
+
+    def put(self, key, parsed):
+        """Store a parse result, evicting the least recently used entries beyond max_entries"""
+        with self._lock:
+            self._entries[key] = parsed
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+def sheet_fingerprint(block):
+    """SHA-256 over the raw values of a SheetBlock (A1:L99 for the block parse_loan_sheet reads)"""
+    digest = hashlib.sha256()
+    for row in block.rows:
+        digest.update(repr(row).encode())
+    return digest.hexdigest()
+
+
+def dataset_nbytes(obj, _seen=None):
+    """Approximate memory held by a parsed dataset (frames, arrays, dicts and lists of them), counting shared objects once"""
+    seen = set() if _seen is None else _seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        usage = obj.memory_usage(deep=True, index=True)
+        return int(usage.sum()) if isinstance(obj, pd.DataFrame) else int(usage)
+    if hasattr(obj, 'nbytes'):
+        return int(obj.nbytes)
+    if isinstance(obj, dict):
+        return sum(dataset_nbytes(k, seen) + dataset_nbytes(v, seen) for k, v in obj.items())
+    if isinstance(obj, (list, tuple, set)):
+        return sum(dataset_nbytes(item, seen) for item in obj)
+    return sys.getsizeof(obj)
+
+
+class DatasetLease:
+    """One session's reference to a shared parsed dataset; released on release() or when garbage collected"""
+
+    def __init__(self, cache, key, value):
+        self.key = key
+        self.value = value
+        self._finalizer = weakref.finalize(self, cache._release, key)
+
+    def release(self):
+        """Drop this reference (idempotent)"""
+        self._finalizer()
+
+
+class DatasetCache:
+    """Thread-safe, reference-counted LRU of parsed datasets keyed by file content, within a memory budget
+
+    Sessions opening the same file share one parsed dataset, which must be treated as read-only.
+    Datasets still leased by a session are never evicted; unleased ones are evicted least recently
+    used first once the total exceeds `max_bytes`.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._building = {}
+        # Re-entrant: a lease garbage collected while the lock is held releases itself on the same thread
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def lease(self, key, build):
+        """DatasetLease for `key`, calling `build()` once if no session has it; returns (lease, was_cached)"""
+        with self._lock:
+            lease = self._acquire(key)
+            if lease is not None:
+                return lease, True
+            key_lock = self._building.setdefault(key, threading.Lock())
+        # Build outside the cache lock; concurrent sessions opening the same file wait for one build
+        with key_lock:
+            with self._lock:
+                lease = self._acquire(key)
+                if lease is not None:
+                    return lease, True
+            try:
+                value = build()
+                nbytes = dataset_nbytes(value)
+            except BaseException:
+                with self._lock:
+                    self._building.pop(key, None)
+                raise
+            # The entry goes in under the same lock hold that retires the build lock, so a caller arriving
+            # in between cannot miss both and start a second build
+            with self._lock:
+                self._building.pop(key, None)
+                self.misses += 1
+                self._entries[key] = {'value': value, 'nbytes': nbytes, 'refs': 1}
+                self._evict()
+                return DatasetLease(self, key, value), False
+
+    def get(self, key):
+        """DatasetLease for `key` if it is cached, else None (never builds)"""
+        with self._lock:
+            return self._acquire(key)
+
+    def _acquire(self, key):
+        """New lease on a cached entry, or None (caller holds the lock)"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        entry['refs'] += 1
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return DatasetLease(self, key, entry['value'])
+
+    def _release(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry['refs'] -= 1
+                self._evict()
+
+    def _evict(self):
+        """Drop unleased entries, oldest first, until within budget (caller holds the lock)"""
+        total = sum(entry['nbytes'] for entry in self._entries.values())
+        for key in list(self._entries):
+            if total <= self.max_bytes:
+                break
+            entry = self._entries.get(key)
+            if entry is not None and entry['refs'] <= 0:
+                total -= entry['nbytes']
+                del self._entries[key]
+                self.evictions += 1
+
+    def nbytes(self, key):
+        """Estimated size of a cached dataset (0 once evicted)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry['nbytes'] if entry is not None else 0
+
+    def stats(self):
+        """Entry count, bytes held, leased entries and hit/miss/eviction counters"""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': sum(entry['nbytes'] for entry in self._entries.values()),
+                'max_bytes': self.max_bytes,
+                'leased': sum(1 for entry in self._entries.values() if entry['refs'] > 0),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+class ParseCancelled(Exception):
+    """Raised inside a parse whose ParseProgress was cancelled"""
+
+
+class ParseProgress:
+    """Progress of one parse, readable from other threads: Dashboard sheet fields, sheets done, cancellation
+
+    `as_of_date` and `loan_sheets` are set as soon as the workbook is open, before any loan sheet
+    is read. `preview` follows once every sheet's header block is read: a loans frame with balances
+    estimated from the loan terms (see estimate_loan_position), ahead of the full schedules.
+    """
+
+    def __init__(self):
+        self.as_of_date = None
+        self.loan_sheets = None
+        self.preview = None
+        self.done = 0
+        self._cancelled = threading.Event()
+
+    def started(self, as_of_date, loan_sheets):
+        """Publish the Dashboard sheet fields; the header scan starts next"""
+        self.as_of_date = as_of_date
+        self.loan_sheets = loan_sheets
+
+    def previewed(self, loans_df):
+        """Publish the loans frame estimated from the header blocks; schedule extraction starts next"""
+        self.preview = loans_df
+
+    def advance(self):
+        """Count one more loan sheet extracted"""
+        self.done += 1
+
+    def cancel(self):
+        """Ask the parse to stop at the next sheet"""
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    @property
+    def fraction(self):
+        """Share of loan sheets extracted so far (0 until the workbook is open)"""
+        return self.done / len(self.loan_sheets) if self.loan_sheets else 0.0
+
+
+class ParseJob:
+    """A parse submitted to BackgroundParser: its future, progress and the number of sessions waiting on it"""
+
+    def __init__(self, key, future, progress):
+        self.key = key
+        self.future = future
+        self.progress = progress
+        self.watchers = 1
+
+    def done(self):
+        return self.future.done()
+
+    def result(self):
+        """The parse result (re-raises the parse's exception, or ParseCancelled)"""
+        return self.future.result()
+
+
+class BackgroundParser:
+    """Runs workbook parses on worker threads, one job per key; callers asking for a running key share its job
+
+    A job is cancelled once every caller waiting on it has let go (see `cancel`), e.g. because the
+    upload was replaced by another file.
+    """
+
+    def __init__(self, max_workers=2):
+        from concurrent.futures import ThreadPoolExecutor
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='sirocco-parse')
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key, parse):
+        """ParseJob running `parse(progress)` for `key`, joining the running job for that key if there is one"""
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None and not job.progress.cancelled:
+                job.watchers += 1
+                return job
+            progress = ParseProgress()
+            job = ParseJob(key, self._executor.submit(parse, progress), progress)
+            self._jobs[key] = job
+        job.future.add_done_callback(lambda _: self._forget(job))
+        return job
+
+    def cancel(self, job):
+        """Stop waiting on a job; the parse itself is cancelled when nobody else is waiting on it"""
+        with self._lock:
+            job.watchers -= 1
+            if job.watchers <= 0 and not job.done():
+                job.progress.cancel()
+                self._jobs.pop(job.key, None)
+
+    def _forget(self, job):
+        with self._lock:
+            if self._jobs.get(job.key) is job:
+                del self._jobs[job.key]
+
+    def running(self):
+        """Number of jobs not finished yet"""
+        with self._lock:
+            return len(self._jobs)
+
+
+def estimate_loan_position(loan_info, as_of_date):
+    """A loan header's balances, repayments and maturity worked out from its terms alone, without the schedule
+
+    Assumes the layout the sheets use: one repayment a month starting a month after the start date,
+    level payments (interest only loans repay the principal with the last one). A missing as-of date
+    counts the whole term as repaid, like parse_loan_sheet's fallback to the last schedule row.
+    """
+    loan_info = dict(loan_info)
+    amount = loan_info['Original Loan Balance']
+    monthly_rate = loan_info['Annual Interest Rate'] / 12
+    period = int(loan_info['Loan Period (months)'])
+    start = loan_info['Loan Start Date']
+    
+    if pd.isna(as_of_date):
+        repayments = period
+    elif pd.notna(start):
+        elapsed = relativedelta(pd.Timestamp(as_of_date), pd.Timestamp(start))
+        repayments = min(max(elapsed.years * 12 + elapsed.months, 0), period)
+    else:
+        repayments = 0
+    
+    if repayments >= period:
+        balance = 0.0
+    elif loan_info['Is Interest Only']:
+        balance = amount
+    elif monthly_rate > 0:
+        growth = (1 + monthly_rate) ** repayments
+        balance = amount * growth - loan_info['Payment Amount'] * (growth - 1) / monthly_rate
+    else:
+        balance = amount - loan_info['Payment Amount'] * repayments
+    balance = min(max(balance, 0.0), amount)
+    
+    principal = amount - balance
+    if loan_info['Is Interest Only']:
+        interest = amount * monthly_rate * repayments
+    else:
+        interest = max(loan_info['Payment Amount'] * repayments - principal, 0.0)
+    
+    loan_info['Opening Loan Balance'] = amount
+    loan_info['Current Loan Balance'] = balance
+    loan_info['Total Principal Repaid'] = principal
+    loan_info['Total Interest Repaid'] = interest
+    loan_info['Last Payment Amount'] = loan_info['Payment Amount'] if repayments > 0 else 0
+    if pd.notna(start) and period > 0:
+        loan_info['Maturity Date'] = start + relativedelta(months=period)
+    else:
+        loan_info['Maturity Date'] = pd.NaT
+    return loan_info
+
+
+def build_loans_frame(loan_infos, today=None):
+    """Loans frame (LOAN_FIELDS) of the loans with an original balance, with their status, laid out in status order
+
+    Laying the rows out in status order makes the status partitions row slices (see split_loans_by_status).
+    """
+    today = pd.Timestamp.now() if today is None else pd.Timestamp(today)
+    loans = RecordColumns(LOAN_FIELDS, capacity=len(loan_infos))
+    for loan_info in loan_infos:
+        if loan_info['Original Loan Balance'] <= 0:
+            continue
+        loan_info = dict(loan_info)
+        
+        # Check status
+        if pd.notna(loan_info['Loan Start Date']):
+            loan_start_timestamp = pd.Timestamp(loan_info['Loan Start Date'])
+            if loan_start_timestamp > today:
+                loan_info['Status'] = 'Not Started'
+                loan_info['Current Loan Balance'] = 0
+                loan_info['Opening Loan Balance'] = 0
+            elif loan_info['Current Loan Balance'] == 0:
+                loan_info['Status'] = 'Closed'
+            else:
+                loan_info['Status'] = 'Active'
+        else:
+            loan_info['Status'] = 'Active' if loan_info['Current Loan Balance'] > 0 else 'Closed'
+        
+        # Add Interest Only indicator to notes
+        if loan_info['Is Interest Only']:
+            if loan_info['Notes']:
+                loan_info['Notes'] = 'Interest Only; ' + loan_info['Notes']
+            else:
+                loan_info['Notes'] = 'Interest Only'
+        
+        loans.append([loan_info[name] for name in LOAN_FIELDS])
+    
+    loans_df = loans.frame()
+    if len(loans_df) > 0:
+        loans_df = loans_df.take(np.concatenate(status_partition_positions(loans_df))).reset_index(drop=True)
+    return loans_df
+
+
+def process_master_workbook(master_file, sheet_cache=None, metrics=NULL_METRICS, progress=None):
+    """Parse the Master workbook into the loans frame and per-loan amortization schedules
+
+    With a `LoanSheetCache`, sheets whose raw cells are unchanged since an earlier parse are reused.
+    Stage timings and sheet cache hits go to `metrics` (see rerun_metrics). A `ParseProgress` gets the
+    Dashboard sheet fields as soon as the workbook is open, then a loans frame estimated from every
+    sheet's header block, then a count per sheet as the schedules are read; cancelling it stops the
+    parse with ParseCancelled before the next sheet. Without one the header scan is skipped.
+    """
+    preview = progress is not None
+    progress = ParseProgress() if progress is None else progress
+    # Load workbook (openpyxl is imported on first use so the landing page never pays for it).
+    # Read-only mode streams each sheet's rows when asked rather than building every cell up front.
+    from openpyxl import load_workbook
+    with metrics.stage('Master workbook load'):
+        wb = load_workbook(master_file, read_only=True, data_only=True)
+    
+    # Get all loan sheets (sheets starting with '#')
+    loan_sheets = [s for s in wb.sheetnames if s.startswith('#') and s != '#AddSheet']
+    
+    # Get as-of date from Dashboard
+    as_of_date = SheetBlock.read(wb['Dashboard'], 3, 5)['E3'].value
+    if isinstance(as_of_date, str):
+        as_of_date = pd.to_datetime(as_of_date)
+    elif isinstance(as_of_date, (int, float)):
+        as_of_date = excel_date_to_datetime(as_of_date)
+    
+    progress.started(as_of_date, loan_sheets)
+    
+    # Tier one: the header blocks alone are enough for the sidebar and summary figures. Each sheet is
+    # read whole here and kept for tier two, so no sheet is streamed twice.
+    blocks = {}
+    if preview:
+        with metrics.stage('Loan header scan', rows=len(loan_sheets)):
+            headers = []
+            for sheet_name in loan_sheets:
+                if progress.cancelled:
+                    wb.close()
+                    raise ParseCancelled()
+                blocks[sheet_name] = SheetBlock.read(wb[sheet_name], LOAN_SHEET_ROWS)
+                headers.append(parse_loan_header(blocks[sheet_name], sheet_name))
+            progress.previewed(build_loans_frame([estimate_loan_position(header, as_of_date) for header in headers]))
+    
+    # Tier two: every sheet's amortization schedule (keep existing logic)
+    loan_infos = []
+    loan_details = {}
+    loan_schedules = {}
+    
+    reparsed_sheets = []
+    extract_start = time.perf_counter()
+    
+    for sheet_name in loan_sheets:
+        if progress.cancelled:
+            wb.close()
+            raise ParseCancelled()
+        sheet = blocks.pop(sheet_name, None) or SheetBlock.read(wb[sheet_name], LOAN_SHEET_ROWS)
+        
+        # Sheets whose cells are unchanged since an earlier upload reuse that parse
+        parsed = None
+        if sheet_cache is not None:
+            cache_key = (sheet_name, sheet_fingerprint(sheet), str(as_of_date))
+            parsed = sheet_cache.get(cache_key)
+        if parsed is None:
+            parsed = parse_loan_sheet(sheet, sheet_name, as_of_date)
+            reparsed_sheets.append(sheet_name)
+            if sheet_cache is not None:
+                sheet_cache.put(cache_key, parsed)
+        loan_info, amort_df = parsed
+        if amort_df is not None:
+            loan_details[loan_info['Borrower']] = amort_df
+            loan_schedules[sheet_name] = amort_df
+        loan_infos.append(loan_info)
+        progress.advance()
+    
+    metrics.add_stage('Loan sheet extraction', extract_start, rows=len(loan_sheets))
+    if sheet_cache is not None:
+        metrics.count_cache('Loan sheets', hits=len(loan_sheets) - len(reparsed_sheets), misses=len(reparsed_sheets))
+    
+    # A read-only workbook keeps the file open until it is closed
+    wb.close()
+    wb = sheet = None
+    
+    # Create main dataframe from the loan records, in status order so the status partitions are row slices
+    loans_df = build_loans_frame(loan_infos)
+    with metrics.stage('Schedule frame build') as record:
+        schedule_df = build_schedule_frame(loan_schedules)
+        record['rows'] = len(schedule_df)
+    
+    return {
+        'as_of_date': as_of_date,
+        'loan_sheets': loan_sheets,
+        'loans_df': loans_df,
+        'loan_details': loan_details,
+        'loan_schedules': loan_schedules,
+        'schedule_df': schedule_df,
+        'reparsed_sheets': reparsed_sheets,
+    }
+
+
+# Display order within each status partition: (status, sort column, ascending)
+STATUS_PARTITIONS = [
+    ('Active', 'Current Loan Balance', False),
+    ('Closed', 'Original Loan Balance', False),
+    ('Not Started', 'Loan Start Date', True),
+]
+
+
+def status_partition_positions(loans_df):
+    """Row positions of the active, closed and not-started loans (one row per sheet), each in display order"""
+    positions = []
+    frame = loans_df.reset_index(drop=True)
+    for status, column, ascending in STATUS_PARTITIONS:
+        part = frame[frame['Status'] == status].drop_duplicates(subset=['Sheet'])
+        positions.append(part.sort_values(column, ascending=ascending).index.to_numpy())
+    return positions
+
+
+def split_loans_by_status(loans_df):
+    """Active, closed and not-started loans (one row per sheet), each in display order
+
+    process_master_workbook lays loans_df out in this order already, so the three parts are
+    row slices (views) of it; any other frame, e.g. from an older snapshot, gets copies.
+    """
+    positions = status_partition_positions(loans_df)
+    if np.array_equal(np.concatenate(positions), np.arange(len(loans_df))):
+        bounds = np.cumsum([0] + [len(part) for part in positions])
+        return tuple(loans_df.iloc[start:stop] for start, stop in zip(bounds[:-1], bounds[1:]))
+    return tuple(loans_df.take(part) for part in positions)
+
+
+def portfolio_summary(loans_df, today=None):
+    """Headline portfolio figures: loan counts, balances, collections, rate, maturity and age"""
+    today = pd.Timestamp.now() if today is None else pd.Timestamp(today)
+    active_loans, closed_loans, not_started_loans = split_loans_by_status(loans_df)
+    
+    total_repaid_principal = loans_df['Total Principal Repaid'].sum()
+    total_repaid_interest = loans_df['Total Interest Repaid'].sum()
+    summary = {
+        'active_loans': len(active_loans),
+        'closed_loans': len(closed_loans),
+        'not_started_loans': len(not_started_loans),
+        'total_loans': len(loans_df),
+        'total_original': loans_df['Original Loan Balance'].sum(),
+        'active_orig_balance': active_loans['Original Loan Balance'].sum(),
+        'active_current_balance': active_loans['Current Loan Balance'].sum(),
+        'total_repaid_principal': total_repaid_principal,
+        'total_repaid_interest': total_repaid_interest,
+        'total_collected': total_repaid_principal + total_repaid_interest,
+        'weighted_avg_rate': 0,
+        'amortizing_loans': int((~active_loans['Is Interest Only'].astype(bool)).sum()),
+        'interest_only_loans': int(active_loans['Is Interest Only'].astype(bool).sum()),
+        'avg_months_to_maturity': 0,
+        'avg_months_since_start': 0,
+    }
+    
+    # Weighted average interest rate excludes loans with unusually high rates (>30%, e.g. the opportunity fund)
+    reasonable_rate_loans = active_loans[active_loans['Annual Interest Rate'] <= 0.30]
+    if reasonable_rate_loans['Original Loan Balance'].sum() > 0:
+        summary['weighted_avg_rate'] = ((reasonable_rate_loans['Original Loan Balance'] * reasonable_rate_loans['Annual Interest Rate']).sum()
+                                        / reasonable_rate_loans['Original Loan Balance'].sum())
+    
+    # Average months to maturity and since start (30.44 days per month)
+    maturity_dates = pd.to_datetime(active_loans['Maturity Date'])
+    valid_maturities = maturity_dates[maturity_dates > today]
+    if len(valid_maturities) > 0:
+        summary['avg_months_to_maturity'] = (valid_maturities - today).dt.days.mean() / 30.44
+    start_dates = pd.to_datetime(active_loans['Loan Start Date'])
+    valid_start_dates = start_dates[start_dates <= today]
+    if len(valid_start_dates) > 0:
+        summary['avg_months_since_start'] = (today - valid_start_dates).dt.days.mean() / 30.44
+    summary['avg_years_to_maturity'] = summary['avg_months_to_maturity'] / 12
+    summary['avg_years_since_start'] = summary['avg_months_since_start'] / 12
+    return summary
+
+
+CASHFLOW_COLUMNS = ['Borrower', 'Payment Date', 'Payment Amount', 'Interest', 'Principal', 'Type']
+
+
+def loan_cashflows(loan_details, skip_borrowers=(), today=None, months_back=3, months_forward=12):
+    """Scheduled repayments per borrower over the past `months_back` months (Historical) and next `months_forward` (Forward-Looking)"""
+    today = datetime.now() if today is None else today
+    frames = []
+    for borrower, amort_df in loan_details.items():
+        if borrower in skip_borrowers:
+            continue
+        if 'Month' not in amort_df.columns or 'Loan Repayment' not in amort_df.columns:
+            continue
+        
+        months = pd.to_datetime(amort_df['Month'])
+        windows = [
+            ('Historical', (months <= today) & (months >= today - relativedelta(months=months_back))),
+            ('Forward-Looking', (months > today) & (months <= today + relativedelta(months=months_forward))),
+        ]
+        for cashflow_type, in_window in windows:
+            rows = amort_df[in_window]
+            frames.append(pd.DataFrame({
+                'Borrower': borrower,
+                'Payment Date': pd.to_datetime(rows['Month']).to_numpy(),
+                'Payment Amount': rows['Loan Repayment'].to_numpy(),
+                'Interest': rows['Interest Charged'].to_numpy() if 'Interest Charged' in rows else 0,
+                'Principal': rows['Capital Repaid'].to_numpy() if 'Capital Repaid' in rows else 0,
+                'Type': cashflow_type,
+            }))
+    if not frames:
+        return pd.DataFrame(columns=CASHFLOW_COLUMNS)
+    return pd.concat(frames, ignore_index=True)
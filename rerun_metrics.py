@@ -0,0 +1,178 @@
+"""Per-rerun stage timings and cache hit/miss counts for the dashboard.
+
+A `RerunMetrics` is started at the top of every script run. Hot paths wrap
+themselves in `metrics.stage(name, rows)`. Calls to cached functions go
+through `metrics.cached(name)`, and the cached function body calls
+`cache_miss(name)`; a call counts as a hit unless the body ran. When the run
+finishes, the record is shown in the diagnostics panel and appended as one
+JSON line to a size-rotated log, so a slow rerun in production can be traced
+back to the section that caused it. The log path comes from
+SIROCCO_METRICS_LOG (default logs/rerun_metrics.jsonl; empty turns it off).
+Only the standard library is imported, so the headless parsers can accept a
+metrics object too.
+"""
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+
+METRICS_LOG = os.environ.get('SIROCCO_METRICS_LOG', os.path.join('logs', 'rerun_metrics.jsonl'))
+
+# Rotate the log at 1 MB and keep three old files
+LOG_MAX_BYTES = 1_000_000
+LOG_BACKUP_COUNT = 3
+
+_active = threading.local()
+
+
+def _row_count(rows):
+    """A stage's row count as a plain int (callers may pass NumPy integers), or None"""
+    return None if rows is None else int(rows)
+
+
+def _json_default(value):
+    """Make NumPy scalars (anything with .item()) serialisable without importing NumPy; fall back to str"""
+    item = getattr(value, 'item', None)
+    return item() if callable(item) else str(value)
+
+
+class RerunMetrics:
+    """Wall time, rows processed and cache hits/misses for each stage of one script run"""
+
+    def __init__(self):
+        self.started = datetime.now()
+        self._start = time.perf_counter()
+        self.stages = []
+        self.cache = {}
+        self.memory = {}
+
+    def activate(self):
+        """Make this the current run's metrics for cache_miss() calls on this thread"""
+        _active.metrics = self
+        return self
+
+    @contextmanager
+    def stage(self, name, rows=None):
+        """Time the enclosed block; set record['rows'] inside it when the count is only known afterwards"""
+        record = {'stage': name, 'ms': 0.0, 'rows': rows}
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['ms'] = (time.perf_counter() - start) * 1000
+            record['rows'] = _row_count(record['rows'])
+            self.stages.append(record)
+
+    def add_stage(self, name, start, rows=None):
+        """Record a stage that began at perf_counter() value `start` and ends now"""
+        self.stages.append({'stage': name, 'ms': (time.perf_counter() - start) * 1000, 'rows': _row_count(rows)})
+
+    @contextmanager
+    def cached(self, name, rows=None):
+        """Time a call to a cached function; it is a hit unless the function body called cache_miss(name)"""
+        counts = self.cache.setdefault(name, {'hits': 0, 'misses': 0})
+        misses = counts['misses']
+        with self.stage(name, rows) as record:
+            yield record
+        if counts['misses'] == misses:
+            counts['hits'] += 1
+
+    def count_cache(self, name, hits=0, misses=0):
+        """Add hit/miss counts for a cache that reports them itself (e.g. the loan sheet cache)"""
+        counts = self.cache.setdefault(name, {'hits': 0, 'misses': 0})
+        counts['hits'] += hits
+        counts['misses'] += misses
+
+    def absorb(self, other):
+        """Add the stages and cache counts of work recorded elsewhere (e.g. a parse on a worker thread)"""
+        self.stages.extend(other.stages)
+        for name, counts in other.cache.items():
+            self.count_cache(name, counts['hits'], counts['misses'])
+
+    def record_memory(self, name, nbytes):
+        """Note how many bytes something held at the end of the run"""
+        self.memory[name] = int(nbytes)
+
+    @property
+    def total_ms(self):
+        """Milliseconds since the run started"""
+        return (time.perf_counter() - self._start) * 1000
+
+    def as_record(self):
+        """The run as a JSON-serialisable dict"""
+        return {
+            'time': self.started.isoformat(timespec='seconds'),
+            'total_ms': round(self.total_ms, 1),
+            'stages': [dict(record, ms=round(record['ms'], 2)) for record in self.stages],
+            'cache': self.cache,
+            'memory': self.memory,
+        }
+
+
+class _NullMetrics:
+    """Stand-in used when a caller does not collect metrics"""
+
+    @contextmanager
+    def stage(self, name, rows=None):
+        yield {'stage': name, 'ms': 0.0, 'rows': rows}
+
+    cached = stage
+
+    def add_stage(self, name, start, rows=None):
+        pass
+
+    def count_cache(self, name, hits=0, misses=0):
+        pass
+
+
+NULL_METRICS = _NullMetrics()
+
+
+def cache_miss(name):
+    """Record that a cached function's body ran (call it first thing inside the cached function)"""
+    metrics = getattr(_active, 'metrics', None)
+    if metrics is not None:
+        metrics.count_cache(name, misses=1)
+
+
+def process_rss_bytes():
+    """Resident memory of this process: current on Linux, the peak elsewhere, None where unknown"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError, IndexError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def metrics_logger(path=METRICS_LOG):
+    """Logger writing one JSON line per rerun to a size-rotated file (created on first use)"""
+    logger = logging.getLogger('sirocco.rerun_metrics')
+    if not logger.handlers:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        handler = RotatingFileHandler(path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+    return logger
+
+
+def write_metrics(metrics, path=METRICS_LOG):
+    """Append the run's record to the metrics log (an empty path turns logging off)"""
+    if not path:
+        return
+    metrics_logger(path).info(json.dumps(metrics.as_record(), default=_json_default))
@@ -0,0 +1,288 @@
+"""On-disk snapshots of parsed portfolio data.
+
+Each snapshot is a directory named `<as-of date>_<digest>` holding the loans
+and LS policy frames as uncompressed NumPy `.npz` column files, plus a small
+`meta.json`. The concatenated amortization rows are stored one `.npy` file per
+column and the premium stream as a policies x months `.npy` matrix, so both can
+be memory-mapped: history queries page in only the row ranges they touch, and
+every session in the process shares the same mapped pages. Opening a snapshot
+needs only NumPy/pandas, never openpyxl.
+"""
+import functools
+import hashlib
+import json
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+SNAPSHOT_DIR = os.environ.get('SIROCCO_SNAPSHOT_DIR', 'snapshots')
+
+META_FILE = 'meta.json'
+
+# Bumped whenever the on-disk layout changes; snapshots in other formats are not listed
+SNAPSHOT_FORMAT = 2
+
+# Label columns stored as strings on disk and restored as categoricals, as the parsers build them
+CATEGORY_COLUMNS = {
+    'loans': ['Sheet', 'Borrower', 'Status', 'Header Layout'],
+    'policies': ['Gender'],
+}
+
+
+def file_digest(*uploaded_files):
+    """SHA-256 over the raw bytes of one or more uploaded files (None entries are skipped)"""
+    digest = hashlib.sha256()
+    for uploaded in uploaded_files:
+        if uploaded is None:
+            continue
+        if hasattr(uploaded, 'getvalue'):
+            digest.update(uploaded.getvalue())
+        else:
+            position = uploaded.tell()
+            digest.update(uploaded.read())
+            uploaded.seek(position)
+    return digest.hexdigest()
+
+
+def snapshot_key(as_of_date, digest):
+    """Directory name for a snapshot: as-of date plus a short content digest"""
+    date_part = pd.Timestamp(as_of_date).strftime('%Y-%m-%d') if pd.notna(as_of_date) else 'undated'
+    return f"{date_part}_{digest[:12]}"
+
+
+def _column_array(values):
+    """NumPy array for one column (object columns become datetimes or unicode strings, never pickled objects)"""
+    if values.dtype == object and pd.api.types.infer_dtype(values, skipna=True) in ('datetime', 'datetime64', 'date'):
+        return pd.to_datetime(values).to_numpy()
+    if values.dtype == object or isinstance(values.dtype, pd.CategoricalDtype):
+        return values.astype(object).fillna('').astype(str).to_numpy(dtype=str)
+    return values.to_numpy()
+
+
+def save_frame(path, df):
+    """Write a DataFrame as one NumPy array per column"""
+    arrays = {'__columns__': np.array(df.columns, dtype=str)}
+    for i, col in enumerate(df.columns):
+        arrays[f'c{i}'] = _column_array(df[col])
+    np.savez(path, **arrays)
+
+
+def load_frame(path, columns=None):
+    """Read a DataFrame written by save_frame (only the requested columns are decompressed)"""
+    with np.load(path, allow_pickle=False) as arrays:
+        stored = arrays['__columns__'].tolist()
+        wanted = stored if columns is None else [col for col in columns if col in stored]
+        return pd.DataFrame({col: arrays[f'c{stored.index(col)}'] for col in wanted}, columns=wanted)
+
+
+def save_columns(directory, df):
+    """Write a DataFrame as one `.npy` file per column so each column can be memory-mapped"""
+    os.makedirs(directory, exist_ok=True)
+    for i, col in enumerate(df.columns):
+        np.save(os.path.join(directory, f'c{i}.npy'), _column_array(df[col]))
+    with open(os.path.join(directory, 'columns.json'), 'w') as f:
+        json.dump([str(col) for col in df.columns], f)
+
+
+def map_columns(directory):
+    """Memory-map every column written by save_columns (read-only)"""
+    with open(os.path.join(directory, 'columns.json')) as f:
+        columns = json.load(f)
+    return {col: np.load(os.path.join(directory, f'c{i}.npy'), mmap_mode='r') for i, col in enumerate(columns)}
+
+
+def _json_default(value):
+    """Make NumPy scalars and timestamps JSON serialisable"""
+    if isinstance(value, (np.integer, np.floating)):
+        return value.item()
+    if isinstance(value, (pd.Timestamp, datetime)):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialise {type(value).__name__}")
+
+
+def save_snapshot(master_data, ls_data, digest, root=SNAPSHOT_DIR):
+    """Persist parsed master (and optional LS) data; returns the snapshot path (existing snapshots are reused)"""
+    path = os.path.join(root, snapshot_key(master_data['as_of_date'], digest))
+    if os.path.exists(os.path.join(path, META_FILE)):
+        return path
+    os.makedirs(path, exist_ok=True)
+
+    save_frame(os.path.join(path, 'loans.npz'), master_data['loans_df'])
+
+    # Amortization rows of one loan are contiguous; the offset index maps each sheet to its row range
+    schedule_df = master_data['schedule_df']
+    save_columns(os.path.join(path, 'schedules'), schedule_df)
+    sheets = schedule_df['Sheet'].to_numpy(dtype=str)
+    starts = np.flatnonzero(np.r_[True, sheets[1:] != sheets[:-1]]) if len(sheets) else np.array([], dtype=np.int64)
+    np.savez(os.path.join(path, 'schedule_index.npz'), sheets=sheets[starts],
+             starts=starts, stops=np.append(starts[1:], len(sheets)))
+
+    # loan_details is keyed by borrower and schedules by sheet; keep the mapping between the two
+    sheet_by_schedule = {id(schedule): sheet for sheet, schedule in master_data['loan_schedules'].items()}
+    sheet_borrowers = {sheet_by_schedule[id(amort_df)]: borrower
+                       for borrower, amort_df in master_data['loan_details'].items()}
+
+    meta = {
+        'key': os.path.basename(path),
+        'digest': digest,
+        'as_of_date': master_data['as_of_date'] if pd.notna(master_data['as_of_date']) else None,
+        'created': datetime.now(),
+        'loan_sheets': master_data['loan_sheets'],
+        'sheet_borrowers': sheet_borrowers,
+        'has_ls': ls_data is not None,
+        'format': SNAPSHOT_FORMAT,
+    }
+    if ls_data is not None:
+        save_frame(os.path.join(path, 'policies.npz'), ls_data['policies'])
+        # Premium stream as a policies x months matrix
+        premiums = ls_data['policy_premiums']
+        np.save(os.path.join(path, 'premiums.npy'), premiums.to_numpy(dtype=float))
+        np.savez(os.path.join(path, 'premium_index.npz'), policies=premiums.index.to_numpy(dtype=str),
+                 months=premiums.columns.to_numpy(dtype=str))
+        meta['ls_summary'] = ls_data['summary']
+        meta['monthly_premiums'] = ls_data['monthly_premiums']
+
+    # meta.json is written last so a half-written snapshot is never listed
+    with open(os.path.join(path, META_FILE), 'w') as f:
+        json.dump(meta, f, default=_json_default)
+    return path
+
+
+def list_snapshots(root=SNAPSHOT_DIR):
+    """Metadata of every complete snapshot, newest as-of date first"""
+    if not os.path.isdir(root):
+        return []
+    snapshots = []
+    for name in os.listdir(root):
+        meta_path = os.path.join(root, name, META_FILE)
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if meta.get('format') != SNAPSHOT_FORMAT:
+                continue
+            meta['path'] = os.path.join(root, name)
+            snapshots.append(meta)
+    return sorted(snapshots, key=lambda m: (m['as_of_date'] or '', m['created']), reverse=True)
+
+
+@functools.lru_cache(maxsize=512)
+def open_snapshot_arrays(path):
+    """Memory-mapped schedule columns and premium matrix of a snapshot with their offset indexes
+
+    Cached per process, so concurrent sessions reuse one mapping (and the OS page cache) per snapshot.
+    """
+    with np.load(os.path.join(path, 'schedule_index.npz'), allow_pickle=False) as index:
+        offsets = {sheet: (int(start), int(stop))
+                   for sheet, start, stop in zip(index['sheets'].tolist(), index['starts'], index['stops'])}
+    arrays = {'schedule': map_columns(os.path.join(path, 'schedules')), 'offsets': offsets,
+              'premiums': None, 'policy_rows': {}, 'premium_months': []}
+    if os.path.exists(os.path.join(path, 'premiums.npy')):
+        with np.load(os.path.join(path, 'premium_index.npz'), allow_pickle=False) as index:
+            arrays['policy_rows'] = {policy_id: i for i, policy_id in enumerate(index['policies'].tolist())}
+            arrays['premium_months'] = index['months'].tolist()
+        arrays['premiums'] = np.load(os.path.join(path, 'premiums.npy'), mmap_mode='r')
+    return arrays
+
+
+def loan_schedule_history(snapshots, sheet, columns=('Closing Balance', 'Amount Paid')):
+    """One loan's amortization rows as recorded in each snapshot (only that loan's row range is read)"""
+    frames = []
+    for meta in snapshots:
+        arrays = open_snapshot_arrays(meta['path'])
+        if sheet not in arrays['offsets']:
+            continue
+        start, stop = arrays['offsets'][sheet]
+        frame = pd.DataFrame({col: arrays['schedule'][col][start:stop] for col in ['Month', *columns]})
+        frames.append(frame.assign(**{'As Of': pd.Timestamp(meta['as_of_date'])}))
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=['Month', *columns, 'As Of'])
+
+
+def premium_history(snapshots, policy_id):
+    """One policy's premium stream as recorded in each snapshot (only that policy's matrix row is read)"""
+    frames = []
+    for meta in snapshots:
+        arrays = open_snapshot_arrays(meta['path'])
+        if policy_id not in arrays['policy_rows']:
+            continue
+        premiums = arrays['premiums'][arrays['policy_rows'][policy_id]]
+        frames.append(pd.DataFrame({'Month': arrays['premium_months'], 'Premium': premiums,
+                                    'As Of': pd.Timestamp(meta['as_of_date'])}))
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=['Month', 'Premium', 'As Of'])
+
+
+def load_snapshot(path):
+    """Rebuild the master data dict, LS data dict (or None) and metadata saved by save_snapshot"""
+    with open(os.path.join(path, META_FILE)) as f:
+        meta = json.load(f)
+
+    loans_df = load_frame(os.path.join(path, 'loans.npz'))
+    # Snapshots saved before a column was added simply lack it
+    loans_df = loans_df.astype(dict.fromkeys([col for col in CATEGORY_COLUMNS['loans'] if col in loans_df], 'category'))
+    arrays = open_snapshot_arrays(path)
+    schedule = arrays['schedule']
+    # Numeric and date columns stay views of the read-only mapped files (copy=False keeps pandas from
+    # consolidating them into new blocks), so only the pages a query touches are read and every
+    # session shares them; only the string columns are converted into memory
+    schedule_df = pd.DataFrame(schedule, copy=False)
+
+    # Per-loan schedules are contiguous row ranges of the mapped columns, indexed by worksheet row
+    loan_schedules = {}
+    loan_details = {}
+    detail_columns = [col for col in schedule if col not in ('Sheet', 'Row')]
+    for sheet, (start, stop) in arrays['offsets'].items():
+        amort_df = pd.DataFrame({col: schedule[col][start:stop] for col in detail_columns},
+                                index=pd.Index(schedule['Row'][start:stop], name='Row'), copy=False)
+        loan_schedules[sheet] = amort_df
+        if sheet in meta['sheet_borrowers']:
+            loan_details[meta['sheet_borrowers'][sheet]] = amort_df
+
+    master_data = {
+        'as_of_date': pd.Timestamp(meta['as_of_date']) if meta['as_of_date'] else pd.NaT,
+        'loan_sheets': meta['loan_sheets'],
+        'loans_df': loans_df,
+        'loan_details': loan_details,
+        'loan_schedules': loan_schedules,
+        'schedule_df': schedule_df,
+    }
+
+    ls_data = None
+    if meta['has_ls']:
+        policies_df = load_frame(os.path.join(path, 'policies.npz'))
+        policies_df = policies_df.astype(dict.fromkeys(CATEGORY_COLUMNS['policies'], 'category'))
+        premiums = pd.DataFrame(arrays['premiums'], index=pd.Index(list(arrays['policy_rows']), name='Policy_ID'),
+                                columns=arrays['premium_months'], dtype=float, copy=False)
+        ls_data = {
+            'policies': policies_df,
+            'summary': meta['ls_summary'],
+            'monthly_premiums': meta['monthly_premiums'],
+            'policy_premiums': premiums,
+        }
+    return master_data, ls_data, meta
+
+
+def history_snapshots(snapshots):
+    """Latest snapshot per as-of date, oldest first (undated snapshots are left out)"""
+    latest = {}
+    for meta in snapshots:
+        if meta['as_of_date'] and (meta['as_of_date'] not in latest or meta['created'] > latest[meta['as_of_date']]['created']):
+            latest[meta['as_of_date']] = meta
+    return [latest[as_of] for as_of in sorted(latest)]
+
+
+def load_history(snapshots, loan_columns=None, policy_columns=None):
+    """Stack the loans and LS policy frames of several snapshots into long frames with an `As Of` column"""
+    loan_frames = []
+    policy_frames = []
+    for meta in snapshots:
+        as_of = pd.Timestamp(meta['as_of_date'])
+        loans = load_frame(os.path.join(meta['path'], 'loans.npz'), loan_columns)
+        loan_frames.append(loans.assign(**{'As Of': as_of}))
+        if meta['has_ls']:
+            policies = load_frame(os.path.join(meta['path'], 'policies.npz'), policy_columns)
+            policy_frames.append(policies.assign(**{'As Of': as_of}))
+
+    loan_history = pd.concat(loan_frames, ignore_index=True) if loan_frames else pd.DataFrame()
+    policy_history = pd.concat(policy_frames, ignore_index=True) if policy_frames else pd.DataFrame()
+    return loan_history, policy_history
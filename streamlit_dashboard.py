@@ -1,14 +1,31 @@
 import streamlit as st
 import pandas as pd
 from datetime import datetime, timedelta
-from openpyxl import load_workbook
-from dateutil.relativedelta import relativedelta
 import numpy as np
+import io
 import os
+import time
+
+from portfolio_core import (parse_premium_month, parse_life_settlement_workbook, LoanSheetCache, DatasetCache,
+                            BackgroundParser, dataset_nbytes,
+                            process_master_workbook, split_loans_by_status, portfolio_summary, loan_cashflows)
+from portfolio_analytics import (validate_schedules, compute_delinquency, summarize_delinquency,
+                                 AGING_BUCKETS, build_stress_scenarios, stress_loan_cashflows,
+                                 collection_bands, compute_irrs, compute_concentration,
+                                 compute_vintages, VINTAGE_PERIODS, build_balance_series, balance_at,
+                                 LOAN_HISTORY_COLUMNS, POLICY_HISTORY_COLUMNS, loan_history_deltas,
+                                 policy_history_deltas, portfolio_trends)
+from mortality_simulation import simulate_ls_cashflows, simulation_bands, simulation_totals
+from snapshot_store import (file_digest, save_snapshot, list_snapshots, load_snapshot,
+                            history_snapshots, load_history, loan_schedule_history, premium_history)
+from rerun_metrics import RerunMetrics, cache_miss, write_metrics, process_rss_bytes
 
 st.set_page_config(page_title="Sirocco I LP Portfolio Dashboard", layout="wide", initial_sidebar_state="expanded")
 
-# Custom CSS for Sirocco branding
+# Stage timings and cache hits for this rerun (shown in the sidebar diagnostics and appended to the metrics log)
+metrics = RerunMetrics().activate()
+
+# Custom CSS for Sirocco branding (what the landing page needs; DASHBOARD_CSS follows once data is loaded)
 st.markdown("""
 <style>
     /* Main background */
@@ -22,26 +39,6 @@ st.markdown("""
         font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', 'Roboto', 'Helvetica', 'Arial', sans-serif;
     }
     
-    /* Metrics */
-    [data-testid="metric-container"] {
-        background-color: #2d2d2d;
-        border: 1px solid #3d3d3d;
-        padding: 1rem;
-        border-radius: 8px;
-        box-shadow: 0 2px 4px rgba(0,0,0,0.3);
-    }
-    
-    [data-testid="metric-container"] [data-testid="stMetricLabel"] {
-        color: #FDB813 !important;
-        font-weight: 600;
-        font-size: 0.9rem;
-    }
-    
-    [data-testid="metric-container"] [data-testid="stMetricValue"] {
-        color: #FFFFFF !important;
-        font-weight: 700;
-    }
-    
     /* Sidebar */
     .css-1d391kg, [data-testid="stSidebar"] {
         background-color: #242424;
@@ -58,29 +55,6 @@ st.markdown("""
         border: 1px solid #3d3d3d;
     }
     
-    /* Tables */
-    .dataframe {
-        background-color: #2d2d2d !important;
-        color: #FFFFFF !important;
-    }
-    
-    .dataframe th {
-        background-color: #FDB813 !important;
-        color: #1a1a1a !important;
-        font-weight: 600;
-        border: none !important;
-    }
-    
-    .dataframe td {
-        background-color: #2d2d2d !important;
-        color: #FFFFFF !important;
-        border-color: #3d3d3d !important;
-    }
-    
-    .dataframe tr:hover td {
-        background-color: #3d3d3d !important;
-    }
-    
     /* Expander */
     .streamlit-expanderHeader {
         background-color: #2d2d2d;
@@ -99,21 +73,11 @@ st.markdown("""
         border: 2px dashed #FDB813;
     }
     
-    /* Checkbox */
-    .stCheckbox label {
-        color: #FFFFFF !important;
-    }
-    
     /* General text */
     .stMarkdown, .stText, p, span, div {
         color: #FFFFFF;
     }
     
-    /* Column headers with Sirocco yellow */
-    .css-1kyxreq {
-        color: #FDB813 !important;
-    }
-    
     /* Buttons */
     .stButton button {
         background-color: #FDB813;
@@ -132,55 +96,65 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# Helper functions
-def safe_float(value):
-    """Safely convert a value to float"""
-    try:
-        if isinstance(value, str):
-            if value.lower() in ['interest only', 'n/a', '']:
-                return 0.0
-            value = value.replace('$', '').replace(',', '')
-        return float(value)
-    except (ValueError, TypeError):
-        return 0.0
-
-def excel_date_to_datetime(serial_date):
-    """Convert Excel serial date to datetime"""
-    if pd.isna(serial_date):
-        return pd.NaT
-    if isinstance(serial_date, datetime):
-        return serial_date
+# Styling for metrics, tables and checkboxes, only injected once a portfolio is shown
+DASHBOARD_CSS = """
+<style>
+    /* Metrics */
+    [data-testid="metric-container"] {
+        background-color: #2d2d2d;
+        border: 1px solid #3d3d3d;
+        padding: 1rem;
+        border-radius: 8px;
+        box-shadow: 0 2px 4px rgba(0,0,0,0.3);
+    }
     
-    # Handle string dates
-    if isinstance(serial_date, str):
-        # Clean the string
-        serial_date = serial_date.strip()
-        if not serial_date:
-            return pd.NaT
-        
-        # Try parsing as datetime
-        try:
-            return pd.to_datetime(serial_date)
-        except:
-            # Try converting to float for Excel serial dates
-            try:
-                serial_date = float(serial_date)
-            except:
-                return pd.NaT
+    [data-testid="metric-container"] [data-testid="stMetricLabel"] {
+        color: #FDB813 !important;
+        font-weight: 600;
+        font-size: 0.9rem;
+    }
     
-    # Handle numeric dates (Excel serial dates)
-    if isinstance(serial_date, (int, float)):
-        try:
-            # Excel dates are days since 1900-01-01 (with some quirks)
-            # For dates after 1900-03-01, subtract 2 days to account for Excel's leap year bug
-            if serial_date > 60:  # After 1900-02-28
-                serial_date = serial_date - 2
-            return pd.to_datetime('1900-01-01') + pd.to_timedelta(serial_date - 1, unit='D')
-        except:
-            return pd.NaT
+    [data-testid="metric-container"] [data-testid="stMetricValue"] {
+        color: #FFFFFF !important;
+        font-weight: 700;
+    }
+    
+    /* Tables */
+    .dataframe {
+        background-color: #2d2d2d !important;
+        color: #FFFFFF !important;
+    }
     
-    return pd.NaT
+    .dataframe th {
+        background-color: #FDB813 !important;
+        color: #1a1a1a !important;
+        font-weight: 600;
+        border: none !important;
+    }
+    
+    .dataframe td {
+        background-color: #2d2d2d !important;
+        color: #FFFFFF !important;
+        border-color: #3d3d3d !important;
+    }
+    
+    .dataframe tr:hover td {
+        background-color: #3d3d3d !important;
+    }
+    
+    /* Checkbox */
+    .stCheckbox label {
+        color: #FFFFFF !important;
+    }
+    
+    /* Column headers with Sirocco yellow */
+    .css-1kyxreq {
+        color: #FDB813 !important;
+    }
+</style>
+"""
 
+# Helper functions
 def format_currency(value):
     """Format value as currency"""
     return f"${value:,.2f}" if pd.notna(value) and value != 0 else "$0.00"
@@ -189,190 +163,178 @@ def format_percent(value):
     """Format value as percentage"""
     return f"{value:.2%}" if pd.notna(value) and value != 0 else "0.00%"
 
-def get_cell_value(sheet, locations, default=None):
-    """Try to get value from multiple cell locations"""
-    for location in locations:
-        if sheet[location].value is not None:
-            return sheet[location].value
-    return default
+# Loan tables (active, closed, not started) share one layout
+LOAN_DISPLAY_COLUMNS = ['Sheet', 'Borrower', 'Original Loan Balance', 'Current Loan Balance',
+                        'Total Principal Repaid', 'Total Interest Repaid', 'Last Payment Amount',
+                        'Annual Interest Rate', 'Loan Start Date', 'Maturity Date', 'Notes']
+LOAN_CURRENCY_COLUMNS = ['Original Loan Balance', 'Current Loan Balance', 'Total Principal Repaid',
+                         'Total Interest Repaid', 'Last Payment Amount']
+
+def loan_display_frame(loans):
+    """Formatted loan table, built column by column from the (possibly view) partition without copying it first"""
+    display = {}
+    for col in LOAN_DISPLAY_COLUMNS:
+        if col in LOAN_CURRENCY_COLUMNS:
+            display[col] = loans[col].apply(format_currency)
+        elif col == 'Annual Interest Rate':
+            display[col] = loans[col].apply(format_percent)
+        elif col in ('Loan Start Date', 'Maturity Date'):
+            display[col] = pd.to_datetime(loans[col]).dt.strftime('%Y-%m-%d')
+        else:
+            display[col] = loans[col]
+    return pd.DataFrame(display)
+
+# Amortization columns shown as currency in the loan detail view
+SCHEDULE_CURRENCY_COLUMNS = ['Opening Balance', 'Loan Repayment', 'Interest Charged',
+                             'Capital Repaid', 'Closing Balance', 'Amount Paid']
+
+# Formatted loan schedules kept across reruns and sessions (one per loan viewed)
+LOAN_DETAIL_CACHE_SIZE = 256
+
+@st.cache_data(show_spinner=False, max_entries=LOAN_DETAIL_CACHE_SIZE)
+def loan_detail_frame(amort_df):
+    """One loan's amortization schedule formatted for display, cached by the schedule's contents"""
+    cache_miss('Loan detail format')
+    detail = {}
+    for col in amort_df.columns:
+        if col in SCHEDULE_CURRENCY_COLUMNS:
+            detail[col] = amort_df[col].apply(format_currency)
+        elif col in ('Month', 'Payment Date'):
+            detail[col] = pd.to_datetime(amort_df[col]).dt.strftime('%Y-%m-%d')
+        elif col == 'Notes':
+            detail[col] = amort_df[col].fillna('')
+        else:
+            detail[col] = amort_df[col]
+    return pd.DataFrame(detail)
+
+# Mortality simulation settings (widgets live in the LS section but the cashflow comparison reads them too)
+MORTALITY_DEFAULTS = {'mortality_paths': 10000, 'mortality_horizon': 36, 'mortality_seed': 42}
+
+def mortality_settings():
+    """Current mortality simulation settings from session state"""
+    return {key: st.session_state.get(key, default) for key, default in MORTALITY_DEFAULTS.items()}
+
+def mortality_start_month(ls_data, fallback_date):
+    """First Premium Stream month, or the month of the fallback date"""
+    premium_periods = [parse_premium_month(m) for m in ls_data['monthly_premiums']]
+    premium_periods = [p for p in premium_periods if p is not None]
+    return min(premium_periods) if premium_periods else pd.Period(fallback_date, freq='M')
+
+def premium_stream(ls_data):
+    """The LS premium stream (policies x months) with the month headers as periods; unreadable months are dropped"""
+    premiums = ls_data['policy_premiums']
+    months = [parse_premium_month(str(m)) for m in premiums.columns]
+    return premiums.loc[:, [m is not None for m in months]].set_axis([m for m in months if m is not None], axis=1)
+
+@st.cache_data(show_spinner="Simulating policy mortality...")
+def run_mortality_simulation(policies_df, start_month, n_paths, horizon, seed):
+    """Run the Monte Carlo mortality simulation and return monthly bands plus horizon-total percentiles"""
+    cache_miss('Mortality simulation')
+    simulation = simulate_ls_cashflows(policies_df, start_month, n_paths=n_paths, horizon=horizon, seed=seed)
+    return simulation_bands(simulation), simulation_totals(simulation)
+
+@st.cache_data(show_spinner=False)
+def load_portfolio_history(snapshots):
+    """Per-loan and per-policy period deltas plus book-level trends across saved snapshots"""
+    cache_miss('Portfolio history')
+    loan_history, policy_history = load_history(snapshots, LOAN_HISTORY_COLUMNS, POLICY_HISTORY_COLUMNS)
+    loan_deltas = loan_history_deltas(loan_history)
+    policy_deltas = policy_history_deltas(policy_history) if len(policy_history) > 0 else None
+    return loan_deltas, policy_deltas, portfolio_trends(loan_deltas, policy_deltas)
+
+# Streamlit 1.28 has no fragments: every click, including the policy table's sort and filter buttons
+# (which call st.rerun()), re-executes the whole script. The loan sections' computations are therefore
+# cached on their explicit inputs, the dataset tokens (see section_tokens) and the dates they are measured
+# at, with the frames passed unhashed. A policy table click changes none of those inputs, so the loan
+# sections are served from cache and only the policy-dependent sections recompute.
+SECTION_CACHE_ENTRIES = 16
+
+def section_tokens(master_file, ls_file, snapshot_path, ls_data):
+    """(Master, LS) cache keys for the datasets on screen: the shared dataset key, or the open snapshot (LS None when absent)"""
+    snapshot_token = ('snapshot', snapshot_path)
+    master_token = st.session_state['master_lease'].key if master_file else snapshot_token
+    if ls_data is None:
+        ls_token = None
+    else:
+        ls_token = st.session_state['ls_lease'].key if ls_file else snapshot_token
+    return master_token, ls_token
+
+@st.cache_data(show_spinner=False, max_entries=SECTION_CACHE_ENTRIES)
+def schedule_check_section(master_token, _schedule_df, _loans_df):
+    """Schedule integrity issues of a Master dataset"""
+    cache_miss('Schedule checks')
+    return validate_schedules(_schedule_df, _loans_df)
+
+@st.cache_data(show_spinner=False, max_entries=SECTION_CACHE_ENTRIES)
+def delinquency_section(master_token, as_of, _schedule_df, _loans_df):
+    """Per-loan delinquency and its row-level detail at the as-of date"""
+    cache_miss('Delinquency')
+    return compute_delinquency(_schedule_df, as_of, _loans_df)
+
+@st.cache_data(show_spinner=False, max_entries=SECTION_CACHE_ENTRIES)
+def irr_section(master_token, ls_token, as_of, _schedule_df, _loans_df, _policies_df, _policy_premiums):
+    """Loan, policy and portfolio IRRs at the as-of date"""
+    cache_miss('IRR solve')
+    return compute_irrs(_schedule_df, _loans_df, as_of, _policies_df, _policy_premiums)
+
+@st.cache_data(show_spinner=False, max_entries=SECTION_CACHE_ENTRIES)
+def concentration_section(master_token, ls_token, as_of, _loans_df, _policies_df):
+    """Borrower, loan bucket and policy bucket exposure with the concentration limit checks at the as-of date"""
+    cache_miss('Concentration')
+    return compute_concentration(_loans_df, as_of, _policies_df)
+
+@st.cache_data(show_spinner=False, max_entries=SECTION_CACHE_ENTRIES)
+def vintage_section(master_token, as_of, period, _schedule_df, _loans_df):
+    """Vintage curves by months on book and each vintage's latest point"""
+    cache_miss('Vintage curves')
+    return compute_vintages(_schedule_df, _loans_df, as_of, period)
+
+@st.cache_data(show_spinner=False, max_entries=SECTION_CACHE_ENTRIES)
+def balance_series_section(master_token, _schedule_df, _loans_df):
+    """Month-indexed outstanding principal, scheduled interest and collections of a Master dataset"""
+    cache_miss('Balance series')
+    return build_balance_series(_schedule_df, _loans_df)
+
+def highlight_breach(row):
+    """Style a concentration limit row red when its limit is breached"""
+    return ['background-color: #5c1f1f; color: #FF6B6B' if row['Breach'] else ''] * len(row)
+
+@st.cache_data(show_spinner=False, max_entries=SECTION_CACHE_ENTRIES)
+def stress_section(master_token, as_of, n_scenarios, horizon, cpr_range, cdr_range, severity_range, lag_range, _loans_df):
+    """Stress run-off of the active loans for one set of scenario ranges (percent), with the no-stress baseline and monthly bands"""
+    cache_miss('Stress scenarios')
+    scenarios = build_stress_scenarios(
+        n_scenarios,
+        cpr_range=(cpr_range[0] / 100, cpr_range[1] / 100),
+        cdr_range=(cdr_range[0] / 100, cdr_range[1] / 100),
+        severity_range=(severity_range[0] / 100, severity_range[1] / 100),
+        lag_range=lag_range,
+        seed=0
+    )
+    # Balances are as of the Dashboard date, so the run-off starts the month after it
+    start = pd.Period(as_of, freq='M') + 1
+    stress_result = stress_loan_cashflows(_loans_df, scenarios, start, horizon=horizon)
+    base_result = stress_loan_cashflows(_loans_df, build_stress_scenarios(1, (0, 0), (0, 0), (0, 0), (0, 0)),
+                                        start, horizon=horizon)
+    bands = collection_bands(stress_result)
+    bands['No Stress'] = base_result['collections'][0]
+    return stress_result, base_result, bands
+
+@st.cache_data(show_spinner=False, max_entries=SECTION_CACHE_ENTRIES)
+def cashflow_section(master_token, today_date, _loan_details, _skip_borrowers, _today):
+    """Historical and forward-looking loan cashflows around today (computed once per day)"""
+    cache_miss('Cashflow aggregation')
+    return loan_cashflows(_loan_details, _skip_borrowers, _today)
 
 def process_life_settlement_data(ls_file):
     """Process Life Settlement Excel file and return summary data"""
+    messages = []
     try:
-        ls_wb = load_workbook(ls_file, data_only=True)
-        
-        # Debug: Show available sheet names
-        available_sheets = ls_wb.sheetnames
-        st.info(f'Available sheets in LS file: {available_sheets}')
-        
-        # Validate that we have sheets
-        if not available_sheets:
-            st.error('No sheets found in the Excel file')
-            return None
-        
-        # Check for both possible sheet names for the valuation data
-        valuation_sheet_name = None
-        if 'Valuation Summary' in ls_wb.sheetnames:
-            valuation_sheet_name = 'Valuation Summary'
-        elif 'PortfolioResult' in ls_wb.sheetnames:
-            valuation_sheet_name = 'PortfolioResult'
-        
-        if valuation_sheet_name is None:
-            st.error('Required valuation sheet not found. Expected: "Valuation Summary" or "PortfolioResult"')
-            st.info(f'Available sheets: {available_sheets}')
-            return None
-        
-        val_sheet = ls_wb[valuation_sheet_name]
-        
-        # Check for Premium Stream sheet (optional)
-        has_premium_stream = 'Premium Stream' in ls_wb.sheetnames
-        if has_premium_stream:
-            premium_sheet = ls_wb['Premium Stream']
-            st.success(f'✅ Using "{valuation_sheet_name}" sheet for valuation data')
-            st.info(f'✅ Premium Stream sheet found - premium projections will be included')
-        else:
-            premium_sheet = None
-            st.success(f'✅ Using "{valuation_sheet_name}" sheet for valuation data')
-            st.warning(f'⚠️ Premium Stream sheet not found - only valuation data will be processed')
-        
-        policies = []
-        
-        for row in range(3, 200):
-            try:
-                policy_id_cell = val_sheet[f'B{row}']
-                if not policy_id_cell.value:
-                    break
-            except Exception as e:
-                st.warning(f'Error reading row {row}: {str(e)}')
-                continue
-                
-            try:
-                # Get NDB value first
-                ndb_cell_value = val_sheet[f'V{row}'].value
-                ndb_value = safe_float(str(ndb_cell_value or '0').replace('$', '').replace(',', ''))
-                
-                # If NDB is 0, check for Face Amount column (try common locations)
-                if ndb_value == 0:
-                    # Try column W first (next to V)
-                    face_cell_value = val_sheet[f'W{row}'].value
-                    face_amount = safe_float(str(face_cell_value or '0').replace('$', '').replace(',', ''))
-                    if face_amount == 0:
-                        # Try other possible columns for Face Amount
-                        for col in ['X', 'Y', 'U', 'T']:
-                            face_cell_value = val_sheet[f'{col}{row}'].value
-                            face_amount = safe_float(str(face_cell_value or '0').replace('$', '').replace(',', ''))
-                            if face_amount > 0:
-                                break
-                    if face_amount > 0:
-                        ndb_value = face_amount
-                
-                policy_data = {
-                    'Policy_ID': str(policy_id_cell.value),
-                    'Insured_ID': str(val_sheet[f'C{row}'].value or ''),
-                    'Name': str(val_sheet[f'D{row}'].value or ''),
-                    'Age': safe_float(val_sheet[f'F{row}'].value),
-                    'Gender': str(val_sheet[f'G{row}'].value or ''),
-                    'NDB': ndb_value,
-                    'Valuation': safe_float(str(val_sheet[f'Z{row}'].value or '0').replace('$', '').replace(',', '')),
-                    'Cost_Basis': safe_float(str(val_sheet[f'AB{row}'].value or '0').replace('$', '').replace(',', '')),
-                    'Remaining_LE': safe_float(val_sheet[f'AC{row}'].value),
-                }
-                policies.append(policy_data)
-            except:
-                continue
-        
-        if len(policies) == 0:
-            return None
-        
-        # Calculate summary statistics
-        total_policies = len(policies)
-        total_ndb = sum(p['NDB'] for p in policies)
-        total_valuation = sum(p['Valuation'] for p in policies)
-        total_cost_basis = sum(p['Cost_Basis'] for p in policies)
-        
-        valid_ages = [p['Age'] for p in policies if p['Age'] > 0]
-        avg_age = sum(valid_ages) / len(valid_ages) if valid_ages else 0
-        
-        male_count = sum(1 for p in policies if 'male' in p['Gender'].lower() and 'female' not in p['Gender'].lower())
-        female_count = sum(1 for p in policies if 'female' in p['Gender'].lower())
-        male_percentage = (male_count / (male_count + female_count)) * 100 if (male_count + female_count) > 0 else 0
-        
-        valid_les = [p['Remaining_LE'] for p in policies if p['Remaining_LE'] > 0]
-        avg_remaining_le = sum(valid_les) / len(valid_les) if valid_les else 0
-        
-        # Process monthly premiums (only if Premium Stream sheet exists)
-        monthly_premiums = {}
-        policy_premiums = {}
-        
-        if has_premium_stream and premium_sheet:
-            month_columns = ['M', 'N', 'O', 'P', 'Q', 'R', 'S', 'T', 'U', 'V', 'W', 'X']
-            
-            month_headers = []
-            for col in month_columns:
-                header = premium_sheet[f'{col}2'].value
-                if header:
-                    month_headers.append((col, str(header)))
-            
-            for col_letter, month_name in month_headers:
-                month_total = 0
-                for prem_row in range(3, len(policies) + 3):
-                    try:
-                        lyric_id_cell = premium_sheet[f'B{prem_row}']
-                        if lyric_id_cell.value:
-                            lyric_id = str(lyric_id_cell.value)
-                            premium_cell = premium_sheet[f'{col_letter}{prem_row}']
-                            premium_val = safe_float(premium_cell.value) if premium_cell.value else 0
-                            month_total += premium_val
-                            
-                            if lyric_id not in policy_premiums:
-                                policy_premiums[lyric_id] = {}
-                            policy_premiums[lyric_id][month_name] = premium_val
-                    except:
-                        continue
-                
-                monthly_premiums[month_name] = month_total
-        else:
-            # Set default values when Premium Stream is not available
-            monthly_premiums = {}
-            policy_premiums = {}
-        
-        # Calculate policy-level metrics
-        for policy in policies:
-            policy_id = policy['Policy_ID']
-            if has_premium_stream and policy_id in policy_premiums:
-                annual_premium = sum(policy_premiums[policy_id].values())
-                policy['Annual_Premium'] = annual_premium
-                if policy['NDB'] > 0:
-                    policy['Premium_Pct_Face'] = (annual_premium / policy['NDB']) * 100
-                else:
-                    policy['Premium_Pct_Face'] = 0
-            else:
-                policy['Annual_Premium'] = 0
-                policy['Premium_Pct_Face'] = 0
-        
-        total_annual_premiums = sum(monthly_premiums.values())
-        premiums_as_pct_face = (total_annual_premiums / total_ndb) * 100 if total_ndb > 0 else 0
-        
-        return {
-            'policies': policies,
-            'summary': {
-                'total_policies': total_policies,
-                'total_ndb': total_ndb,
-                'total_valuation': total_valuation,
-                'total_cost_basis': total_cost_basis,
-                'avg_age': avg_age,
-                'male_count': male_count,
-                'female_count': female_count,
-                'male_percentage': male_percentage,
-                'avg_remaining_le': avg_remaining_le,
-                'total_annual_premiums': total_annual_premiums,
-                'premiums_as_pct_face': premiums_as_pct_face,
-            },
-            'monthly_premiums': monthly_premiums,
-            'policy_premiums': policy_premiums
-        }
-        
+        # The parse messages are cached with the dataset so every session sharing it sees them
+        ls_data, messages = shared_dataset(
+            'ls', ls_file, lambda: (parse_life_settlement_workbook(ls_file, messages, metrics), messages))
     except Exception as e:
+        show_messages(messages)
         st.error(f'Error processing Life Settlement file: {str(e)}')
         st.error(f'Error type: {type(e).__name__}')
         st.info('Please check that the Excel file has the expected structure with "Valuation Summary" or "PortfolioResult" sheet. "Premium Stream" sheet is optional.')
@@ -381,13 +343,364 @@ def process_life_settlement_data(ls_file):
         with st.expander("🔍 Debug Information"):
             st.code(f"Error details: {str(e)}")
             st.code(f"Error type: {type(e).__name__}")
-            try:
-                if 'ls_wb' in locals():
-                    st.write("Available sheets:", ls_wb.sheetnames)
-            except:
-                st.write("Could not retrieve sheet names")
         
         return None
+    
+    show_messages(messages)
+    return ls_data
+
+def show_messages(messages):
+    """Render (level, text) status messages from the headless parsers"""
+    for level, text in messages:
+        getattr(st, level)(text)
+
+SHEET_CACHE_SIZE = 5000
+
+@st.cache_resource
+def loan_sheet_cache():
+    """Parsed loan sheets shared by all sessions (see LoanSheetCache)"""
+    return LoanSheetCache(SHEET_CACHE_SIZE)
+
+DATASET_CACHE_MB = int(os.environ.get('SIROCCO_DATASET_CACHE_MB', '256'))
+
+@st.cache_resource
+def dataset_cache():
+    """Parsed Master and LS datasets shared by all sessions (see DatasetCache)"""
+    return DatasetCache(DATASET_CACHE_MB * 1024 * 1024)
+
+def upload_digest(uploaded_file):
+    """Content digest of an upload, hashed once per upload (Streamlit gives every upload a stable file_id)"""
+    file_id = getattr(uploaded_file, 'file_id', None)
+    if file_id is None:
+        return file_digest(uploaded_file)
+    digests = st.session_state.setdefault('upload_digests', {})
+    if file_id not in digests:
+        digests[file_id] = file_digest(uploaded_file)
+    return digests[file_id]
+
+def dataset_key(name, uploaded_file):
+    """Shared dataset key for an upload: its content digest and today's date (loan status depends on the date)"""
+    return (name, upload_digest(uploaded_file), datetime.now().date().isoformat())
+
+def shared_dataset(name, uploaded_file, build):
+    """Read-only parsed dataset for an upload, shared by every session that opened the same file today"""
+    return leased_dataset(name, dataset_key(name, uploaded_file), build)
+
+def shared_snapshot(path):
+    """Read-only (master data, LS data, meta) of a saved snapshot, loaded once and shared by every session that opens it"""
+    # A snapshot directory is never rewritten with different contents (its name holds the content digest)
+    return leased_dataset('snapshot', ('snapshot', path), lambda: load_snapshot(path))
+
+def leased_dataset(name, key, build):
+    """Value of `key` in the shared dataset cache, building it once; the session keeps a lease under `<name>_lease`"""
+    lease = st.session_state.get(f'{name}_lease')
+    cached = lease is not None and lease.key == key
+    if not cached:
+        # Replacing the session's previous lease releases it
+        lease, cached = dataset_cache().lease(key, build)
+        st.session_state[f'{name}_lease'] = lease
+    metrics.count_cache('Shared datasets', hits=int(cached), misses=int(not cached))
+    return lease.value
+
+def session_memory(namespace):
+    """(label, bytes) readout: datasets this session shares, what it holds on its own, and the process RSS"""
+    rows = []
+    shared_ids = set()
+    for name, label in [('master', "Master dataset (shared)"), ('ls', "LS dataset (shared)"),
+                        ('snapshot', "Snapshot (shared)")]:
+        lease = st.session_state.get(f'{name}_lease')
+        if lease is not None:
+            rows.append((label, dataset_cache().nbytes(lease.key)))
+            # The LS lease holds (ls_data, messages) and the snapshot lease (master data, LS data, meta)
+            datasets = [lease.value] if name == 'master' else [dataset or {} for dataset in lease.value[:-1]]
+            for dataset in datasets:
+                shared_ids.update(id(value) for value in dataset.values())
+                shared_ids.update(id(value) for value in dataset.get('loan_details', {}).values())
+    # The status partitions are row slices of the loans frame
+    shared_ids.update(id(namespace.get(name)) for name in ('active_loans', 'closed_loans', 'not_started_loans'))
+    own = [value for value in namespace.values()
+           if isinstance(value, (pd.DataFrame, pd.Series, np.ndarray)) and id(value) not in shared_ids]
+    rows.append(("This session's frames", dataset_nbytes(own)))
+    rows.append(("Session state", dataset_nbytes({key: value for key, value in st.session_state.items()
+                                                  if not key.endswith('_lease')})))
+    rss = process_rss_bytes()
+    if rss is not None:
+        rows.append(("Process RSS (all sessions)", rss))
+    return rows
+
+def release_dataset(name):
+    """Let go of this session's lease on a shared dataset, and of any parse of it still running (e.g. once its file is removed)"""
+    lease = st.session_state.pop(f'{name}_lease', None)
+    if lease is not None:
+        lease.release()
+    cancel_parse(name)
+
+PARSE_WORKERS = 2
+
+# Seconds between progress bar updates while a Master file is parsed in the background
+PARSE_POLL_SECONDS = 0.2
+
+@st.cache_resource
+def background_parser():
+    """Worker threads parsing uploaded Master files for all sessions (see BackgroundParser)"""
+    return BackgroundParser(PARSE_WORKERS)
+
+def cancel_parse(name):
+    """Stop waiting on this session's background parse; it is cancelled unless another session is waiting on it"""
+    job = st.session_state.pop(f'{name}_job', None)
+    if job is not None:
+        background_parser().cancel(job)
+
+def sidebar_header(as_of_date, loan_count):
+    """Sidebar branding plus the as-of date and loan count from the Dashboard sheet"""
+    st.markdown("""
+    <div style='text-align: center; padding: 1rem 0;'>
+        <h2 style='color: #FDB813; margin: 0;'>⚡ Sirocco Partners</h2>
+    </div>
+    """, unsafe_allow_html=True)
+    
+    st.markdown(f"""
+    <div style='background-color: #2d2d2d; padding: 1rem; border-radius: 8px; margin-bottom: 1rem;'>
+        <p style='color: #FDB813; margin: 0; font-weight: 600;'>📅 Data as of</p>
+        <p style='color: #FFFFFF; margin: 0; font-size: 1.2rem;'>{as_of_date.strftime('%B %d, %Y') if pd.notna(as_of_date) else 'Unknown'}</p>
+    </div>
+    """, unsafe_allow_html=True)
+    
+    st.markdown(f"""
+    <div style='background-color: #2d2d2d; padding: 1rem; border-radius: 8px;'>
+        <p style='color: #FDB813; margin: 0; font-weight: 600;'>📊 Total Loans</p>
+        <p style='color: #FFFFFF; margin: 0; font-size: 1.2rem;'>{loan_count}</p>
+    </div>
+    """, unsafe_allow_html=True)
+
+def render_portfolio_summary(loan_summary, note=None):
+    """Portfolio Summary heading with the overview, active loans and historical performance boxes"""
+    st.markdown("<h2 style='color: #FDB813; margin-top: 2rem; font-size: 2rem;'>📊 Portfolio Summary</h2>", unsafe_allow_html=True)
+    if note:
+        st.caption(note)
+    
+    # Create styled summary boxes
+    st.markdown("""
+    <style>
+    .summary-box {
+        background-color: #2d2d2d;
+        border: 1px solid #3d3d3d;
+        border-radius: 8px;
+        padding: 2rem;
+        margin-bottom: 1.5rem;
+        overflow: visible;
+    }
+    .summary-title {
+        color: #FDB813;
+        font-size: 1.4rem;
+        font-weight: 700;
+        margin-bottom: 1.5rem;
+        display: flex;
+        align-items: center;
+        letter-spacing: 0.5px;
+    }
+    .summary-metrics {
+        display: grid;
+        grid-template-columns: repeat(4, 1fr);
+        gap: 2rem;
+    }
+    .metric-item {
+        text-align: center;
+    }
+    .metric-label {
+        color: #AAAAAA;
+        font-size: 0.95rem;
+        font-weight: 500;
+        margin-bottom: 0.5rem;
+        text-transform: uppercase;
+        letter-spacing: 1px;
+    }
+    .metric-value {
+        color: #FFFFFF;
+        font-size: 2.2rem;
+        font-weight: 800;
+        line-height: 1.2;
+    }
+    .metric-subvalue {
+        color: #999999;
+        font-size: 1.1rem;
+        font-weight: 500;
+        margin-top: 0.25rem;
+    }
+    </style>
+    """, unsafe_allow_html=True)
+    
+    # Portfolio Overview Box
+    st.markdown("""
+    <div class='summary-box'>
+        <div class='summary-title'>📁 Portfolio Overview</div>
+        <div class='summary-metrics'>
+            <div class='metric-item'>
+                <div class='metric-label'>Active Loans</div>
+                <div class='metric-value'>{}</div>
+            </div>
+            <div class='metric-item'>
+                <div class='metric-label'>Closed Loans</div>
+                <div class='metric-value'>{}</div>
+            </div>
+            <div class='metric-item'>
+                <div class='metric-label'>Not Started</div>
+                <div class='metric-value'>{}</div>
+            </div>
+            <div class='metric-item'>
+                <div class='metric-label'>Total Loans</div>
+                <div class='metric-value'>{}</div>
+            </div>
+        </div>
+    </div>
+    """.format(loan_summary['active_loans'], loan_summary['closed_loans'], loan_summary['not_started_loans'], loan_summary['total_loans']), 
+    unsafe_allow_html=True)
+    
+    # Active Loans Summary Box
+    if loan_summary['active_loans'] > 0:
+        # Create the HTML with all values pre-formatted
+        active_loans_html = f"""
+        <div class='summary-box'>
+            <div class='summary-title'>💰 Active Loans Summary</div>
+            <div class='summary-metrics'>
+                <div class='metric-item'>
+                    <div class='metric-label'>Original Balance</div>
+                    <div class='metric-value'>{format_currency(loan_summary['active_orig_balance'])}</div>
+                </div>
+                <div class='metric-item'>
+                    <div class='metric-label'>Current Balance</div>
+                    <div class='metric-value'>{format_currency(loan_summary['active_current_balance'])}</div>
+                </div>
+                <div class='metric-item'>
+                    <div class='metric-label'>Avg Interest Rate</div>
+                    <div class='metric-value'>{format_percent(loan_summary['weighted_avg_rate'])}</div>
+                    <div class='metric-subvalue' style='color: #888888; font-size: 0.9rem;'>(excl. high-rate loans)</div>
+                </div>
+                <div class='metric-item'>
+                    <div class='metric-label'>Avg Maturity</div>
+                    <div class='metric-value'>{loan_summary['avg_years_to_maturity']:.1f} yrs</div>
+                    <div class='metric-subvalue'>({loan_summary['avg_months_to_maturity']:.0f} months)</div>
+                </div>
+            </div>
+            <div style='margin-top: 2rem; padding-top: 2rem; border-top: 1px solid #3d3d3d;'>
+                <div class='summary-metrics' style='grid-template-columns: repeat(3, 1fr);'>
+                    <div class='metric-item'>
+                        <div class='metric-label'>Amortizing Loans</div>
+                        <div class='metric-value' style='font-size: 1.8rem;'>{loan_summary['amortizing_loans']}</div>
+                    </div>
+                    <div class='metric-item'>
+                        <div class='metric-label'>Interest Only</div>
+                        <div class='metric-value' style='font-size: 1.8rem;'>{loan_summary['interest_only_loans']}</div>
+                    </div>
+                    <div class='metric-item'>
+                        <div class='metric-label'>Average Loan Age</div>
+                        <div class='metric-value' style='font-size: 1.8rem;'>{loan_summary['avg_years_since_start']:.1f} yrs</div>
+                        <div class='metric-subvalue'>({loan_summary['avg_months_since_start']:.0f} months)</div>
+                    </div>
+                </div>
+            </div>
+        </div>
+        """
+        
+        st.markdown(active_loans_html, unsafe_allow_html=True)
+    else:
+        st.markdown("""
+        <div class='summary-box'>
+            <div class='summary-title'>💰 Active Loans Summary</div>
+            <div style='text-align: center; color: #999999; padding: 3rem; font-size: 1.2rem;'>
+                No active loans in portfolio
+            </div>
+        </div>
+        """, unsafe_allow_html=True)
+    
+    # Historical Performance Box
+    st.markdown("""
+    <div class='summary-box'>
+        <div class='summary-title'>📈 Historical Performance</div>
+        <div style='display: grid; grid-template-columns: repeat(3, 1fr); gap: 2rem;'>
+            <div class='metric-item'>
+                <div class='metric-label'>Principal Repaid</div>
+                <div class='metric-value'>{}</div>
+            </div>
+            <div class='metric-item'>
+                <div class='metric-label'>Interest Earned</div>
+                <div class='metric-value'>{}</div>
+            </div>
+            <div class='metric-item'>
+                <div class='metric-label'>Total Collections</div>
+                <div class='metric-value'>{}</div>
+            </div>
+        </div>
+    </div>
+    """.format(
+        format_currency(loan_summary['total_repaid_principal']),
+        format_currency(loan_summary['total_repaid_interest']),
+        format_currency(loan_summary['total_collected'])
+    ), unsafe_allow_html=True)
+
+def wait_for_parse(job):
+    """Hold this run until a background parse finishes, with a per-sheet progress bar
+
+    The sidebar header is filled in from the Dashboard sheet as soon as the workbook is open, and the
+    Portfolio Summary from the loan terms once every header block is read; both are replaced when the
+    schedules are in. A new upload interrupts the wait (Streamlit stops this run), and the next run
+    cancels the old job.
+    """
+    header = st.sidebar.empty()
+    bar = st.progress(0.0, text="Opening the Master workbook...")
+    summary = st.empty()
+    header_shown = summary_shown = False
+    while not job.done():
+        progress = job.progress
+        if progress.loan_sheets is not None:
+            if not header_shown:
+                with header.container():
+                    sidebar_header(progress.as_of_date, len(progress.loan_sheets))
+                header_shown = True
+            if progress.preview is None:
+                bar.progress(0.0, text=f"Reading loan terms from {len(progress.loan_sheets)} sheets...")
+            else:
+                if not summary_shown:
+                    with summary.container():
+                        render_portfolio_summary(portfolio_summary(progress.preview),
+                                                 note="Estimated from the loan terms while the amortization schedules load")
+                    summary_shown = True
+                bar.progress(progress.fraction, text=f"Reading loan schedules: {progress.done} of {len(progress.loan_sheets)}")
+        time.sleep(PARSE_POLL_SECONDS)
+    bar.empty()
+    summary.empty()
+    header.empty()
+
+def parsed_master(master_file):
+    """Shared Master dataset for an upload, parsed on a worker thread while this run shows progress"""
+    key = dataset_key('master', master_file)
+    lease = st.session_state.get('master_lease')
+    if lease is None or lease.key != key:
+        lease = dataset_cache().get(key)
+        cached = lease is not None
+        if lease is None:
+            job = st.session_state.get('master_job')
+            if job is None or job.key != key:
+                # The upload replaced a file that may still be parsing
+                cancel_parse('master')
+                file_bytes = master_file.getvalue()
+                sheet_cache = loan_sheet_cache()
+                job_metrics = RerunMetrics()
+                job = background_parser().submit(key, lambda progress: (
+                    process_master_workbook(io.BytesIO(file_bytes), sheet_cache, job_metrics, progress), job_metrics))
+                st.session_state['master_job'] = job
+            wait_for_parse(job)
+            st.session_state.pop('master_job', None)
+            master_data, job_metrics = job.result()
+            metrics.absorb(job_metrics)
+            # Sessions that waited on the same job get the dataset its first finisher cached
+            lease, cached = dataset_cache().lease(key, lambda: master_data)
+        # Replacing the session's previous lease releases it
+        st.session_state['master_lease'] = lease
+    else:
+        cached = True
+    metrics.count_cache('Shared datasets', hits=int(cached), misses=int(not cached))
+    return lease.value
 
 # Main app
 
@@ -412,6 +725,8 @@ with col3:
 
 # Process LS data if uploaded
 ls_data = None
+if not ls_file:
+    release_dataset('ls')
 if ls_file:
     ls_data = process_life_settlement_data(ls_file)
     if ls_data:
@@ -419,298 +734,72 @@ if ls_file:
     else:
         st.error("❌ Failed to load Life Settlement data. Please check file format.")
 
+# A saved snapshot can stand in for the uploads when no Master file is given
+snapshot_path = None if master_file else st.session_state.get('snapshot_path')
+if not master_file:
+    release_dataset('master')
+if not snapshot_path:
+    release_dataset('snapshot')
+
 # Process loan data (keep original logic)
-if master_file:
+if master_file or snapshot_path:
     try:
-        # Load workbook
-        wb = load_workbook(master_file, data_only=True)
+        snapshot_meta = None
+        if master_file:
+            master_data = parsed_master(master_file)
+            # Snapshot each pair of uploads once, not on every rerun
+            snapshot_uploads = (st.session_state['master_lease'].key,
+                                st.session_state['ls_lease'].key if ls_file and ls_data else None)
+            try:
+                if st.session_state.get('snapshot_saved_for') != snapshot_uploads:
+                    save_snapshot(master_data, ls_data, file_digest(master_file, ls_file))
+                    st.session_state['snapshot_saved_for'] = snapshot_uploads
+            except OSError as e:
+                st.warning(f"⚠️ Could not save portfolio snapshot: {str(e)}")
+        else:
+            with metrics.stage('Snapshot load') as load_record:
+                master_data, snapshot_ls_data, snapshot_meta = shared_snapshot(snapshot_path)
+                load_record['rows'] = len(master_data['schedule_df'])
+            snapshot_load_ms = load_record['ms']
+            if ls_data is None:
+                ls_data = snapshot_ls_data
         
-        # Get all loan sheets (sheets starting with '#')
-        loan_sheets = [s for s in wb.sheetnames if s.startswith('#') and s != '#AddSheet']
+        as_of_date = master_data['as_of_date']
+        loan_sheets = master_data['loan_sheets']
+        loans_df = master_data['loans_df']
+        loan_details = master_data['loan_details']
+        loan_schedules = master_data['loan_schedules']
+        schedule_df = master_data['schedule_df']
+        master_token, ls_token = section_tokens(master_file, ls_file, snapshot_path, ls_data)
         
-        # Get as-of date from Dashboard
-        dashboard_sheet = wb['Dashboard']
-        as_of_date = dashboard_sheet['E3'].value
-        if isinstance(as_of_date, str):
-            as_of_date = pd.to_datetime(as_of_date)
-        elif isinstance(as_of_date, (int, float)):
-            as_of_date = excel_date_to_datetime(as_of_date)
+        st.markdown(DASHBOARD_CSS, unsafe_allow_html=True)
         
         # Sidebar with Sirocco branding
         with st.sidebar:
-            st.markdown("""
-            <div style='text-align: center; padding: 1rem 0;'>
-                <h2 style='color: #FDB813; margin: 0;'>⚡ Sirocco Partners</h2>
-            </div>
-            """, unsafe_allow_html=True)
-            
-            st.markdown(f"""
-            <div style='background-color: #2d2d2d; padding: 1rem; border-radius: 8px; margin-bottom: 1rem;'>
-                <p style='color: #FDB813; margin: 0; font-weight: 600;'>📅 Data as of</p>
-                <p style='color: #FFFFFF; margin: 0; font-size: 1.2rem;'>{as_of_date.strftime('%B %d, %Y') if pd.notna(as_of_date) else 'Unknown'}</p>
-            </div>
-            """, unsafe_allow_html=True)
-            
-            st.markdown(f"""
-            <div style='background-color: #2d2d2d; padding: 1rem; border-radius: 8px;'>
-                <p style='color: #FDB813; margin: 0; font-weight: 600;'>📊 Total Loans</p>
-                <p style='color: #FFFFFF; margin: 0; font-size: 1.2rem;'>{len(loan_sheets)}</p>
-            </div>
-            """, unsafe_allow_html=True)
-        
-        # Process each loan sheet (keep existing logic)
-        loans = []
-        loan_details = {}
-        
-        for sheet_name in loan_sheets:
-            sheet = wb[sheet_name]
-            
-            # Extract loan header information - try multiple locations
-            borrower = get_cell_value(sheet, ['B2', 'A2'], f"Unknown ({sheet_name})")
-            if borrower == "" or borrower is None:
-                borrower = f"Unknown ({sheet_name})"
-            
-            # Check if B3 has a label (like "Loan Principle Amount") - if so, data is in C3
-            b3_value = sheet['B3'].value
-            if isinstance(b3_value, str) and 'loan' in str(b3_value).lower():
-                # Data is in column C
-                loan_amount = safe_float(sheet['C3'].value)
-                interest_rate = safe_float(sheet['C4'].value)
-                loan_period = safe_float(sheet['C5'].value)
-                payment_amount_val = sheet['C6'].value
-                # Try multiple locations for loan start date
-                loan_start = None
-                for date_cell in ['C7', 'C6', 'B7', 'B6']:
-                    date_val = sheet[date_cell].value
-                    if date_val and not isinstance(date_val, str):
-                        loan_start = excel_date_to_datetime(date_val)
-                        if pd.notna(loan_start):
-                            break
-                if pd.isna(loan_start):
-                    # Try string dates
-                    for date_cell in ['C7', 'C6', 'B7', 'B6']:
-                        date_val = sheet[date_cell].value
-                        if isinstance(date_val, str) and len(date_val) > 0:
-                            loan_start = excel_date_to_datetime(date_val)
-                            if pd.notna(loan_start):
-                                break
-            else:
-                # Data is in column B
-                loan_amount = safe_float(sheet['B3'].value)
-                interest_rate = safe_float(sheet['B4'].value)
-                loan_period = safe_float(sheet['B5'].value)
-                payment_amount_val = sheet['B6'].value
-                # Try multiple locations for loan start date
-                loan_start = None
-                for date_cell in ['B7', 'B6', 'C7', 'C6']:
-                    date_val = sheet[date_cell].value
-                    if date_val and not isinstance(date_val, str):
-                        loan_start = excel_date_to_datetime(date_val)
-                        if pd.notna(loan_start):
-                            break
-                if pd.isna(loan_start):
-                    # Try string dates
-                    for date_cell in ['B7', 'B6', 'C7', 'C6']:
-                        date_val = sheet[date_cell].value
-                        if isinstance(date_val, str) and len(date_val) > 0:
-                            loan_start = excel_date_to_datetime(date_val)
-                            if pd.notna(loan_start):
-                                break
-            
-            # If still no loan amount, try C3 directly
-            if loan_amount == 0:
-                loan_amount = safe_float(sheet['C3'].value)
-                if loan_amount > 0:
-                    interest_rate = safe_float(sheet['C4'].value)
-                    loan_period = safe_float(sheet['C5'].value)
-                    payment_amount_val = sheet['C6'].value
-                    # Try multiple locations for loan start date
-                    loan_start = None
-                    for date_cell in ['C7', 'C6', 'B7', 'B6']:
-                        date_val = sheet[date_cell].value
-                        if date_val and not isinstance(date_val, str):
-                            loan_start = excel_date_to_datetime(date_val)
-                            if pd.notna(loan_start):
-                                break
-                    if pd.isna(loan_start):
-                        # Try string dates
-                        for date_cell in ['C7', 'C6', 'B7', 'B6']:
-                            date_val = sheet[date_cell].value
-                            if isinstance(date_val, str) and len(date_val) > 0:
-                                loan_start = excel_date_to_datetime(date_val)
-                                if pd.notna(loan_start):
-                                    break
-            
-            # Handle payment amount
-            if isinstance(payment_amount_val, str) and payment_amount_val.lower() == 'interest only':
-                payment_amount = loan_amount * (interest_rate / 12)
-            else:
-                payment_amount = safe_float(payment_amount_val)
-            
-            # If still no payment amount, try from amortization table
-            if payment_amount == 0:
-                first_payment = safe_float(sheet['D11'].value)
-                if first_payment > 0:
-                    payment_amount = first_payment
+            sidebar_header(as_of_date, len(loan_sheets))
             
-            # Check if loan is interest only
-            is_interest_only = False
-            if isinstance(payment_amount_val, str) and 'interest only' in payment_amount_val.lower():
-                is_interest_only = True
-            
-            # Basic loan information
-            loan_info = {
-                'Sheet': sheet_name,
-                'Borrower': borrower,
-                'Original Loan Balance': loan_amount,
-                'Annual Interest Rate': interest_rate,
-                'Loan Period (months)': loan_period,
-                'Payment Amount': payment_amount,
-                'Loan Start Date': loan_start,
-                'Last Payment Amount': 0,
-                'Notes': '',
-                'Is Interest Only': is_interest_only,
-            }
-            
-            # Read amortization schedule
-            amort_data = []
-            row = 11
-            
-            while row < 100:
-                month_cell = sheet[f'A{row}']
-                if month_cell.value is None:
-                    break
-                    
-                # Skip header rows
-                opening_val = sheet[f'C{row}'].value
-                if isinstance(opening_val, str) and 'balance' in opening_val.lower():
-                    row += 1
-                    continue
-                    
-                amort_row = {
-                    'Month': excel_date_to_datetime(month_cell.value),
-                    'Repayment Number': safe_float(sheet[f'B{row}'].value),
-                    'Opening Balance': safe_float(sheet[f'C{row}'].value),
-                    'Loan Repayment': safe_float(sheet[f'D{row}'].value),
-                    'Interest Charged': safe_float(sheet[f'E{row}'].value),
-                    'Capital Repaid': safe_float(sheet[f'F{row}'].value),
-                    'Closing Balance': safe_float(sheet[f'G{row}'].value),
-                    'Payment Date': excel_date_to_datetime(sheet[f'J{row}'].value),
-                    'Amount Paid': safe_float(sheet[f'K{row}'].value),
-                    'Notes': str(sheet[f'L{row}'].value) if sheet[f'L{row}'].value and sheet[f'L{row}'].value != 'Notes' else '',
-                }
-                
-                if amort_row['Opening Balance'] > 0 or amort_row['Closing Balance'] >= 0:
-                    amort_data.append(amort_row)
-                row += 1
-            
-            if amort_data:
-                amort_df = pd.DataFrame(amort_data)
-                
-                # Collect notes
-                all_notes = [note for note in amort_df['Notes'] if note and note.strip()]
-                if all_notes:
-                    loan_info['Notes'] = '; '.join(all_notes)
-                
-                # Get the last payment amount
-                if pd.notna(as_of_date):
-                    past_payments = amort_df[amort_df['Month'] <= as_of_date]
-                    if not past_payments.empty:
-                        last_payment = past_payments.iloc[-1]
-                        loan_info['Last Payment Amount'] = last_payment['Loan Repayment'] if last_payment['Loan Repayment'] > 0 else last_payment['Amount Paid']
-                
-                # Find current position
-                if pd.notna(as_of_date) and 'Month' in amort_df.columns:
-                    amort_df['Month'] = pd.to_datetime(amort_df['Month'])
-                    current_rows = amort_df[amort_df['Month'] <= as_of_date]
-                    if not current_rows.empty:
-                        current_row = current_rows.iloc[-1]
-                        first_row = amort_df.iloc[0]
-                        
-                        loan_info['Opening Loan Balance'] = first_row['Opening Balance']
-                        loan_info['Current Loan Balance'] = current_row['Closing Balance']
-                        loan_info['Total Principal Repaid'] = current_rows['Capital Repaid'].sum()
-                        loan_info['Total Interest Repaid'] = current_rows['Interest Charged'].sum()
-                        
-                        # If capital repaid sum is 0, calculate from balance difference
-                        if loan_info['Total Principal Repaid'] == 0:
-                            loan_info['Total Principal Repaid'] = loan_info['Opening Loan Balance'] - loan_info['Current Loan Balance']
-                            if loan_info['Total Principal Repaid'] < 0:
-                                loan_info['Total Principal Repaid'] = 0
-                    else:
-                        loan_info['Opening Loan Balance'] = loan_info['Original Loan Balance']
-                        loan_info['Current Loan Balance'] = loan_info['Original Loan Balance']
-                        loan_info['Total Principal Repaid'] = 0
-                        loan_info['Total Interest Repaid'] = 0
-                else:
-                    # Fallback to last available data
-                    first_row = amort_df.iloc[0]
-                    last_row = amort_df.iloc[-1]
-                    
-                    loan_info['Opening Loan Balance'] = first_row['Opening Balance']
-                    loan_info['Current Loan Balance'] = last_row['Closing Balance']
-                    loan_info['Total Principal Repaid'] = amort_df['Capital Repaid'].sum()
-                    loan_info['Total Interest Repaid'] = amort_df['Interest Charged'].sum()
-                    loan_info['Last Payment Amount'] = last_row['Loan Repayment'] if last_row['Loan Repayment'] > 0 else last_row['Amount Paid']
-                    
-                    if loan_info['Total Principal Repaid'] == 0:
-                        loan_info['Total Principal Repaid'] = loan_info['Opening Loan Balance'] - loan_info['Current Loan Balance']
-                        if loan_info['Total Principal Repaid'] < 0:
-                            loan_info['Total Principal Repaid'] = 0
-                
-                # Calculate maturity date
-                if pd.notna(loan_info['Loan Start Date']) and loan_info['Loan Period (months)'] > 0:
-                    loan_info['Maturity Date'] = loan_info['Loan Start Date'] + relativedelta(months=int(loan_info['Loan Period (months)']))
-                else:
-                    loan_info['Maturity Date'] = amort_df['Month'].iloc[-1] if not amort_df.empty else pd.NaT
-                
-                loan_details[borrower] = amort_df
-            else:
-                # No amortization data
-                loan_info['Opening Loan Balance'] = loan_info['Original Loan Balance']
-                loan_info['Current Loan Balance'] = loan_info['Original Loan Balance']
-                loan_info['Total Principal Repaid'] = 0
-                loan_info['Total Interest Repaid'] = 0
-                
-                if pd.notna(loan_info['Loan Start Date']) and loan_info['Loan Period (months)'] > 0:
-                    loan_info['Maturity Date'] = loan_info['Loan Start Date'] + relativedelta(months=int(loan_info['Loan Period (months)']))
-                else:
-                    loan_info['Maturity Date'] = pd.NaT
-            
-            # Add loans with valid original balance
-            if loan_info['Original Loan Balance'] > 0:
-                # Check status
-                today = pd.Timestamp.now()
-                if pd.notna(loan_info['Loan Start Date']):
-                    loan_start_timestamp = pd.Timestamp(loan_info['Loan Start Date'])
-                    if loan_start_timestamp > today:
-                        loan_info['Status'] = 'Not Started'
-                        loan_info['Current Loan Balance'] = 0
-                        loan_info['Opening Loan Balance'] = 0
-                    elif loan_info['Current Loan Balance'] == 0:
-                        loan_info['Status'] = 'Closed'
-                    else:
-                        loan_info['Status'] = 'Active'
-                else:
-                    loan_info['Status'] = 'Active' if loan_info['Current Loan Balance'] > 0 else 'Closed'
-                
-                # Add Interest Only indicator to notes
-                if loan_info['Is Interest Only']:
-                    if loan_info['Notes']:
-                        loan_info['Notes'] = 'Interest Only; ' + loan_info['Notes']
-                    else:
-                        loan_info['Notes'] = 'Interest Only'
-                
-                loans.append(loan_info)
-        
-        # Create main dataframe
-        loans_df = pd.DataFrame(loans)
+            if snapshot_meta:
+                st.markdown(f"""
+                <div style='background-color: #2d2d2d; padding: 1rem; border-radius: 8px; margin-top: 1rem;'>
+                    <p style='color: #FDB813; margin: 0; font-weight: 600;'>📦 Snapshot</p>
+                    <p style='color: #FFFFFF; margin: 0; font-size: 0.9rem;'>{snapshot_meta['key']}</p>
+                    <p style='color: #999999; margin: 0; font-size: 0.8rem;'>Opened in {snapshot_load_ms:.0f} ms</p>
+                </div>
+                """, unsafe_allow_html=True)
+                if st.button("Close snapshot", key="close_snapshot"):
+                    del st.session_state['snapshot_path']
+                    st.rerun()
         
         # Debug info
         if st.checkbox("Show debug info", value=False):
             st.write(f"Total sheets found: {len(loan_sheets)}")
             st.write(f"Total loans processed: {len(loans_df)}")
+            if 'reparsed_sheets' in master_data:
+                st.write(f"Sheets re-parsed this upload: {len(master_data['reparsed_sheets'])} of {len(loan_sheets)} "
+                         "(the rest were unchanged since an earlier upload)")
             st.write("Sheets processed:", loan_sheets)
+            if 'Header Layout' in loans_df:
+                st.write("Header layouts matched:", loans_df['Header Layout'].value_counts())
             
             # Show loan status breakdown
             st.write("\nLoan Status Breakdown:")
@@ -727,255 +816,26 @@ if master_file:
             missing_sheets = set(loan_sheets) - set(loans_df['Sheet'].tolist())
             if missing_sheets:
                 st.warning(f"Sheets not showing in tables: {missing_sheets}")
-            
-            # Check for any loans that might be miscategorized
-            st.write("\nPotential Issues:")
-            # Active loans with zero balance
-            active_zero_balance = loans_df[(loans_df['Status'] == 'Active') & (loans_df['Current Loan Balance'] == 0)]
-            if len(active_zero_balance) > 0:
-                st.warning("Active loans with zero balance found:")
-                st.dataframe(active_zero_balance[['Sheet', 'Borrower', 'Current Loan Balance']])
-            
-            # Closed loans with non-zero balance
-            closed_nonzero = loans_df[(loans_df['Status'] == 'Closed') & (loans_df['Current Loan Balance'] > 0)]
-            if len(closed_nonzero) > 0:
-                st.warning("Closed loans with non-zero balance found:")
-                st.dataframe(closed_nonzero[['Sheet', 'Borrower', 'Current Loan Balance']])
-        
-        # Separate loans by status
-        active_loans = loans_df[loans_df['Status'] == 'Active'].copy()
-        closed_loans = loans_df[loans_df['Status'] == 'Closed'].copy()
-        not_started_loans = loans_df[loans_df['Status'] == 'Not Started'].copy()
         
-        # Fix the count issue - ensure we're counting correctly
-        # Remove any duplicate counting
-        active_loans = active_loans.drop_duplicates(subset=['Sheet'])
-        closed_loans = closed_loans.drop_duplicates(subset=['Sheet'])
-        not_started_loans = not_started_loans.drop_duplicates(subset=['Sheet'])
+        # Schedule integrity checks run on every load (vectorized over all amortization rows)
+        with metrics.cached('Schedule checks', rows=len(schedule_df)):
+            schedule_issues = schedule_check_section(master_token, schedule_df, loans_df)
+        if schedule_issues.empty:
+            st.caption(f"✅ Schedule integrity: {len(schedule_df)} amortization rows across {len(loan_schedules)} sheets passed all checks")
+        else:
+            issue_sheets = schedule_issues['Sheet'].nunique()
+            with st.expander(f"⚠️ Schedule integrity: {len(schedule_issues)} issues across {issue_sheets} sheets"):
+                check_counts = schedule_issues['Check'].value_counts()
+                st.markdown(" | ".join(f"**{check}**: {count}" for check, count in check_counts.items()))
+                st.dataframe(schedule_issues, use_container_width=True, hide_index=True)
         
-        # Sort by current balance or original balance
-        active_loans = active_loans.sort_values('Current Loan Balance', ascending=False)
-        closed_loans = closed_loans.sort_values('Original Loan Balance', ascending=False)
-        not_started_loans = not_started_loans.sort_values('Loan Start Date')
+        # Separate loans by status (one row per sheet, sorted for display)
+        active_loans, closed_loans, not_started_loans = split_loans_by_status(loans_df)
         
         # Display portfolio summary
-        st.markdown("<h2 style='color: #FDB813; margin-top: 2rem; font-size: 2rem;'>📊 Portfolio Summary</h2>", unsafe_allow_html=True)
-        
-        # Calculate all metrics first
-        total_original = loans_df['Original Loan Balance'].sum()
-        active_orig_balance = active_loans['Original Loan Balance'].sum()
-        active_current_balance = active_loans['Current Loan Balance'].sum()
-        total_repaid_principal = loans_df['Total Principal Repaid'].sum()
-        total_repaid_interest = loans_df['Total Interest Repaid'].sum()
-        total_collected = total_repaid_principal + total_repaid_interest
-        
-        # Create styled summary boxes
-        st.markdown("""
-        <style>
-        .summary-box {
-            background-color: #2d2d2d;
-            border: 1px solid #3d3d3d;
-            border-radius: 8px;
-            padding: 2rem;
-            margin-bottom: 1.5rem;
-            overflow: visible;
-        }
-        .summary-title {
-            color: #FDB813;
-            font-size: 1.4rem;
-            font-weight: 700;
-            margin-bottom: 1.5rem;
-            display: flex;
-            align-items: center;
-            letter-spacing: 0.5px;
-        }
-        .summary-metrics {
-            display: grid;
-            grid-template-columns: repeat(4, 1fr);
-            gap: 2rem;
-        }
-        .metric-item {
-            text-align: center;
-        }
-        .metric-label {
-            color: #AAAAAA;
-            font-size: 0.95rem;
-            font-weight: 500;
-            margin-bottom: 0.5rem;
-            text-transform: uppercase;
-            letter-spacing: 1px;
-        }
-        .metric-value {
-            color: #FFFFFF;
-            font-size: 2.2rem;
-            font-weight: 800;
-            line-height: 1.2;
-        }
-        .metric-subvalue {
-            color: #999999;
-            font-size: 1.1rem;
-            font-weight: 500;
-            margin-top: 0.25rem;
-        }
-        </style>
-        """, unsafe_allow_html=True)
-        
-        # Portfolio Overview Box
-        st.markdown("""
-        <div class='summary-box'>
-            <div class='summary-title'>📁 Portfolio Overview</div>
-            <div class='summary-metrics'>
-                <div class='metric-item'>
-                    <div class='metric-label'>Active Loans</div>
-                    <div class='metric-value'>{}</div>
-                </div>
-                <div class='metric-item'>
-                    <div class='metric-label'>Closed Loans</div>
-                    <div class='metric-value'>{}</div>
-                </div>
-                <div class='metric-item'>
-                    <div class='metric-label'>Not Started</div>
-                    <div class='metric-value'>{}</div>
-                </div>
-                <div class='metric-item'>
-                    <div class='metric-label'>Total Loans</div>
-                    <div class='metric-value'>{}</div>
-                </div>
-            </div>
-        </div>
-        """.format(len(active_loans), len(closed_loans), len(not_started_loans), len(loans_df)), 
-        unsafe_allow_html=True)
-        
-        # Active Loans Summary Box
-        if len(active_loans) > 0:
-            # Calculate weighted average interest rate (excluding opportunity fund)
-            # Filter out loans with unusually high interest rates (>30%)
-            reasonable_rate_loans = active_loans[active_loans['Annual Interest Rate'] <= 0.30].copy()
-            if len(reasonable_rate_loans) > 0:
-                reasonable_rate_loans['Weighted_Rate'] = reasonable_rate_loans['Original Loan Balance'] * reasonable_rate_loans['Annual Interest Rate']
-                weighted_avg_rate = reasonable_rate_loans['Weighted_Rate'].sum() / reasonable_rate_loans['Original Loan Balance'].sum()
-            else:
-                weighted_avg_rate = 0
-            
-            # Count amortizing vs interest only loans
-            amortizing_loans = len(active_loans[~active_loans['Is Interest Only']])
-            interest_only_loans = len(active_loans[active_loans['Is Interest Only']])
-            
-            # Calculate average maturity and average age
-            today = pd.Timestamp.now()
-            active_loans['Maturity Date'] = pd.to_datetime(active_loans['Maturity Date'])
-            active_loans['Loan Start Date'] = pd.to_datetime(active_loans['Loan Start Date'])
-            
-            # Average maturity calculation
-            valid_maturities = active_loans[active_loans['Maturity Date'] > today]['Maturity Date']
-            if len(valid_maturities) > 0:
-                avg_months_to_maturity = (valid_maturities - today).dt.days.mean() / 30.44
-                avg_years_to_maturity = avg_months_to_maturity / 12
-            else:
-                avg_months_to_maturity = 0
-                avg_years_to_maturity = 0
-            
-            # Average age calculation - calculate months since loan start
-            valid_start_dates = active_loans[active_loans['Loan Start Date'] <= today]['Loan Start Date']
-            if len(valid_start_dates) > 0:
-                # Calculate months since start for each loan using proper date arithmetic
-                months_since_start_list = []
-                for start_date in valid_start_dates:
-                    if pd.notna(start_date):
-                        # Calculate the difference in days and convert to months
-                        days_diff = (today - start_date).days
-                        months_diff = days_diff / 30.44  # Average days per month
-                        months_since_start_list.append(months_diff)
-                
-                if months_since_start_list:
-                    avg_months_since_start = sum(months_since_start_list) / len(months_since_start_list)
-                    avg_years_since_start = avg_months_since_start / 12
-                else:
-                    avg_months_since_start = 0
-                    avg_years_since_start = 0
-            else:
-                avg_months_since_start = 0
-                avg_years_since_start = 0
-            
-            # Create the HTML with all values pre-formatted
-            active_loans_html = f"""
-            <div class='summary-box'>
-                <div class='summary-title'>💰 Active Loans Summary</div>
-                <div class='summary-metrics'>
-                    <div class='metric-item'>
-                        <div class='metric-label'>Original Balance</div>
-                        <div class='metric-value'>{format_currency(active_orig_balance)}</div>
-                    </div>
-                    <div class='metric-item'>
-                        <div class='metric-label'>Current Balance</div>
-                        <div class='metric-value'>{format_currency(active_current_balance)}</div>
-                    </div>
-                    <div class='metric-item'>
-                        <div class='metric-label'>Avg Interest Rate</div>
-                        <div class='metric-value'>{format_percent(weighted_avg_rate)}</div>
-                        <div class='metric-subvalue' style='color: #888888; font-size: 0.9rem;'>(excl. high-rate loans)</div>
-                    </div>
-                    <div class='metric-item'>
-                        <div class='metric-label'>Avg Maturity</div>
-                        <div class='metric-value'>{avg_years_to_maturity:.1f} yrs</div>
-                        <div class='metric-subvalue'>({avg_months_to_maturity:.0f} months)</div>
-                    </div>
-                </div>
-                <div style='margin-top: 2rem; padding-top: 2rem; border-top: 1px solid #3d3d3d;'>
-                    <div class='summary-metrics' style='grid-template-columns: repeat(3, 1fr);'>
-                        <div class='metric-item'>
-                            <div class='metric-label'>Amortizing Loans</div>
-                            <div class='metric-value' style='font-size: 1.8rem;'>{amortizing_loans}</div>
-                        </div>
-                        <div class='metric-item'>
-                            <div class='metric-label'>Interest Only</div>
-                            <div class='metric-value' style='font-size: 1.8rem;'>{interest_only_loans}</div>
-                        </div>
-                        <div class='metric-item'>
-                            <div class='metric-label'>Average Loan Age</div>
-                            <div class='metric-value' style='font-size: 1.8rem;'>{avg_years_since_start:.1f} yrs</div>
-                            <div class='metric-subvalue'>({avg_months_since_start:.0f} months)</div>
-                        </div>
-                    </div>
-                </div>
-            </div>
-            """
-            
-            st.markdown(active_loans_html, unsafe_allow_html=True)
-        else:
-            st.markdown("""
-            <div class='summary-box'>
-                <div class='summary-title'>💰 Active Loans Summary</div>
-                <div style='text-align: center; color: #999999; padding: 3rem; font-size: 1.2rem;'>
-                    No active loans in portfolio
-                </div>
-            </div>
-            """, unsafe_allow_html=True)
-        
-        # Historical Performance Box
-        st.markdown("""
-        <div class='summary-box'>
-            <div class='summary-title'>📈 Historical Performance</div>
-            <div style='display: grid; grid-template-columns: repeat(3, 1fr); gap: 2rem;'>
-                <div class='metric-item'>
-                    <div class='metric-label'>Principal Repaid</div>
-                    <div class='metric-value'>{}</div>
-                </div>
-                <div class='metric-item'>
-                    <div class='metric-label'>Interest Earned</div>
-                    <div class='metric-value'>{}</div>
-                </div>
-                <div class='metric-item'>
-                    <div class='metric-label'>Total Collections</div>
-                    <div class='metric-value'>{}</div>
-                </div>
-            </div>
-        </div>
-        """.format(
-            format_currency(total_repaid_principal),
-            format_currency(total_repaid_interest),
-            format_currency(total_collected)
-        ), unsafe_allow_html=True)
+        today = pd.Timestamp.now()
+        loan_summary = portfolio_summary(loans_df, today)
+        render_portfolio_summary(loan_summary)
         
         # Active Loans Breakdown
         if len(active_loans) > 0:
@@ -989,8 +849,7 @@ if master_file:
                 st.markdown("**Loan Size Distribution**")
                 size_bins = [0, 100000, 250000, 500000, 1000000, float('inf')]
                 size_labels = ['< $100K', '$100K-$250K', '$250K-$500K', '$500K-$1M', '> $1M']
-                active_loans['Size_Category'] = pd.cut(active_loans['Current Loan Balance'], bins=size_bins, labels=size_labels)
-                size_dist = active_loans['Size_Category'].value_counts().sort_index()
+                size_dist = pd.cut(active_loans['Current Loan Balance'], bins=size_bins, labels=size_labels).value_counts().sort_index()
                 
                 for category, count in size_dist.items():
                     st.markdown(f"<div style='display: flex; justify-content: space-between; padding: 0.25rem 0; border-bottom: 1px solid #3d3d3d;'>"
@@ -1003,8 +862,7 @@ if master_file:
                 st.markdown("**Interest Rate Distribution**")
                 rate_bins = [0, 0.05, 0.075, 0.10, 0.125, float('inf')]
                 rate_labels = ['< 5%', '5%-7.5%', '7.5%-10%', '10%-12.5%', '> 12.5%']
-                active_loans['Rate_Category'] = pd.cut(active_loans['Annual Interest Rate'], bins=rate_bins, labels=rate_labels)
-                rate_dist = active_loans['Rate_Category'].value_counts().sort_index()
+                rate_dist = pd.cut(active_loans['Annual Interest Rate'], bins=rate_bins, labels=rate_labels).value_counts().sort_index()
                 
                 for category, count in rate_dist.items():
                     st.markdown(f"<div style='display: flex; justify-content: space-between; padding: 0.25rem 0; border-bottom: 1px solid #3d3d3d;'>"
@@ -1015,11 +873,10 @@ if master_file:
             with col3:
                 # Maturity distribution
                 st.markdown("**Maturity Distribution**")
-                active_loans['Months_to_Maturity'] = (active_loans['Maturity Date'] - today).dt.days / 30.44
+                months_to_maturity = (active_loans['Maturity Date'] - today).dt.days / 30.44
                 maturity_bins = [0, 6, 12, 24, 36, float('inf')]
                 maturity_labels = ['< 6 months', '6-12 months', '1-2 years', '2-3 years', '> 3 years']
-                active_loans['Maturity_Category'] = pd.cut(active_loans['Months_to_Maturity'], bins=maturity_bins, labels=maturity_labels)
-                maturity_dist = active_loans['Maturity_Category'].value_counts().sort_index()
+                maturity_dist = pd.cut(months_to_maturity, bins=maturity_bins, labels=maturity_labels).value_counts().sort_index()
                 
                 for category, count in maturity_dist.items():
                     if pd.notna(count):
@@ -1031,79 +888,278 @@ if master_file:
         # Display active loans table
         st.markdown("<h2 style='color: #FDB813; margin-top: 2rem;'>💰 Active Loans Detail</h2>", unsafe_allow_html=True)
         
-        display_columns = ['Sheet', 'Borrower', 'Original Loan Balance', 'Current Loan Balance', 
-                          'Total Principal Repaid', 'Total Interest Repaid', 'Last Payment Amount',
-                          'Annual Interest Rate', 'Loan Start Date', 'Maturity Date', 'Notes']
+        st.dataframe(loan_display_frame(active_loans), use_container_width=True, hide_index=True)
         
-        active_display = active_loans[display_columns].copy()
+        # Show one loan's schedule at a time; only the selected loan is formatted (and cached)
+        if st.checkbox("Show loan details", key="active_details") and len(active_loans) > 0:
+            sheet_names = active_loans['Sheet'].astype(str)
+            detail_labels = dict(zip(sheet_names, '📋 ' + active_loans['Borrower'].astype(str) + ' - ' + sheet_names))
+            detail_sheet = st.selectbox("Loan (type to search)", list(detail_labels), format_func=detail_labels.get,
+                                        key="active_detail_loan")
+            if detail_sheet in loan_schedules:
+                with metrics.cached('Loan detail format', rows=len(loan_schedules[detail_sheet])):
+                    detail_df = loan_detail_frame(loan_schedules[detail_sheet])
+                st.dataframe(detail_df, use_container_width=True, hide_index=True)
+            else:
+                st.info("No amortization schedule was found on this sheet.")
         
-        # Format columns for display
-        for col in ['Original Loan Balance', 'Current Loan Balance', 'Total Principal Repaid', 
-                   'Total Interest Repaid', 'Last Payment Amount']:
-            active_display[col] = active_display[col].apply(format_currency)
+        # Display closed loans
+        if len(closed_loans) > 0:
+            st.markdown("<h2 style='color: #FDB813; margin-top: 2rem;'>✅ Closed Loans</h2>", unsafe_allow_html=True)
+            
+            st.dataframe(loan_display_frame(closed_loans), use_container_width=True, hide_index=True)
         
-        active_display['Annual Interest Rate'] = active_display['Annual Interest Rate'].apply(format_percent)
-        active_display['Loan Start Date'] = pd.to_datetime(active_display['Loan Start Date']).dt.strftime('%Y-%m-%d')
-        active_display['Maturity Date'] = pd.to_datetime(active_display['Maturity Date']).dt.strftime('%Y-%m-%d')
+        # Display not started loans
+        if len(not_started_loans) > 0:
+            st.markdown("<h2 style='color: #FDB813; margin-top: 2rem;'>🕒 Not Started Loans</h2>", unsafe_allow_html=True)
+            
+            st.dataframe(loan_display_frame(not_started_loans), use_container_width=True, hide_index=True)
         
-        st.dataframe(active_display, use_container_width=True, hide_index=True)
+        # Schedule analytics are measured at the Dashboard as-of date (today if it is missing)
+        analysis_as_of = as_of_date if pd.notna(as_of_date) else pd.Timestamp.now()
         
-        # Show loan details in expanders
-        if st.checkbox("Show loan details", key="active_details"):
-            for _, loan in active_loans.iterrows():
-                borrower = loan['Borrower']
-                with st.expander(f"📋 {borrower} - {loan['Sheet']}"):
-                    if borrower in loan_details:
-                        detail_df = loan_details[borrower].copy()
-                        
-                        # Format detail columns
-                        for col in ['Opening Balance', 'Loan Repayment', 'Interest Charged', 
-                                   'Capital Repaid', 'Closing Balance', 'Amount Paid']:
-                            if col in detail_df.columns:
-                                detail_df[col] = detail_df[col].apply(format_currency)
-                        
-                        # Format dates
-                        if 'Month' in detail_df.columns:
-                            detail_df['Month'] = pd.to_datetime(detail_df['Month']).dt.strftime('%Y-%m-%d')
-                        if 'Payment Date' in detail_df.columns:
-                            detail_df['Payment Date'] = pd.to_datetime(detail_df['Payment Date']).dt.strftime('%Y-%m-%d')
-                        
-                        if 'Notes' in detail_df.columns:
-                            detail_df['Notes'] = detail_df['Notes'].fillna('')
-                        
-                        st.dataframe(detail_df, use_container_width=True, hide_index=True)
+        # Delinquency and payment shortfall aging
+        with metrics.cached('Delinquency', rows=len(schedule_df)):
+            loan_delinquency, delinquency_rows = delinquency_section(master_token, analysis_as_of, schedule_df, loans_df)
+        active_delinquency = loan_delinquency[loan_delinquency['Status'] == 'Active']
         
-        # Display closed loans
-        if len(closed_loans) > 0:
-            st.markdown("<h2 style='color: #FDB813; margin-top: 2rem;'>✅ Closed Loans</h2>", unsafe_allow_html=True)
+        if len(active_delinquency) > 0:
+            st.markdown("<h2 style='color: #FDB813; margin-top: 2rem;'>⏰ Delinquency & Aging</h2>", unsafe_allow_html=True)
+            st.caption(f"Scheduled repayments vs. amounts paid as of {analysis_as_of.strftime('%B %d, %Y')}")
             
-            closed_display = closed_loans[display_columns].copy()
+            aging_summary = summarize_delinquency(active_delinquency)
+            aging_cols = st.columns(len(AGING_BUCKETS))
+            for i, bucket in enumerate(AGING_BUCKETS):
+                bucket_row = aging_summary[aging_summary['Aging Bucket'] == bucket].iloc[0]
+                with aging_cols[i]:
+                    st.metric(bucket, f"{bucket_row['Loans']} loans", 
+                             delta=f"{format_currency(bucket_row['Shortfall'])} short" if bucket_row['Shortfall'] > 0 else None,
+                             delta_color="inverse")
             
-            for col in ['Original Loan Balance', 'Current Loan Balance', 'Total Principal Repaid', 
-                       'Total Interest Repaid', 'Last Payment Amount']:
-                closed_display[col] = closed_display[col].apply(format_currency)
+            untracked_count = int((active_delinquency['Aging Bucket'] == 'No Payment Data').sum())
+            if untracked_count:
+                st.info(f"{untracked_count} active loans have no recorded payments (column K/J) and are excluded from aging")
             
-            closed_display['Annual Interest Rate'] = closed_display['Annual Interest Rate'].apply(format_percent)
-            closed_display['Loan Start Date'] = pd.to_datetime(closed_display['Loan Start Date']).dt.strftime('%Y-%m-%d')
-            closed_display['Maturity Date'] = pd.to_datetime(closed_display['Maturity Date']).dt.strftime('%Y-%m-%d')
+            delinquent = active_delinquency[active_delinquency['Days Past Due'] > 0].sort_values('Days Past Due', ascending=False)
+            if len(delinquent) > 0:
+                delinquent_display = delinquent[['Sheet', 'Borrower', 'Aging Bucket', 'Days Past Due', 'Missed Installments',
+                                                 'Shortfall', 'Scheduled To Date', 'Paid To Date', 'Current Loan Balance']].copy()
+                for col in ['Shortfall', 'Scheduled To Date', 'Paid To Date', 'Current Loan Balance']:
+                    delinquent_display[col] = delinquent_display[col].apply(format_currency)
+                st.dataframe(delinquent_display, use_container_width=True, hide_index=True)
+            else:
+                st.success("No active loans are past due")
             
-            st.dataframe(closed_display, use_container_width=True, hide_index=True)
+            with st.expander("🔎 Delinquency drill-down by loan"):
+                drill_options = active_delinquency['Sheet'] + ' - ' + active_delinquency['Borrower'].astype(str)
+                drill_choice = st.selectbox("Loan", drill_options.tolist(), key="delinquency_drilldown")
+                drill_sheet = drill_choice.split(' - ', 1)[0]
+                drill_df = delinquency_rows[delinquency_rows['Sheet'] == drill_sheet][
+                    ['Row', 'Month', 'Loan Repayment', 'Payment Date', 'Amount Paid', 'Days Late',
+                     'Cumulative Scheduled', 'Cumulative Paid', 'Unpaid']].copy()
+                for col in ['Loan Repayment', 'Amount Paid', 'Cumulative Scheduled', 'Cumulative Paid']:
+                    drill_df[col] = drill_df[col].apply(format_currency)
+                drill_df['Month'] = drill_df['Month'].dt.strftime('%Y-%m-%d')
+                drill_df['Payment Date'] = drill_df['Payment Date'].dt.strftime('%Y-%m-%d')
+                st.dataframe(drill_df, use_container_width=True, hide_index=True)
         
-        # Display not started loans
-        if len(not_started_loans) > 0:
-            st.markdown("<h2 style='color: #FDB813; margin-top: 2rem;'>🕒 Not Started Loans</h2>", unsafe_allow_html=True)
+        # Returns: realized and projected IRR per loan/policy and portfolio roll-ups from one batched XIRR solve
+        with metrics.cached('IRR solve', rows=len(schedule_df)):
+            loan_irr, policy_irr, portfolio_irr = irr_section(
+                master_token, ls_token, analysis_as_of, schedule_df, loans_df,
+                ls_data['policies'] if ls_data else None, premium_stream(ls_data) if ls_data else None
+            )
+        portfolio_irr = portfolio_irr.set_index('Portfolio')['IRR']
+        
+        st.markdown("<h2 style='color: #FDB813; margin-top: 2rem;'>📐 Returns (IRR)</h2>", unsafe_allow_html=True)
+        irr_labels = [label for label in ['Loans (Realized)', 'Loans (Projected)', 'LS Policies (Projected)', 'Total Book (Projected)']
+                      if label in portfolio_irr.index]
+        irr_cols = st.columns(len(irr_labels))
+        for i, label in enumerate(irr_labels):
+            irr_value = portfolio_irr[label]
+            irr_cols[i].metric(label, format_percent(irr_value) if pd.notna(irr_value) else "N/A")
+        st.caption("Realized IRR uses payments to date plus the current balance at par; projected IRR adds the remaining "
+                   "scheduled repayments. Loans without recorded payments are assumed to have paid on schedule.")
+        
+        with st.expander("📋 IRR by loan"):
+            loan_irr_display = loan_irr[loan_irr['Status'] != 'Not Started'].sort_values('Projected IRR', ascending=False).copy()
+            for col in ['Realized IRR', 'Projected IRR']:
+                loan_irr_display[col] = loan_irr_display[col].apply(lambda x: format_percent(x) if pd.notna(x) else "N/A")
+            st.dataframe(loan_irr_display, use_container_width=True, hide_index=True)
+        
+        # Concentration limits: top borrowers and Herfindahl index, plus loan and policy exposure by band
+        with metrics.cached('Concentration', rows=len(loans_df)):
+            borrower_exposure, loan_buckets, policy_buckets, limit_checks = concentration_section(
+                master_token, ls_token, analysis_as_of, loans_df, ls_data['policies'] if ls_data else None
+            )
+        
+        if len(limit_checks) > 0:
+            st.markdown("<h2 style='color: #FDB813; margin-top: 2rem;'>🎯 Concentration & Exposure</h2>", unsafe_allow_html=True)
+            breaches = limit_checks[limit_checks['Breach']]
+            if len(breaches) > 0:
+                st.error(f"{len(breaches)} concentration limit(s) breached: " +
+                         ", ".join(f"{book} {measure}" for book, measure in zip(breaches['Book'], breaches['Measure'])))
+            else:
+                st.success("All concentration measures are within their limits")
             
-            not_started_display = not_started_loans[display_columns].copy()
+            limits_display = limit_checks.copy()
+            is_hhi = limits_display['Measure'] == 'Herfindahl index'
+            # The Herfindahl index is shown in points (sum of squared percentage shares, 10,000 = one borrower)
+            for col in ['Value', 'Limit']:
+                limits_display[col] = [f"{value * 10000:,.0f}" if hhi else format_percent(value)
+                                       if pd.notna(value) else "—" for value, hhi in zip(limits_display[col], is_hhi)]
+            st.dataframe(limits_display.style.apply(highlight_breach, axis=1), use_container_width=True, hide_index=True)
+            st.caption(f"Loan shares are of the active outstanding balance ({format_currency(borrower_exposure['Current Loan Balance'].sum())}); "
+                       f"maturity bands count whole months from {analysis_as_of.strftime('%B %d, %Y')}. "
+                       f"Band limits apply to the largest band of each dimension.")
             
-            for col in ['Original Loan Balance', 'Current Loan Balance', 'Total Principal Repaid', 
-                       'Total Interest Repaid', 'Last Payment Amount']:
-                not_started_display[col] = not_started_display[col].apply(format_currency)
+            with st.expander("📋 Exposure by borrower and band"):
+                borrower_display = borrower_exposure.copy()
+                borrower_display['Current Loan Balance'] = borrower_display['Current Loan Balance'].apply(format_currency)
+                for col in ['Share', 'Cumulative Share']:
+                    borrower_display[col] = borrower_display[col].apply(format_percent)
+                st.dataframe(borrower_display, use_container_width=True, hide_index=True)
+                
+                bucket_tables = [(loan_buckets, ['Current Loan Balance'], ['Balance Share'])]
+                if policy_buckets is not None:
+                    bucket_tables.append((policy_buckets, ['NDB', 'Valuation'], ['NDB Share', 'Valuation Share']))
+                for buckets, currency_cols, share_cols in bucket_tables:
+                    buckets_display = buckets.copy()
+                    for col in currency_cols:
+                        buckets_display[col] = buckets_display[col].apply(format_currency)
+                    for col in share_cols:
+                        buckets_display[col] = buckets_display[col].apply(format_percent)
+                    st.dataframe(buckets_display, use_container_width=True, hide_index=True)
+        
+        # Vintage analysis: loans grouped by origination period, tracked by months on book
+        st.markdown("<h2 style='color: #FDB813; margin-top: 2rem;'>🧬 Vintage Analysis</h2>", unsafe_allow_html=True)
+        vintage_cols = st.columns(2)
+        with vintage_cols[0]:
+            vintage_period = st.radio("Vintage", list(VINTAGE_PERIODS), horizontal=True, key="vintage_period")
+        with vintage_cols[1]:
+            vintage_curve = st.selectbox("Curve", ['Outstanding %', 'Principal Repaid %', 'Cumulative Interest Earned',
+                                                   'Cumulative Collected', 'Delinquency Rate'], key="vintage_curve")
+        with metrics.cached('Vintage curves', rows=len(schedule_df)):
+            vintage_curves, vintage_summary = vintage_section(master_token, analysis_as_of, VINTAGE_PERIODS[vintage_period],
+                                                              schedule_df, loans_df)
+        
+        if len(vintage_curves) > 0:
+            st.line_chart(vintage_curves.pivot(index='Months On Book', columns='Vintage', values=vintage_curve),
+                          height=400, use_container_width=True)
+            st.caption(f"Months on book count from each loan's start month; only installments due by "
+                       f"{analysis_as_of.strftime('%B %d, %Y')} are used, and a vintage's curve ends where its youngest "
+                       f"loan is. Delinquency Rate is the share of a vintage's loans with a cumulative payment shortfall.")
+            
+            with st.expander("📋 Vintage summary"):
+                vintage_display = vintage_summary.copy()
+                for col in ['Original Loan Balance', 'Outstanding Balance', 'Cumulative Principal Repaid',
+                            'Cumulative Interest Earned', 'Cumulative Collected', 'Shortfall']:
+                    vintage_display[col] = vintage_display[col].apply(format_currency)
+                for col in ['Outstanding %', 'Principal Repaid %', 'Delinquency Rate']:
+                    vintage_display[col] = vintage_display[col].apply(lambda x: format_percent(x) if pd.notna(x) else "N/A")
+                st.dataframe(vintage_display, use_container_width=True, hide_index=True)
+        else:
+            st.info("No loan installments are due yet, so there are no vintage curves to show")
+        
+        # Book balance by month from every schedule; any month is read by position from the cached series
+        with metrics.cached('Balance series', rows=len(schedule_df)):
+            balance_series = balance_series_section(master_token, schedule_df, loans_df)
+        
+        if len(balance_series) > 0:
+            st.markdown("<h2 style='color: #FDB813; margin-top: 2rem;'>📉 Portfolio Balance</h2>", unsafe_allow_html=True)
+            # The slider's options are plain month labels (not Timestamps) so its state maps back to an option on
+            # every rerun; the chosen label's position is its month in the series
+            balance_months = list(balance_series.index)
+            month_labels = [month.strftime('%b %Y') for month in balance_months]
+            as_of_month = pd.Timestamp(analysis_as_of).to_period('M').to_timestamp()
+            default_month = min(max(as_of_month, balance_months[0]), balance_months[-1])
+            balance_label = st.select_slider("Month", options=month_labels, value=default_month.strftime('%b %Y'),
+                                             key="balance_month")
+            month_totals = balance_at(balance_series, balance_months[month_labels.index(balance_label)])
+            balance_cols = st.columns(4)
+            balance_cols[0].metric("Outstanding Principal", format_currency(month_totals['Outstanding Principal']))
+            balance_cols[1].metric("Scheduled Repayment", format_currency(month_totals['Scheduled Repayment']))
+            balance_cols[2].metric("Scheduled Interest", format_currency(month_totals['Scheduled Interest']))
+            balance_cols[3].metric("Cumulative Collections", format_currency(month_totals['Cumulative Collections']))
+            st.line_chart(balance_series[['Outstanding Principal', 'Cumulative Collections']], height=400, use_container_width=True)
+            st.caption(f"Scheduled balances from {balance_months[0].strftime('%b %Y')} through final maturity in "
+                       f"{balance_months[-1].strftime('%b %Y')}. Loans count from their start month, and collections "
+                       f"are recorded payments by payment month.")
+        
+        # Trends across saved snapshots (one per as-of date), joined on sheet / Policy_ID
+        history = history_snapshots(list_snapshots())
+        if len(history) >= 2:
+            with metrics.cached('Portfolio history', rows=len(history)):
+                loan_deltas, policy_deltas, trends = load_portfolio_history(history)
+            view_as_of = as_of_date if pd.notna(as_of_date) and as_of_date in trends.index else trends.index.max()
+            view_trend = trends.loc[view_as_of]
             
-            not_started_display['Annual Interest Rate'] = not_started_display['Annual Interest Rate'].apply(format_percent)
-            not_started_display['Loan Start Date'] = pd.to_datetime(not_started_display['Loan Start Date']).dt.strftime('%Y-%m-%d')
-            not_started_display['Maturity Date'] = pd.to_datetime(not_started_display['Maturity Date']).dt.strftime('%Y-%m-%d')
+            st.markdown("<h2 style='color: #FDB813; margin-top: 2rem;'>🗓️ Portfolio History</h2>", unsafe_allow_html=True)
+            st.caption(f"{len(history)} snapshots from {trends.index.min().strftime('%b %Y')} to "
+                       f"{trends.index.max().strftime('%b %Y')}. Changes are against the preceding snapshot.")
             
-            st.dataframe(not_started_display, use_container_width=True, hide_index=True)
+            history_metrics = [('Loan Balance', 'Δ Loan Balance'), ('Collections', None),
+                               ('LS Valuation', 'Δ LS Valuation'), ('LS Gain/(Loss)', 'Δ LS Gain/(Loss)')]
+            history_metrics = [(label, delta) for label, delta in history_metrics if label in trends]
+            history_cols = st.columns(len(history_metrics))
+            for i, (label, delta_col) in enumerate(history_metrics):
+                delta_value = view_trend[delta_col] if delta_col else None
+                history_cols[i].metric(label, format_currency(view_trend[label]) if pd.notna(view_trend[label]) else "N/A",
+                                       delta=format_currency(delta_value) if delta_value is not None and pd.notna(delta_value) else None)
+            
+            trend_chart = trends[[col for col in ['Loan Balance', 'LS Valuation'] if col in trends]]
+            trend_chart.index = trend_chart.index.strftime('%Y-%m')
+            st.line_chart(trend_chart, height=350, use_container_width=True)
+            
+            with st.expander(f"📋 Loan changes since the prior snapshot ({view_as_of.strftime('%b %d, %Y')})"):
+                loan_changes = loan_deltas[loan_deltas['As Of'] == view_as_of][
+                    ['Sheet', 'Borrower', 'Status', 'Current Loan Balance', 'Δ Current Loan Balance', 'Δ Total Collected']
+                ].rename(columns={'Δ Total Collected': 'Collections'})
+                loan_changes = loan_changes.sort_values('Δ Current Loan Balance', key=lambda s: s.abs(), ascending=False)
+                for col in ['Current Loan Balance', 'Δ Current Loan Balance', 'Collections']:
+                    loan_changes[col] = loan_changes[col].apply(lambda x: format_currency(x) if pd.notna(x) else "New")
+                st.dataframe(loan_changes, use_container_width=True, hide_index=True)
+            
+            with st.expander("🔍 Recorded payments by snapshot"):
+                # Plain labels as options (mapped back by position) so the widget state matches an option on rerun
+                history_sheets = loan_changes['Sheet'].astype(str).tolist()
+                history_labels = [f"{sheet} - {borrower}" for sheet, borrower in zip(history_sheets, loan_changes['Borrower'])]
+                history_label = st.selectbox("Loan", options=history_labels, key="history_drilldown")
+                history_sheet = history_sheets[history_labels.index(history_label)]
+                # Reads only this loan's rows from the memory-mapped schedules of the last 12 snapshots
+                payment_history = loan_schedule_history(history[-12:], history_sheet, columns=('Amount Paid',))
+                if len(payment_history) > 0:
+                    payment_table = payment_history.pivot_table(index='Month', columns='As Of', values='Amount Paid', aggfunc='last')
+                    payment_table.index = pd.to_datetime(payment_table.index).strftime('%b %Y')
+                    payment_table.columns = [f"As of {col.strftime('%b %Y')}" for col in payment_table.columns]
+                    st.dataframe(payment_table.applymap(lambda x: format_currency(x) if pd.notna(x) else "-"),
+                                 use_container_width=True)
+                else:
+                    st.info("No amortization rows recorded for this loan in the saved snapshots")
+            
+            if policy_deltas is not None:
+                with st.expander(f"📋 Policy valuation changes since the prior snapshot ({view_as_of.strftime('%b %d, %Y')})"):
+                    policy_changes = policy_deltas[policy_deltas['As Of'] == view_as_of][
+                        ['Policy_ID', 'Name', 'NDB', 'Valuation', 'Δ Valuation', 'Gain/(Loss)', 'Δ Gain/(Loss)']
+                    ]
+                    policy_changes = policy_changes.sort_values('Δ Valuation', key=lambda s: s.abs(), ascending=False)
+                    for col in ['NDB', 'Valuation', 'Δ Valuation', 'Gain/(Loss)', 'Δ Gain/(Loss)']:
+                        policy_changes[col] = policy_changes[col].apply(lambda x: format_currency(x) if pd.notna(x) else "New")
+                    st.dataframe(policy_changes, use_container_width=True, hide_index=True)
+                
+                with st.expander("🔍 Premium stream by snapshot"):
+                    history_policy = st.selectbox("Policy", options=policy_changes['Policy_ID'].tolist(),
+                                                  key="history_policy_drilldown")
+                    # Reads only this policy's row from the memory-mapped premium matrices of the last 12 snapshots
+                    policy_premium_history = premium_history(history[-12:], history_policy)
+                    if len(policy_premium_history) > 0:
+                        premium_table = policy_premium_history.pivot_table(index='Month', columns='As Of', values='Premium',
+                                                                           aggfunc='last', sort=False)
+                        premium_table.columns = [f"As of {col.strftime('%b %Y')}" for col in premium_table.columns]
+                        st.dataframe(premium_table.applymap(lambda x: format_currency(x) if pd.notna(x) else "-"),
+                                     use_container_width=True)
+                    else:
+                        st.info("No premium stream recorded for this policy in the saved snapshots")
         
         # Cash flow analysis with historical and forward-looking views
         st.markdown("<h2 style='color: #FDB813; margin-top: 2rem;'>💸 Cash Flow Analysis</h2>", unsafe_allow_html=True)
@@ -1119,58 +1175,19 @@ if master_file:
         today = datetime.now()
         
         # Collect all cashflow data (both historical and forward)
-        all_cashflow_data = []
-        
-        for borrower, amort_df in loan_details.items():
-            if borrower in not_started_loans['Borrower'].values:
-                continue
-                
-            if 'Month' in amort_df.columns and 'Loan Repayment' in amort_df.columns:
-                amort_df['Month'] = pd.to_datetime(amort_df['Month'])
-                
-                # Get historical data (past 3 months)
-                historical = amort_df[(amort_df['Month'] <= today) & 
-                                     (amort_df['Month'] >= today - relativedelta(months=3))]
-                
-                # Get forward-looking data (next 12 months)
-                upcoming = amort_df[(amort_df['Month'] > today) & 
-                                  (amort_df['Month'] <= today + relativedelta(months=12))]
-                
-                # Add historical data
-                for _, row in historical.iterrows():
-                    all_cashflow_data.append({
-                        'Borrower': borrower,
-                        'Payment Date': row['Month'],
-                        'Payment Amount': row['Loan Repayment'],
-                        'Interest': row.get('Interest Charged', 0),
-                        'Principal': row.get('Capital Repaid', 0),
-                        'Type': 'Historical'
-                    })
-                
-                # Add forward-looking data
-                for _, row in upcoming.iterrows():
-                    all_cashflow_data.append({
-                        'Borrower': borrower,
-                        'Payment Date': row['Month'],
-                        'Payment Amount': row['Loan Repayment'],
-                        'Interest': row.get('Interest Charged', 0),
-                        'Principal': row.get('Capital Repaid', 0),
-                        'Type': 'Forward-Looking'
-                    })
+        with metrics.cached('Cashflow aggregation') as cashflow_record:
+            all_cashflow_df = cashflow_section(master_token, today.date(), loan_details, set(not_started_loans['Borrower']), today)
+            cashflow_record['rows'] = len(all_cashflow_df)
         
         # Filter data based on selected view
-        if all_cashflow_data:
-            all_cashflow_df = pd.DataFrame(all_cashflow_data)
-            
-            if view_option == "Forward-Looking (Next 12 Months)":
-                cashflow_data = [d for d in all_cashflow_data if d['Type'] == 'Forward-Looking']
-            elif view_option == "Historical (Past 3 Months)":
-                cashflow_data = [d for d in all_cashflow_data if d['Type'] == 'Historical']
-            else:  # Both Views
-                cashflow_data = all_cashflow_data
+        if view_option == "Forward-Looking (Next 12 Months)":
+            cashflow_df = all_cashflow_df[all_cashflow_df['Type'] == 'Forward-Looking']
+        elif view_option == "Historical (Past 3 Months)":
+            cashflow_df = all_cashflow_df[all_cashflow_df['Type'] == 'Historical']
+        else:  # Both Views
+            cashflow_df = all_cashflow_df
         
-        if cashflow_data:
-            cashflow_df = pd.DataFrame(cashflow_data)
+        if not cashflow_df.empty:
             cashflow_df = cashflow_df.sort_values('Payment Date')
             
             # Create a pivot table for month-over-month view by borrower
@@ -1210,6 +1227,7 @@ if master_file:
                 display_summary = monthly_summary.copy()
                 
                 # Create HTML table with highlighting
+                render_start = time.perf_counter()
                 table_html = "<div style='background-color: #2d2d2d; padding: 1rem; border-radius: 8px;'>"
                 table_html += "<table style='width: 100%; color: white;'>"
                 table_html += "<thead><tr style='border-bottom: 2px solid #FDB813;'>"
@@ -1244,6 +1262,7 @@ if master_file:
                 
                 table_html += "</tbody></table></div>"
                 st.markdown(table_html, unsafe_allow_html=True)
+                metrics.add_stage('Cashflow table HTML', render_start, rows=len(display_summary))
                 
                 # Add notes
                 if view_option == "Both Views":
@@ -1284,8 +1303,45 @@ if master_file:
         else:
             st.info("No upcoming payments in the next 12 months")
 
+        # Prepayment and default stress on the forward-looking loan cashflows
+        if st.checkbox("🌪️ Run prepayment & default stress scenarios", key="run_stress"):
+            stress_col1, stress_col2, stress_col3 = st.columns(3)
+            with stress_col1:
+                n_scenarios = st.slider("Scenarios", min_value=50, max_value=1000, value=250, step=50, key="stress_scenarios")
+                stress_horizon = st.slider("Horizon (months)", min_value=6, max_value=120, value=12, step=6, key="stress_horizon")
+            with stress_col2:
+                cpr_range = st.slider("CPR range (%)", min_value=0, max_value=60, value=(0, 30), key="stress_cpr")
+                cdr_range = st.slider("CDR range (%)", min_value=0, max_value=30, value=(0, 10), key="stress_cdr")
+            with stress_col3:
+                severity_range = st.slider("Loss severity range (%)", min_value=0, max_value=100, value=(20, 60), key="stress_severity")
+                lag_range = st.slider("Recovery lag (months)", min_value=0, max_value=24, value=(3, 12), key="stress_lag")
+            
+            with metrics.cached('Stress scenarios', rows=n_scenarios):
+                stress_result, base_result, stress_bands = stress_section(
+                    master_token, analysis_as_of, n_scenarios, stress_horizon, tuple(cpr_range), tuple(cdr_range),
+                    tuple(severity_range), tuple(lag_range), loans_df
+                )
+            st.line_chart(stress_bands[['No Stress', 'P95', 'P50', 'P5']], height=400, use_container_width=True)
+            
+            stress_totals = stress_result['collections'].sum(axis=1)
+            base_total = base_result['collections'].sum()
+            metric_cols = st.columns(4)
+            metric_cols[0].metric("No-Stress Total", format_currency(base_total))
+            metric_cols[1].metric("Median Total", format_currency(np.median(stress_totals)))
+            metric_cols[2].metric("5th Percentile Total", format_currency(np.percentile(stress_totals, 5)),
+                                  delta=format_currency(np.percentile(stress_totals, 5) - base_total), delta_color="normal")
+            metric_cols[3].metric("Expected Defaults", format_currency(stress_result['defaults'].sum(axis=1).mean()))
+            st.caption(f"{n_scenarios} scenarios × {stress_result['loan_count']} active loans × {stress_horizon} months, "
+                       f"run-off from current balances, rates and maturity dates")
+            
+            with st.expander("📊 Monthly stress percentiles"):
+                stress_display = stress_bands.reset_index()
+                for col in ['No Stress', 'P5', 'P50', 'P95', 'Mean']:
+                    stress_display[col] = stress_display[col].apply(format_currency)
+                st.dataframe(stress_display, use_container_width=True, hide_index=True)
+
         # Cashflow vs Premium Analysis (if both data sources are available)
-        if cashflow_data and ls_data and ls_data['monthly_premiums']:
+        if not cashflow_df.empty and ls_data and ls_data['monthly_premiums']:
             st.markdown("<h2 style='color: #FDB813; margin-top: 3rem;'>📈 Cashflow vs Premium Analysis</h2>", unsafe_allow_html=True)
             
             try:
@@ -1297,21 +1353,11 @@ if master_file:
                 premium_amounts = []
                 
                 for month_str, amount in ls_data['monthly_premiums'].items():
-                    try:
-                        # Parse month string (assuming format like "Jul-25", "Aug-25", etc.)
-                        if '-' in month_str:
-                            month_parts = month_str.split('-')
-                            month_name = month_parts[0]
-                            year = '20' + month_parts[1] if len(month_parts[1]) == 2 else month_parts[1]
-                            
-                            # Convert to datetime
-                            month_date = pd.to_datetime(f"{month_name} {year}", format='%b %Y')
-                            month_period = month_date.to_period('M')
-                            
-                            premium_months.append(month_period)
-                            premium_amounts.append(amount)
-                    except:
-                        continue
+                    # Parse month string (assuming format like "Jul-25", "Aug-25", etc.)
+                    month_period = parse_premium_month(month_str)
+                    if month_period is not None:
+                        premium_months.append(month_period)
+                        premium_amounts.append(amount)
                 
                 # Create premium series
                 premium_series = pd.Series(premium_amounts, index=premium_months)
@@ -1346,6 +1392,19 @@ if master_file:
                         # Create a larger line chart that fills the available space
                         chart_data = comparison_df.set_index('Month')[['Loan Cashflows', 'LS Premiums', 'Net Cash Flow']]
                         
+                        # Add mortality confidence bands on the net flow when the simulation is switched on
+                        if st.session_state.get('run_mortality'):
+                            settings = mortality_settings()
+                            with metrics.cached('Mortality simulation', rows=len(ls_data['policies'])):
+                                mortality_bands, _ = run_mortality_simulation(
+                                    ls_data['policies'][['NDB', 'Remaining_LE', 'Annual_Premium']],
+                                    mortality_start_month(ls_data, analysis_as_of),
+                                    settings['mortality_paths'], settings['mortality_horizon'], settings['mortality_seed']
+                                )
+                            net_inflow = mortality_bands.reindex(chart_data.index).fillna(0)
+                            for p in (5, 50, 95):
+                                chart_data[f'Net incl. Mortality P{p}'] = chart_data['Net Cash Flow'] + net_inflow[f'Net LS Inflow P{p}']
+                        
                         # Use container with custom height
                         chart_container = st.container()
                         with chart_container:
@@ -1541,11 +1600,57 @@ if master_file:
                 st.markdown("<h3 style='color: #FDB813; margin-top: 2rem; font-size: 1.4rem;'>💵 Monthly Premium Projections</h3>", unsafe_allow_html=True)
                 st.info("⚠️ Premium Stream sheet not found - monthly premium projections are not available for this file.")
             
+            # Projected IRR per policy (cost basis today, premiums to expected maturity, NDB at expected maturity)
+            if len(policy_irr) > 0:
+                with st.expander("📐 Projected IRR by policy"):
+                    policy_irr_display = ls_data['policies'][['Policy_ID', 'Name', 'Cost_Basis', 'NDB', 'Remaining_LE']].merge(
+                        policy_irr, on='Policy_ID', how='inner').sort_values('Projected IRR', ascending=False)
+                    policy_irr_display['Cost_Basis'] = policy_irr_display['Cost_Basis'].apply(format_currency)
+                    policy_irr_display['NDB'] = policy_irr_display['NDB'].apply(format_currency)
+                    policy_irr_display['Projected IRR'] = policy_irr_display['Projected IRR'].apply(lambda x: format_percent(x) if pd.notna(x) else "N/A")
+                    st.dataframe(policy_irr_display, use_container_width=True, hide_index=True)
+            
+            # Monte Carlo mortality simulation calibrated to each policy's remaining LE
+            st.markdown("<h3 style='color: #FDB813; margin-top: 2rem; font-size: 1.4rem;'>🎲 Mortality Simulation</h3>", unsafe_allow_html=True)
+            if st.checkbox("Run Monte Carlo mortality simulation", key="run_mortality"):
+                mc_col1, mc_col2, mc_col3 = st.columns(3)
+                with mc_col1:
+                    st.select_slider("Simulated paths", options=[1000, 5000, 10000, 50000, 100000, 200000],
+                                     value=MORTALITY_DEFAULTS['mortality_paths'], key="mortality_paths")
+                with mc_col2:
+                    st.slider("Horizon (months)", min_value=12, max_value=120, step=12,
+                              value=MORTALITY_DEFAULTS['mortality_horizon'], key="mortality_horizon")
+                with mc_col3:
+                    st.number_input("Random seed", min_value=0, value=MORTALITY_DEFAULTS['mortality_seed'], step=1, key="mortality_seed")
+                
+                settings = mortality_settings()
+                mortality_start = mortality_start_month(ls_data, analysis_as_of)
+                with metrics.cached('Mortality simulation', rows=len(ls_data['policies'])):
+                    mortality_bands, mortality_totals = run_mortality_simulation(
+                        ls_data['policies'][['NDB', 'Remaining_LE', 'Annual_Premium']],
+                        mortality_start, settings['mortality_paths'], settings['mortality_horizon'], settings['mortality_seed']
+                    )
+                
+                st.line_chart(mortality_bands[['Death Benefits P95', 'Death Benefits P50', 'Death Benefits Mean',
+                                               'Death Benefits P5', 'Premiums Avoided Mean']],
+                              height=400, use_container_width=True)
+                
+                mc_metrics = st.columns(4)
+                mc_metrics[0].metric("Expected Maturities", f"{mortality_totals['Expected Deaths']:.1f}")
+                mc_metrics[1].metric("Death Benefits (P50)", format_currency(mortality_totals['Death Benefits'][1]))
+                mc_metrics[2].metric("Death Benefits (P5 – P95)",
+                                     f"{format_currency(mortality_totals['Death Benefits'][0])} – {format_currency(mortality_totals['Death Benefits'][2])}")
+                mc_metrics[3].metric("Premiums Avoided (P50)", format_currency(mortality_totals['Premiums Avoided'][1]))
+                st.caption(f"{settings['mortality_paths']:,} paths × {mortality_totals['Policies']} policies with remaining LE, "
+                           f"{settings['mortality_horizon']} months from {mortality_start}. Gompertz mortality calibrated to each "
+                           f"policy's remaining LE; the bands also feed the Cashflow vs Premium chart.")
+            
             # Policy Details Table with Inline Filtering and Sorting
             st.markdown("<h3 style='color: #FFFFFF; margin-top: 2rem; font-size: 1.4rem;'>📋 Policy Details</h3>", unsafe_allow_html=True)
             
-            if ls_data['policies']:
-                policies_df = pd.DataFrame(ls_data['policies'])
+            if len(ls_data['policies']) > 0:
+                # The parsed frame may be shared with other sessions; add columns to a copy
+                policies_df = ls_data['policies'].copy()
                 
                 # Calculate unrealized gain/loss for each policy
                 policies_df['Unrealized_Gain_Loss'] = policies_df['Valuation'] - policies_df['Cost_Basis']
@@ -1674,6 +1779,7 @@ if master_file:
                             st.rerun()
                 
                 # Apply filters
+                filter_start = time.perf_counter()
                 filtered_df = policies_df.copy()
                 
                 # Search filter
@@ -1719,6 +1825,7 @@ if master_file:
                     st.session_state.policy_sort['column'], 
                     ascending=st.session_state.policy_sort['ascending']
                 )
+                metrics.add_stage('Policy filter/sort', filter_start, rows=len(policies_df))
                 
                 # Display filter summary
                 total_policies = len(policies_df)
@@ -1763,6 +1870,7 @@ if master_file:
                     show_all_rows = st.checkbox("Show all rows", value=False, key="show_all_rows")
                 
                 # Create display dataframe with formatted values
+                render_start = time.perf_counter()
                 display_df = pd.DataFrame()
                 display_df['Policy ID'] = filtered_df['Policy_ID']
                 display_df['Name'] = filtered_df['Name']
@@ -1900,6 +2008,7 @@ if master_file:
                         f'</div>',
                         unsafe_allow_html=True
                     )
+                    metrics.add_stage('Policy table HTML', render_start, rows=len(display_df))
                 else:
                     st.warning("🔍 No policies match the current filter criteria. Please adjust your filters.")
                 
@@ -1944,6 +2053,23 @@ else:
     </div>
     """, unsafe_allow_html=True)
     
+    # Reopen previously parsed portfolios without re-reading the workbooks
+    saved_snapshots = list_snapshots()
+    if saved_snapshots:
+        latest = saved_snapshots[0]
+        snap_col1, snap_col2, snap_col3 = st.columns([1, 2, 1])
+        with snap_col2:
+            if st.button(f"📦 Open latest snapshot ({latest['key']})", key="open_latest_snapshot", use_container_width=True):
+                st.session_state['snapshot_path'] = latest['path']
+                st.rerun()
+            
+            with st.expander(f"Saved snapshots ({len(saved_snapshots)})"):
+                snapshot_keys = [m['key'] for m in saved_snapshots]
+                chosen_key = st.selectbox("Snapshot", options=snapshot_keys, key="snapshot_choice")
+                if st.button("Open snapshot", key="open_snapshot"):
+                    st.session_state['snapshot_path'] = saved_snapshots[snapshot_keys.index(chosen_key)]['path']
+                    st.rerun()
+    
     # Show expected file structure
     with st.expander("📋 Expected Excel File Structure"):
         st.markdown("""
@@ -1990,4 +2116,32 @@ st.markdown("""
 <div style='margin-top: 3rem; padding-top: 2rem; border-top: 1px solid #3d3d3d; text-align: center; color: #666666;'>
     <p>Sirocco Partners - Portfolio Management System</p>
 </div>
-""", unsafe_allow_html=True)
\ No newline at end of file
+""", unsafe_allow_html=True)
+
+# Diagnostics: where this rerun spent its time and memory (the landing page records no stages and is skipped)
+if metrics.stages:
+    memory_rows = session_memory(globals())
+    for name, nbytes in memory_rows:
+        metrics.record_memory(name, nbytes)
+    try:
+        write_metrics(metrics)
+    except (OSError, TypeError, ValueError) as e:
+        # The log is diagnostics only; a failed write must not take the page down
+        st.sidebar.warning(f"⚠️ Could not write rerun metrics: {str(e)}")
+    with st.sidebar.expander("⏱️ Diagnostics"):
+        stages_df = pd.DataFrame(metrics.stages).rename(columns={'stage': 'Stage', 'rows': 'Rows'})
+        stages_df['Rows'] = stages_df['Rows'].astype('Int64')
+        slowest = stages_df.loc[stages_df['ms'].idxmax()]
+        st.caption(f"Rerun took {metrics.total_ms:,.0f} ms; slowest stage: {slowest['Stage']} ({slowest['ms']:,.0f} ms)")
+        st.dataframe(stages_df.round({'ms': 1}), use_container_width=True, hide_index=True)
+        shared = dataset_cache().stats()
+        st.caption(f"Shared datasets: {shared['entries']} cached ({shared['leased']} in use), "
+                   f"{shared['bytes'] / 1024 / 1024:,.1f} of {shared['max_bytes'] / 1024 / 1024:,.0f} MB; "
+                   f"{shared['hits']} hits, {shared['misses']} misses, {shared['evictions']} evictions")
+        if metrics.cache:
+            cache_df = pd.DataFrame([{'Cache': name, 'Hits': counts['hits'], 'Misses': counts['misses']}
+                                     for name, counts in metrics.cache.items()])
+            st.dataframe(cache_df, use_container_width=True, hide_index=True)
+        memory_df = pd.DataFrame(memory_rows, columns=['Memory', 'MB'])
+        memory_df['MB'] = (memory_df['MB'] / 1024 / 1024).round(2)
+        st.dataframe(memory_df, use_container_width=True, hide_index=True)